@@ -0,0 +1,308 @@
+"""
+Пакетная обработка видео без веб-сервера.
+
+Запуск из каталога backend:
+
+    python -m batch videos/ "more/*.mp4" --output batch_output --workers 4
+
+Видео раздаются пулу процессов; каждый процесс один раз загружает стек
+SLAM (OpenCV, orbslam3) и обрабатывает свои видео по очереди, по одному
+OrbslamMonoRunner на видео. Для каждого видео пишутся:
+
+- <имя>.npz — траектория: frames (N), poses (N×4×4), map_ids (N, -1 — нет),
+  tracked_points (N), только кадры с трекингом;
+- <имя>.ply — накопленная карта точек (binary little endian, float32 xyz);
+
+и общий summary.json с производительностью и качеством трекинга.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from log import configure_logging, get_logger
+
+
+logger = get_logger("batch")
+
+VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v'}
+# Кадр с меньшим числом точек считается потерей трекинга (как в start_processing)
+MIN_TRACKED_POINTS = 15
+_NO_MAP = -1
+
+
+def collect_videos(inputs: List[str]) -> List[Path]:
+    """Каталоги (без рекурсии), glob-шаблоны и отдельные файлы → список видео без повторов."""
+    videos: Dict[Path, None] = {}
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = sorted(path.iterdir())
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = [Path(match) for match in sorted(glob.glob(item, recursive=True))]
+        for candidate in candidates:
+            if candidate.is_file() and candidate.suffix.lower() in VIDEO_EXTENSIONS:
+                videos[candidate.resolve()] = None
+    return list(videos)
+
+
+def output_names(videos: List[Path]) -> List[str]:
+    """Имена выходных файлов по имени видео; одинаковые имена из разных каталогов нумеруются."""
+    names: List[str] = []
+    seen: Dict[str, int] = {}
+    for video in videos:
+        count = seen.get(video.stem, 0)
+        seen[video.stem] = count + 1
+        names.append(video.stem if count == 0 else f"{video.stem}_{count}")
+    return names
+
+
+def write_ply(path: Path, points: np.ndarray) -> None:
+    """Облако точек N×3 в binary PLY."""
+    points = np.ascontiguousarray(points, dtype='<f4').reshape(-1, 3)
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(points)}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        "end_header\n"
+    )
+    with open(path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        f.write(points.tobytes())
+
+
+def _warm_vocabulary() -> None:
+    """
+    Прочитать словарь ORB-SLAM3 один раз до запуска пула: процессы парсят
+    его каждый в своём System, но читают уже из page cache, а не с диска.
+    """
+    from lib.orb_slam.orb_slam import VOCAB_DIR
+    vocab = VOCAB_DIR / 'ORBvoc.txt'
+    if not vocab.exists():
+        return
+    with open(vocab, 'rb') as f:
+        while f.read(16 * 1024 * 1024):
+            pass
+
+
+def _init_worker() -> None:
+    configure_logging()
+    from services.runtime_service import load_slam_stack
+    load_slam_stack()
+
+
+def process_video(video_path: str, output_dir: str, name: str, max_frames: Optional[int] = None,
+                  frame_gate: Optional[Dict[str, Any]] = None,
+                  feature_budget: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Обрабатывает одно видео в текущем процессе и пишет <name>.npz и <name>.ply.
+
+    Args:
+        frame_gate: Параметры FrameGate (пропуск почти неподвижных кадров) или None
+        feature_budget: Параметры FeatureBudget (адаптивный бюджет ORB-признаков) или None
+
+    Returns:
+        Строка сводки по видео
+    """
+    from services.lod_service import VoxelPointCloud
+    from services.processing_service import _generate_temp_config
+    from services.runtime_service import load_slam_stack
+
+    slam_stack = load_slam_stack()
+    cv2 = slam_stack.cv2
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {video_path}")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+
+    config_path = _generate_temp_config(width, height, fps, f"batch_{os.getpid()}_{name}")
+    if not config_path:
+        raise RuntimeError("Failed to generate temporary config file")
+
+    frames: List[int] = []
+    poses: List[np.ndarray] = []
+    map_ids: List[int] = []
+    tracked_counts: List[int] = []
+    point_map = VoxelPointCloud()
+    runner = None
+    start = time.perf_counter()
+    try:
+        runner = slam_stack.OrbslamMonoRunner(config_path, frame_gate=frame_gate, feature_budget=feature_budget)
+        runner.open_video(video_path)
+        while max_frames is None or runner.frame_idx < max_frames:
+            ret, info = runner.process_frame()
+            if not ret:
+                break
+            if not info or info['points'] is None:
+                continue
+            point_map.add(info['points'])
+            if info['pose'] is None or len(info['points']) < MIN_TRACKED_POINTS:
+                continue
+            frames.append(info['frame'])
+            poses.append(np.array(info['pose'], dtype=np.float32))
+            map_ids.append(_NO_MAP if info.get('map_id') is None else info['map_id'])
+            tracked_counts.append(len(info['points']))
+        processed = runner.frame_idx
+        skipped = runner.skipped_frames
+        orb_features = runner.orb_features
+        # Слитые карты уходят из атласа: различных id на траектории может быть больше
+        live_maps = runner.num_maps
+    finally:
+        if runner:
+            runner.stop()
+        try:
+            os.remove(config_path)
+        except OSError:
+            pass
+    seconds = time.perf_counter() - start
+
+    output = Path(output_dir)
+    np.savez_compressed(
+        output / f"{name}.npz",
+        frames=np.asarray(frames, dtype=np.int32),
+        poses=np.asarray(poses, dtype=np.float32).reshape(-1, 4, 4),
+        map_ids=np.asarray(map_ids, dtype=np.int32),
+        tracked_points=np.asarray(tracked_counts, dtype=np.int32),
+    )
+    write_ply(output / f"{name}.ply", point_map.points)
+
+    return {
+        'video': video_path,
+        'name': name,
+        'status': 'completed',
+        'width': width,
+        'height': height,
+        'frames': processed,
+        'skipped_frames': skipped,
+        # Кадры, пропущенные FrameGate, в SLAM не подавались и трекинг на них не считается
+        'slam_frames': processed - skipped,
+        'orb_features': orb_features,
+        'seconds': round(seconds, 3),
+        'fps': round(processed / seconds, 2) if seconds > 0 else None,
+        'tracked_frames': len(frames),
+        'tracked_ratio': round(len(frames) / (processed - skipped), 3) if processed > skipped else 0,
+        'first_tracked_frame': frames[0] if frames else None,
+        'mean_tracked_points': round(statistics.fmean(tracked_counts), 1) if tracked_counts else 0,
+        'maps': live_maps if live_maps is not None else len(set(map_ids) - {_NO_MAP}) or None,
+        'map_points': len(point_map),
+    }
+
+
+def run_batch(videos: List[Path], output_dir: str, workers: int,
+              max_frames: Optional[int] = None, frame_gate: Optional[Dict[str, Any]] = None,
+              feature_budget: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Обрабатывает видео пулом процессов и пишет summary.json."""
+    os.makedirs(output_dir, exist_ok=True)
+    _warm_vocabulary()
+
+    names = output_names(videos)
+    results: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    # spawn: процессам не достаются потоки OpenCV родителя
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(process_video, str(video), output_dir, name, max_frames, frame_gate,
+                        feature_budget): (video, name)
+            for video, name in zip(videos, names)
+        }
+        for future in as_completed(futures):
+            video, name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Упавший процесс (BrokenProcessPool) тоже попадает сюда
+                logger.error("Failed to process %s: %s", video, e)
+                result = {'video': str(video), 'name': name, 'status': 'failed', 'error': str(e)}
+            else:
+                logger.info("Processed %s: %d frames, %.0f%% tracked, %.1f fps", video, result['frames'],
+                            100 * result['tracked_ratio'], result['fps'] or 0)
+            results.append(result)
+    wall_seconds = time.perf_counter() - started
+
+    order = {name: index for index, name in enumerate(names)}
+    results.sort(key=lambda row: order[row['name']])
+    completed = [row for row in results if row['status'] == 'completed']
+    total_frames = sum(row['frames'] for row in completed)
+    slam_frames = sum(row['slam_frames'] for row in completed)
+    tracked_frames = sum(row['tracked_frames'] for row in completed)
+    summary = {
+        'videos': len(videos),
+        'completed': len(completed),
+        'failed': len(results) - len(completed),
+        'workers': workers,
+        'frames': total_frames,
+        'wall_seconds': round(wall_seconds, 3),
+        'fps': round(total_frames / wall_seconds, 2) if wall_seconds > 0 else None,
+        'slam_frames': slam_frames,
+        'tracked_ratio': round(tracked_frames / slam_frames, 3) if slam_frames else 0,
+        'results': results,
+    }
+    with open(Path(output_dir) / 'summary.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    print(f"{'video':<32} {'status':<10} {'frames':>7} {'fps':>8} {'tracked':>8} {'maps':>5} {'points':>8}")
+    for row in summary['results']:
+        if row['status'] == 'completed':
+            print(f"{row['name'][:32]:<32} {row['status']:<10} {row['frames']:>7} {row['fps'] or 0:>8.1f} "
+                  f"{100 * row['tracked_ratio']:>7.0f}% {row['maps'] or 0:>5} {row['map_points']:>8}")
+        else:
+            print(f"{row['name'][:32]:<32} {row['status']:<10} {row['error']}")
+    print(f"{summary['completed']}/{summary['videos']} videos, {summary['frames']} frames in "
+          f"{summary['wall_seconds']:.1f} s ({summary['fps'] or 0:.1f} fps with {summary['workers']} workers), "
+          f"{100 * summary['tracked_ratio']:.0f}% tracked")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Batch ORB-SLAM3 processing of video files")
+    parser.add_argument("inputs", nargs="+", help="Video files, directories or glob patterns")
+    parser.add_argument("--output", default="batch_output", help="Directory for .npz/.ply and summary.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--max-frames", type=int, default=None, help="Process at most this many frames per video")
+    parser.add_argument("--frame-gate", type=float, default=None, metavar="THRESHOLD",
+                        help="Skip near-static frames below this mean thumbnail difference (0..255)")
+    parser.add_argument("--frame-gate-max-skip", type=int, default=4, help="Never skip more frames in a row")
+    parser.add_argument("--adaptive-features", nargs=2, type=int, default=None, metavar=("LOW", "HIGH"),
+                        help="Adapt the ORB feature budget to keep tracked points between LOW and HIGH")
+    args = parser.parse_args()
+
+    configure_logging()
+    videos = collect_videos(args.inputs)
+    if not videos:
+        parser.error("no videos found")
+
+    frame_gate = None
+    if args.frame_gate is not None:
+        frame_gate = {'threshold': args.frame_gate, 'max_skip': args.frame_gate_max_skip}
+    feature_budget = None
+    if args.adaptive_features is not None:
+        feature_budget = {'target_low': args.adaptive_features[0], 'target_high': args.adaptive_features[1]}
+    summary = run_batch(videos, args.output, max(1, min(args.workers, len(videos))), args.max_frames,
+                        frame_gate, feature_budget)
+    print_summary(summary)
+    if summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Общие утилиты бенчмарков: подмена orbslam3 и видео, замеры памяти, отчёты."""
+import gc
+import importlib.util
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+
+
+def install_fake_orbslam3():
+    """
+    Регистрирует fake/orbslam3.py как модуль orbslam3 до импорта
+    lib.orb_slam.orb_slam, чтобы настоящая сборка из bin/ не подхватилась.
+    """
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+    spec = importlib.util.spec_from_file_location("orbslam3", BENCH_DIR / "fake" / "orbslam3.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules["orbslam3"] = module
+    return module
+
+
+class SyntheticCapture:
+    """
+    Замена cv2.VideoCapture: отдаёт один и тот же заранее созданный кадр,
+    чтобы бенчмарк мерил Python-часть, а не декодер.
+    """
+
+    def __init__(self, source, width: int = 640, height: int = 360, fps: float = 30.0, frames: int = 10000):
+        self.source = source
+        self._props = {}
+        self._width = width
+        self._height = height
+        self._fps = fps
+        self._frames = frames
+        self._position = 0
+        self._frame = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+    def isOpened(self) -> bool:
+        return True
+
+    def get(self, prop: int) -> float:
+        import cv2
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: float(self._width),
+            cv2.CAP_PROP_FRAME_HEIGHT: float(self._height),
+            cv2.CAP_PROP_FPS: self._fps,
+            cv2.CAP_PROP_FRAME_COUNT: float(self._frames),
+            cv2.CAP_PROP_POS_FRAMES: float(self._position),
+        }.get(prop, 0.0)
+
+    def set(self, prop: int, value: float) -> bool:
+        import cv2
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self._position = int(value)
+            return True
+        return False
+
+    def read(self):
+        if self._position >= self._frames:
+            return False, None
+        self._position += 1
+        return True, self._frame
+
+    def release(self) -> None:
+        pass
+
+
+def install_synthetic_capture(frames: int, width: int = 640, height: int = 360, fps: float = 30.0) -> None:
+    import cv2
+
+    def factory(source, *args, **kwargs):
+        return SyntheticCapture(source, width=width, height=height, fps=fps, frames=frames)
+
+    cv2.VideoCapture = factory
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (Linux /proc, иначе пиковый RSS из getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryProbe:
+    """Рост RSS и (опционально) Python-кучи между start() и stop()."""
+
+    def __init__(self, trace: bool = False):
+        self.trace = trace
+        self.rss_start = 0
+        self.traced_start = 0
+
+    def start(self) -> None:
+        gc.collect()
+        if self.trace:
+            tracemalloc.start()
+            self.traced_start = tracemalloc.get_traced_memory()[0]
+        self.rss_start = rss_bytes()
+
+    def stop(self) -> Dict[str, Optional[float]]:
+        gc.collect()
+        result = {
+            'rss_start_mb': self.rss_start / 2**20,
+            'rss_growth_mb': (rss_bytes() - self.rss_start) / 2**20,
+            'python_heap_growth_mb': None,
+            'python_heap_peak_mb': None,
+        }
+        if self.trace:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result['python_heap_growth_mb'] = (current - self.traced_start) / 2**20
+            result['python_heap_peak_mb'] = peak / 2**20
+        return result
+
+
+class Timer:
+    def __enter__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall_start
+        self.cpu = time.process_time() - self.cpu_start
+
+
+def environment_info() -> Dict[str, str]:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def print_report(name: str, result: Dict) -> None:
+    print(f"\n== {name} ==")
+    for key, value in result.items():
+        if isinstance(value, float):
+            print(f"  {key:<28} {value:,.3f}")
+        elif not isinstance(value, (dict, list)):
+            print(f"  {key:<28} {value}")
+
+    stages = result.get('stages')
+    if stages:
+        print(f"  {'stage':<24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'share':>7}")
+        for stage, summary in sorted(stages.items(), key=lambda item: -item[1]['total_ms']):
+            print(f"  {stage:<24} {summary['p50_ms']:>9.3f} {summary['p95_ms']:>9.3f} "
+                  f"{summary['p99_ms']:>9.3f} {summary['share']:>7.1%}")
+
+
+def write_json_report(path: str, results: Dict) -> None:
+    with open(path, "w") as f:
+        json.dump({'environment': environment_info(), 'results': results}, f, indent=2, default=str)
+    print(f"\nReport written to {path}")
@@ -0,0 +1,293 @@
+"""
+Подмена нативного модуля orbslam3 для бенчмарков без сборки C++.
+
+Повторяет Python-API биндинга (system, Sensor, TrackingState) и отдаёт
+синтетические или записанные позы/точки с настраиваемой задержкой на кадр.
+Настройка — через configure() или переменные окружения FAKE_ORBSLAM3_*.
+"""
+import enum
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+
+
+class Sensor(enum.IntEnum):
+    MONOCULAR = 0
+    STEREO = 1
+    RGBD = 2
+    IMU_MONOCULAR = 3
+    IMU_STEREO = 4
+    IMU_RGBD = 5
+
+
+class TrackingState(enum.IntEnum):
+    SYSTEM_NOT_READY = -1
+    NO_IMAGES_YET = 0
+    NOT_INITIALIZED = 1
+    OK = 2
+    RECENTLY_LOST = 3
+    LOST = 4
+    OK_KLT = 5
+
+
+class ColorFormat(enum.IntEnum):
+    AUTO = 0
+    GRAY = 1
+    BGR = 2
+    RGB = 3
+    BGRA = 4
+    I420 = 5
+    NV12 = 6
+    NV21 = 7
+    YUYV = 8
+
+
+_settings = {
+    # Задержка process_image_mono, имитирующая нативный трекинг
+    'latency_ms': float(os.environ.get("FAKE_ORBSLAM3_LATENCY_MS", "0")),
+    # Держать GIL на время задержки (как биндинг без gil_scoped_release): потоки не параллелятся
+    'hold_gil': os.environ.get("FAKE_ORBSLAM3_HOLD_GIL", "0") == "1",
+    # Сколько точек карты видно на кадре и сколько ключевых точек отдаётся
+    'tracked_points': int(os.environ.get("FAKE_ORBSLAM3_TRACKED_POINTS", "600")),
+    'keypoints': int(os.environ.get("FAKE_ORBSLAM3_KEYPOINTS", "1000")),
+    # Размер "мира" — общего облака, из которого берутся видимые точки
+    'world_points': int(os.environ.get("FAKE_ORBSLAM3_WORLD_POINTS", "200000")),
+    # Каждый N-й кадр трекинг теряется (0 — никогда)
+    'lost_every': int(os.environ.get("FAKE_ORBSLAM3_LOST_EVERY", "0")),
+    # Сколько кадров подряд длится каждая потеря
+    'lost_span': int(os.environ.get("FAKE_ORBSLAM3_LOST_SPAN", "1")),
+    # Потеря не короче стольких кадров начинает в атласе новую карту (как ORB-SLAM3)
+    'new_map_after_lost': int(os.environ.get("FAKE_ORBSLAM3_NEW_MAP_AFTER_LOST", "30")),
+    # Через сколько кадров новая карта сливается с первой (0 — никогда)
+    'merge_after': int(os.environ.get("FAKE_ORBSLAM3_MERGE_AFTER", "0")),
+    'seed': int(os.environ.get("FAKE_ORBSLAM3_SEED", "0")),
+    # .npz с записанными 'poses' (N×4×4), 'points' (M×3) и 'point_offsets' (N+1)
+    'replay': os.environ.get("FAKE_ORBSLAM3_REPLAY"),
+}
+
+
+def configure(**kwargs) -> None:
+    """Меняет параметры для систем, созданных после вызова."""
+    unknown = set(kwargs) - set(_settings)
+    if unknown:
+        raise TypeError(f"Unknown fake orbslam3 settings: {sorted(unknown)}")
+    _settings.update(kwargs)
+
+
+class _Synthetic:
+    """Камера на окружности внутри случайного облака точек."""
+
+    def __init__(self, settings: dict):
+        rng = np.random.default_rng(settings['seed'])
+        self.rng = rng
+        self.world = rng.uniform(-10.0, 10.0, (settings['world_points'], 3)).astype(np.float32)
+        self.tracked = settings['tracked_points']
+        self.keypoints = settings['keypoints']
+
+    def pose(self, frame: int) -> np.ndarray:
+        angle = frame * 0.01
+        pose = np.eye(4, dtype=np.float32)
+        pose[0, 0], pose[0, 2] = np.cos(angle), np.sin(angle)
+        pose[2, 0], pose[2, 2] = -np.sin(angle), np.cos(angle)
+        pose[:3, 3] = (5.0 * np.cos(angle), 0.1 * np.sin(frame * 0.05), 5.0 * np.sin(angle))
+        return pose
+
+    def points(self, frame: int) -> np.ndarray:
+        # Соседние кадры видят пересекающиеся окна облака, как реальная карта
+        start = (frame * (self.tracked // 10)) % max(1, len(self.world) - self.tracked)
+        return self.world[start:start + self.tracked]
+
+    def keypoints_2d(self, frame: int) -> np.ndarray:
+        return self.rng.uniform((0, 0), (1920, 1080), (self.keypoints, 2)).astype(np.float32)
+
+
+class _Replay:
+    """Проигрывание записанных поз и точек по кругу."""
+
+    def __init__(self, path: str, settings: dict):
+        recording = np.load(path)
+        self.poses = recording['poses'].astype(np.float32)
+        self.all_points = recording['points'].astype(np.float32)
+        self.offsets = recording['point_offsets']
+        self.rng = np.random.default_rng(settings['seed'])
+        self.keypoints = settings['keypoints']
+
+    def pose(self, frame: int) -> np.ndarray:
+        return self.poses[frame % len(self.poses)]
+
+    def points(self, frame: int) -> np.ndarray:
+        index = frame % len(self.poses)
+        return self.all_points[self.offsets[index]:self.offsets[index + 1]]
+
+    def keypoints_2d(self, frame: int) -> np.ndarray:
+        return self.rng.uniform((0, 0), (1920, 1080), (self.keypoints, 2)).astype(np.float32)
+
+
+def _read_setting(settings_file: str, key: str) -> Optional[str]:
+    try:
+        with open(settings_file, 'r') as f:
+            for line in f:
+                if line.startswith(f"{key}:"):
+                    return line.split(':', 1)[1].strip().strip('"')
+    except OSError:
+        pass
+    return None
+
+
+def _to_output(rows: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    """Как биндинг: копия в out и view на первые N строк, если out вмещает, иначе новый массив."""
+    if out is not None:
+        if out.dtype != np.float32 or not out.flags.c_contiguous or out.shape[1:] != rows.shape[1:]:
+            raise ValueError("out must be a C-contiguous float32 array with matching row shape")
+        if len(out) >= len(rows):
+            out[:len(rows)] = rows
+            return out[:len(rows)]
+    return np.array(rows, dtype=np.float32)
+
+
+class system:
+    def __init__(self, vocab_file: str, settings_file: str, sensor_type: Sensor):
+        self.vocab_file = vocab_file
+        self.settings_file = settings_file
+        self.sensor_type = sensor_type
+        self._settings = dict(_settings)
+        self._source = None
+        self._frame = -1
+        self._lost = False
+        self._lost_streak = 0
+        self._maps = [0]
+        self._map_id = 0
+        self._next_map_id = 1
+        self._frames_in_map = 0
+        self._trajectory: List[np.ndarray] = []
+        self._running = False
+        self._localization = False
+        # Параметры ORB-экстрактора; задержка и число точек пропорциональны бюджету признаков
+        self._orb = {
+            'n_features': int(_read_setting(settings_file, 'ORBextractor.nFeatures') or 1000),
+            'ini_th_fast': int(_read_setting(settings_file, 'ORBextractor.iniThFAST') or 20),
+            'min_th_fast': int(_read_setting(settings_file, 'ORBextractor.minThFAST') or 7),
+        }
+        self._initial_features = self._orb['n_features']
+
+    def _budget(self) -> float:
+        return self._orb['n_features'] / self._initial_features
+
+    def initialize(self) -> bool:
+        if self._settings['replay']:
+            self._source = _Replay(self._settings['replay'], self._settings)
+        else:
+            self._source = _Synthetic(self._settings)
+        self._running = True
+        return True
+
+    def set_use_viewer(self, use_viewer: bool) -> None:
+        pass
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def reset(self) -> None:
+        self._trajectory = []
+
+    def shutdown(self) -> None:
+        self._running = False
+        # Как ORB-SLAM3: System.SaveAtlasToFile в настройках — атлас пишется при завершении
+        save_path = _read_setting(self.settings_file, 'System.SaveAtlasToFile')
+        if save_path:
+            self.save_atlas(save_path)
+
+    def _track(self, image: Optional[np.ndarray]) -> bool:
+        if not self._running or image is None:
+            return False
+        latency = self._settings['latency_ms'] * self._budget()
+        if latency > 0:
+            if self._settings['hold_gil']:
+                deadline = time.perf_counter() + latency / 1000.0
+                while time.perf_counter() < deadline:
+                    pass
+            else:
+                # Как настоящий биндинг: GIL отпущен на время трекинга
+                time.sleep(latency / 1000.0)
+
+        self._frame += 1
+        lost_every = self._settings['lost_every']
+        self._lost = lost_every > 0 and self._frame % lost_every >= lost_every - self._settings['lost_span']
+        if self._lost:
+            self._lost_streak += 1
+            return False
+
+        if self._lost_streak >= self._settings['new_map_after_lost']:
+            # Как в атласе ORB-SLAM3: id карт не переиспользуются
+            self._map_id = self._next_map_id
+            self._next_map_id += 1
+            self._maps.append(self._map_id)
+            self._frames_in_map = 0
+        self._lost_streak = 0
+        self._frames_in_map += 1
+        merge_after = self._settings['merge_after']
+        if merge_after and self._map_id != self._maps[0] and self._frames_in_map == merge_after:
+            self._maps.remove(self._map_id)
+            self._map_id = self._maps[0]
+
+        self._trajectory.append(self._source.pose(self._frame))
+        return True
+
+    def process_image_mono(self, image: np.ndarray, time_stamp: float, color: ColorFormat = ColorFormat.AUTO) -> bool:
+        return self._track(image)
+
+    def process_image_stereo(self, left_image: np.ndarray, right_image: np.ndarray, time_stamp: float) -> bool:
+        return self._track(left_image)
+
+    def process_image_rgbd(self, image: np.ndarray, depth: np.ndarray, time_stamp: float) -> bool:
+        return self._track(image)
+
+    # Как и биндинг, геттеры возвращают непрерывные float32-массивы и принимают out
+    def get_trajectory(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        poses = np.asarray(self._trajectory, dtype=np.float32).reshape(-1, 4, 4)
+        return _to_output(poses, out)
+
+    def get_map_points(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.get_tracked_map_points(out)
+
+    def get_tracked_map_points(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        if self._lost or self._frame < 0:
+            return _to_output(np.empty((0, 3), dtype=np.float32), out)
+        points = self._source.points(self._frame)
+        return _to_output(points[:round(len(points) * min(1.0, self._budget()))], out)
+
+    def get_current_keypoints(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        if self._lost or self._frame < 0:
+            return _to_output(np.empty((0, 2), dtype=np.float32), out)
+        return _to_output(self._source.keypoints_2d(self._frame), out)
+
+    def get_num_map_points(self) -> int:
+        return len(self.get_tracked_map_points())
+
+    def get_current_map_id(self) -> int:
+        return self._map_id
+
+    def get_num_maps(self) -> int:
+        return len(self._maps)
+
+    def activate_localization_mode(self) -> None:
+        self._localization = True
+
+    def deactivate_localization_mode(self) -> None:
+        self._localization = False
+
+    def set_orb_parameters(self, n_features: int, ini_th_fast: int, min_th_fast: int) -> None:
+        if n_features <= 0 or min_th_fast <= 0 or ini_th_fast < min_th_fast:
+            raise ValueError("Expected nFeatures > 0 and iniThFAST >= minThFAST > 0")
+        self._orb = {'n_features': n_features, 'ini_th_fast': ini_th_fast, 'min_th_fast': min_th_fast}
+
+    def get_orb_parameters(self) -> dict:
+        return dict(self._orb)
+
+    def save_atlas(self, filename: str) -> bool:
+        # Как и биндинг, пишет <filename>.osa; вместо атласа — номер кадра
+        with open(f"{filename}.osa", 'w') as f:
+            f.write(str(self._frame))
+        return True
@@ -0,0 +1,393 @@
+"""
+Бенчмарки Python-части бэкенда без нативной сборки ORB-SLAM3.
+
+Запуск из каталога backend:
+
+    python -m benchmarks.run --frames 10000
+    python -m benchmarks.run --only processing --latency-ms 5 --trace-memory --json bench.json
+    python -m benchmarks.run --only threads --latency-ms 10 --frames 300 --max-jobs 8
+    python -m benchmarks.run --only soak --soak-jobs 50 --frames 500
+    python -m benchmarks.run --only soak --soak-jobs 20 --soak-video clip.mp4   # настоящий orbslam3
+
+orbslam3 подменяется benchmarks/fake/orbslam3.py, cv2.VideoCapture — синтетическим
+источником кадров, так что измеряются start_processing, ProcessingStore.update_data
+и SSE data_generator сами по себе.
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .common import (
+    MemoryProbe,
+    Timer,
+    install_fake_orbslam3,
+    install_synthetic_capture,
+    print_report,
+    rss_bytes,
+    write_json_report,
+)
+
+
+RSS_SAMPLE_INTERVAL = 0.5
+# Первые задачи soak-теста прогревают кеши и пулы аллокатора — в наклон роста не входят
+SOAK_WARMUP_JOBS = 2
+
+
+def _slope(values: List[float]) -> float:
+    """Наклон МНК-прямой через точки (i, values[i])."""
+    count = len(values)
+    if count < 2:
+        return 0.0
+    mean_x = (count - 1) / 2.0
+    mean_y = sum(values) / count
+    numerator = sum((i - mean_x) * (value - mean_y) for i, value in enumerate(values))
+    denominator = sum((i - mean_x) ** 2 for i in range(count))
+    return numerator / denominator
+
+
+async def bench_processing(frames: int, latency_ms: float, trace_memory: bool) -> Dict:
+    """Полный цикл start_processing на подменённых SLAM и видео."""
+    fake = install_fake_orbslam3()
+    fake.configure(latency_ms=latency_ms)
+    install_synthetic_capture(frames)
+
+    from store import get_store
+    from services.processing_service import start_processing
+
+    store = get_store()
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
+        video_path = f.name
+
+    processing = store.add(processing_type='video_processing', data={'video_path': video_path, 'status': 'queued'})
+    rss_series = []
+
+    async def sample_rss():
+        while True:
+            data = processing.data or {}
+            rss_series.append((data.get('processed_frames', 0), rss_bytes() / 2**20))
+            await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+    probe = MemoryProbe(trace=trace_memory)
+    probe.start()
+    sampler = asyncio.create_task(sample_rss())
+    try:
+        with Timer() as timer:
+            await start_processing(processing.id, video_path)
+    finally:
+        sampler.cancel()
+        os.remove(video_path)
+    memory = probe.stop()
+
+    processed = (processing.data or {}).get('processed_frames', 0)
+    native_time = latency_ms / 1000.0 * processed
+    result = {
+        'frames': processed,
+        'status': (processing.data or {}).get('status'),
+        'wall_s': timer.wall,
+        'cpu_s': timer.cpu,
+        'frames_per_s': processed / timer.wall if timer.wall > 0 else 0.0,
+        'python_overhead_ms_per_frame': (timer.wall - native_time) / processed * 1000.0 if processed else 0.0,
+        'map_points_total': (processing.data or {}).get('map_points_total', 0),
+        **memory,
+        'rss_series_mb': rss_series,
+    }
+    if processing.profile:
+        result['stages'] = processing.profile.report()['stages']
+    return result
+
+
+async def bench_threaded_jobs(frames: int, latency_ms: float, max_jobs: int, hold_gil: bool) -> Dict:
+    """
+    Несколько OrbslamMonoRunner в потоках пула (как start_processing при
+    SLAM_THREADED=1). Пока биндинг отпускает GIL, суммарная скорость растёт
+    почти линейно с числом задач; hold_gil=True — биндинг без отпускания GIL.
+    Параллельно меряется задержка event loop.
+    """
+    fake = install_fake_orbslam3()
+    fake.configure(latency_ms=latency_ms, hold_gil=hold_gil)
+    install_synthetic_capture(frames)
+
+    from services.runtime_service import load_slam_stack
+
+    runner_cls = load_slam_stack().OrbslamMonoRunner
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        config_path = f.name
+
+    def run_job(barrier: threading.Barrier):
+        runner = runner_cls(config_path)
+        runner.open_video("synthetic")
+        # Отсчёт — когда все задачи инициализированы
+        barrier.wait()
+        try:
+            while runner.process_frame()[0]:
+                pass
+            return runner.frame_idx, time.perf_counter()
+        finally:
+            runner.stop()
+
+    async def loop_lag(stop: asyncio.Event, samples: List[float]) -> None:
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            samples.append(time.perf_counter() - start - 0.005)
+
+    jobs_counts = sorted({1, *(2 ** i for i in range(1, max_jobs.bit_length())), max_jobs})
+    loop = asyncio.get_running_loop()
+    runs = []
+    try:
+        for jobs in jobs_counts:
+            started: List[float] = []
+            barrier = threading.Barrier(jobs, action=lambda: started.append(time.perf_counter()))
+            stop = asyncio.Event()
+            lag_samples: List[float] = []
+            lag_task = asyncio.create_task(loop_lag(stop, lag_samples))
+            # Свой пул: в пуле по умолчанию потоков может быть меньше, чем задач
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = await asyncio.gather(*(loop.run_in_executor(executor, run_job, barrier)
+                                                 for _ in range(jobs)))
+            stop.set()
+            await lag_task
+            wall = max(finished for _, finished in results) - started[0]
+            processed = sum(frames for frames, _ in results)
+            runs.append({
+                'jobs': jobs,
+                'frames_per_s': processed / wall if wall > 0 else 0.0,
+                'max_loop_lag_ms': max(lag_samples, default=0.0) * 1000.0,
+            })
+    finally:
+        os.remove(config_path)
+
+    single = runs[0]['frames_per_s']
+    result = {'hold_gil': hold_gil, 'latency_ms': latency_ms, 'frames_per_job': frames}
+    for run in runs:
+        jobs = run['jobs']
+        result[f'jobs_{jobs}_frames_per_s'] = run['frames_per_s']
+        result[f'jobs_{jobs}_scaling'] = run['frames_per_s'] / single / jobs if single else 0.0
+        result[f'jobs_{jobs}_max_loop_lag_ms'] = run['max_loop_lag_ms']
+    return result
+
+
+async def bench_soak(jobs: int, frames: int, latency_ms: float, video: Optional[str] = None) -> Dict:
+    """
+    N задач start_processing подряд в одном процессе: рост памяти от задачи
+    к задаче. Жизненный цикл тот же, что на сервере: start_processing сам
+    освобождает карту точек по завершении, после чего задача удаляется из
+    store, — оставшийся рост и есть утечка.
+
+    Без video — подменённые SLAM и видео (утечки Python-части); с video —
+    настоящий orbslam3 из lib/orb_slam/bin и нативная куча ORB-SLAM3.
+    """
+    if video is None:
+        fake = install_fake_orbslam3()
+        fake.configure(latency_ms=latency_ms)
+        install_synthetic_capture(frames)
+
+    from metrics import get_memory_tracker
+    from store import get_store
+    from services.processing_service import start_processing
+
+    store = get_store()
+    tracker = get_memory_tracker()
+    per_job = []
+    with Timer() as timer:
+        for index in range(jobs):
+            if video is None:
+                with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as f:
+                    video_path = f.name
+            else:
+                video_path = video
+            processing = store.add(processing_type='video_processing',
+                                   data={'video_path': video_path, 'status': 'queued'})
+            try:
+                await start_processing(processing.id, video_path)
+            finally:
+                if video is None:
+                    os.remove(video_path)
+
+            report = processing.memory.report() if processing.memory else {}
+            store.delete(processing.id)
+            del processing
+            gc.collect()
+            current = tracker.report(include_jobs=False)['current']
+            events = report.get('events', {})
+            per_job.append({
+                'job': index,
+                'rss_mb': current['rss_mb'],
+                'uss_mb': current['uss_mb'],
+                'native_heap_mb': current['native_heap_mb'],
+                'job_retained_rss_mb': (report.get('retained') or {}).get('rss_mb'),
+                'data_mb': report.get('data_mb'),
+                'runner_create_native_mb': events.get('runner_create', {}).get('native_heap_mb'),
+                'runner_stop_native_mb': events.get('runner_stop', {}).get('native_heap_mb'),
+            })
+            print(f"  job {index + 1}/{jobs}: rss {current['rss_mb']:.1f} MB")
+
+    steady = per_job[SOAK_WARMUP_JOBS:] if len(per_job) > SOAK_WARMUP_JOBS + 1 else per_job
+    result = {
+        'jobs': jobs,
+        'frames_per_job': frames if video is None else None,
+        'wall_s': timer.wall,
+        'rss_first_mb': per_job[0]['rss_mb'] if per_job else 0.0,
+        'rss_last_mb': per_job[-1]['rss_mb'] if per_job else 0.0,
+        'rss_growth_per_job_mb': _slope([row['rss_mb'] for row in steady]),
+    }
+    for key in ('uss_mb', 'native_heap_mb'):
+        if steady and steady[0][key] is not None:
+            result[f'{key[:-3]}_growth_per_job_mb'] = _slope([row[key] for row in steady])
+    result['per_job'] = per_job
+    return result
+
+
+def bench_store_update(frames: int) -> Dict:
+    """ProcessingStore.update_data с покадровой нагрузкой как в start_processing."""
+    import numpy as np
+    from store import create_store
+
+    store = create_store()
+    processing = store.add(processing_type='video_processing', data={'trajectory': []})
+    pose = np.eye(4).tolist()
+    tracked = [{'x': float(i), 'y': 0.0, 'z': 1.0} for i in range(500)]
+    keypoints = [{'x': float(i), 'y': float(i)} for i in range(200)]
+
+    probe = MemoryProbe()
+    probe.start()
+    with Timer() as timer:
+        for frame in range(frames):
+            store.update_data(processing.id, {
+                'processed_frames': frame + 1,
+                'status': 'processing',
+                'current_pose': pose,
+                'tracked_points_count': len(tracked),
+                'tracked_points': tracked,
+                'keypoints_2d': keypoints,
+            }, append={'trajectory': [{'frame': frame, 'pose': pose}]})
+    memory = probe.stop()
+
+    return {
+        'updates': frames,
+        'wall_s': timer.wall,
+        'updates_per_s': frames / timer.wall if timer.wall > 0 else 0.0,
+        'us_per_update': timer.wall / frames * 1e6 if frames else 0.0,
+        **memory,
+    }
+
+
+async def bench_sse(frames: int) -> Dict:
+    """
+    SSE data_generator: на каждом ожидании генератора продюсер публикует новый
+    кадр, поэтому замер показывает стоимость сборки и сериализации события.
+    """
+    install_fake_orbslam3()
+    import numpy as np
+    from store import get_store
+    from routes.processing_route import get_processing_data_stream
+
+    store = get_store()
+    pose = np.eye(4).tolist()
+    processing = store.add(processing_type='video_processing', data={
+        'status': 'processing',
+        'processed_frames': 0,
+        'total_frames': frames,
+        'trajectory': [],
+        'all_map_points': [{'x': float(i), 'y': 0.0, 'z': 1.0} for i in range(5000)],
+        'tracked_points': [{'x': float(i), 'y': 0.0, 'z': 1.0} for i in range(500)],
+        'keypoints_2d': [{'x': float(i), 'y': float(i)} for i in range(200)],
+    })
+
+    real_sleep = asyncio.sleep
+    produced = 0
+
+    async def producer_sleep(delay, result=None):
+        nonlocal produced
+        if produced < frames:
+            produced += 1
+            store.update_data(processing.id, {
+                'processed_frames': produced,
+                'current_pose': pose,
+                'status': 'processing' if produced < frames else 'completed',
+            }, append={'trajectory': [{'frame': produced, 'pose': pose}]})
+        return await real_sleep(0, result)
+
+    asyncio.sleep = producer_sleep
+    events = 0
+    total_bytes = 0
+    probe = MemoryProbe()
+    probe.start()
+    try:
+        response = await get_processing_data_stream(processing.id)
+        with Timer() as timer:
+            async for chunk in response.body_iterator:
+                events += 1
+                total_bytes += len(chunk)
+    finally:
+        asyncio.sleep = real_sleep
+    memory = probe.stop()
+
+    return {
+        'events': events,
+        'wall_s': timer.wall,
+        'events_per_s': events / timer.wall if timer.wall > 0 else 0.0,
+        'ms_per_event': timer.wall / events * 1000.0 if events else 0.0,
+        'avg_event_kb': total_bytes / events / 1024.0 if events else 0.0,
+        'total_mb': total_bytes / 2**20,
+        **memory,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backend benchmarks with a fake orbslam3 module")
+    parser.add_argument("--frames", type=int, default=10000, help="Frames per benchmark")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated native tracking latency per frame")
+    parser.add_argument("--only", choices=["processing", "store", "sse", "threads", "soak"], action="append",
+                        help="Run only selected benchmarks (repeatable)")
+    parser.add_argument("--sse-frames", type=int, default=2000, help="Events for the SSE benchmark")
+    parser.add_argument("--max-jobs", type=int, default=os.cpu_count() or 4,
+                        help="Largest number of concurrent jobs for the threads benchmark")
+    parser.add_argument("--hold-gil", action="store_true",
+                        help="Threads benchmark: simulate a binding that keeps the GIL during tracking")
+    parser.add_argument("--soak-jobs", type=int, default=20, help="Sequential jobs for the soak test")
+    parser.add_argument("--soak-video", help="Soak test on this video with the real orbslam3 module")
+    parser.add_argument("--trace-memory", action="store_true", help="Track Python heap with tracemalloc (slower)")
+    parser.add_argument("--json", help="Write a machine-readable report to this path")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    selected = set(args.only or ["processing", "store", "sse"])
+    results = {}
+
+    if "processing" in selected:
+        results['processing'] = asyncio.run(bench_processing(args.frames, args.latency_ms, args.trace_memory))
+        print_report("start_processing", results['processing'])
+    if "store" in selected:
+        results['store_update'] = bench_store_update(args.frames)
+        print_report("ProcessingStore.update_data", results['store_update'])
+    if "sse" in selected:
+        results['sse'] = asyncio.run(bench_sse(args.sse_frames))
+        print_report("SSE data_generator", results['sse'])
+
+    if "threads" in selected:
+        # Без задержки трекинга масштабироваться нечему — берём типичные 10 мс на кадр
+        latency_ms = args.latency_ms or 10.0
+        results['threaded_jobs'] = asyncio.run(
+            bench_threaded_jobs(min(args.frames, 1000), latency_ms, args.max_jobs, args.hold_gil))
+        print_report("OrbslamMonoRunner in threads", results['threaded_jobs'])
+
+    if "soak" in selected:
+        # Кадров на задачу немного: важен жизненный цикл SLAM, а не длина видео
+        results['soak'] = asyncio.run(
+            bench_soak(args.soak_jobs, min(args.frames, 1000), args.latency_ms, args.soak_video))
+        print_report("Sequential jobs (soak)", results['soak'])
+
+    if args.json:
+        write_json_report(args.json, results)
+
+
+if __name__ == "__main__":
+    main()
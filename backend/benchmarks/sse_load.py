@@ -0,0 +1,214 @@
+"""
+Нагрузочный тест раздачи SSE /api/processing/{id} на много зрителей.
+
+Запуск из каталога backend:
+
+    python -m benchmarks.sse_load --clients 50 --slow-clients 5 --json sse_load.json
+
+Поднимает benchmarks.sse_server в отдельном процессе, открывает N SSE-клиентов
+(часть — медленные, с паузой после каждого события), и меряет задержку
+"кадр опубликован → событие получено", CPU сервера на клиента и память
+на соединение. JSON-отчёт содержит git-ревизию для сравнения версий.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+import numpy as np
+
+from .common import BACKEND_DIR, environment_info
+
+
+CONNECT_SETTLE_S = 1.0
+BASELINE_S = 2.0
+
+
+def _proc_cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    # utime и stime — 14-е и 15-е поля, после имени процесса это индексы 11 и 12
+    return (int(fields[11]) + int(fields[12])) / ticks
+
+
+def _proc_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ClientStats:
+    def __init__(self, slow: bool):
+        self.slow = slow
+        self.events = 0
+        self.bytes = 0
+        self.received: Dict[int, float] = {}
+        self.error: Optional[str] = None
+
+
+async def run_client(session: aiohttp.ClientSession, url: str, stats: ClientStats, slow_delay: float) -> None:
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=None, sock_read=120)) as response:
+            buffer = b""
+            async for chunk in response.content.iter_any():
+                buffer += chunk
+                while b"\n\n" in buffer:
+                    event, buffer = buffer.split(b"\n\n", 1)
+                    received_at = time.time()
+                    stats.events += 1
+                    stats.bytes += len(event) + 2
+                    if not event.startswith(b"data: "):
+                        continue
+                    message = json.loads(event[6:])
+                    frame = message.get('processed_frames')
+                    if message.get('type') == 'update' and frame is not None:
+                        stats.received.setdefault(frame, received_at)
+                    if message.get('type') in ('complete', 'error'):
+                        return
+                    if stats.slow:
+                        await asyncio.sleep(slow_delay)
+    except Exception as e:
+        stats.error = repr(e)
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    array = np.array(values) * 1000.0
+    return {
+        'p50_ms': float(np.percentile(array, 50)),
+        'p95_ms': float(np.percentile(array, 95)),
+        'p99_ms': float(np.percentile(array, 99)),
+        'max_ms': float(array.max()),
+    }
+
+
+async def run_load(args) -> Dict:
+    base_url = f"http://{args.host}:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.sse_server",
+         "--host", args.host, "--port", str(args.port),
+         "--fps", str(args.fps), "--frames", str(args.frames),
+         "--map-points", str(args.map_points)],
+        cwd=BACKEND_DIR,
+    )
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            job_id = None
+            for _ in range(100):
+                try:
+                    async with session.get(f"{base_url}/bench/job") as response:
+                        job_id = (await response.json()).get('id')
+                    if job_id:
+                        break
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.1)
+            if not job_id:
+                raise RuntimeError("SSE server did not start")
+
+            # Базовая линия сервера без клиентов
+            rss_idle = _proc_rss_mb(server.pid)
+            cpu_idle_start = _proc_cpu_seconds(server.pid)
+            await asyncio.sleep(BASELINE_S)
+            idle_cpu_per_s = (_proc_cpu_seconds(server.pid) - cpu_idle_start) / BASELINE_S
+
+            url = f"{base_url}/api/processing/{job_id}"
+            clients = [ClientStats(slow=i < args.slow_clients) for i in range(args.clients)]
+            tasks = [asyncio.create_task(run_client(session, url, stats, args.slow_delay)) for stats in clients]
+            await asyncio.sleep(CONNECT_SETTLE_S)
+            rss_connected = _proc_rss_mb(server.pid)
+
+            cpu_start = _proc_cpu_seconds(server.pid)
+            started_at = time.time()
+            async with session.post(f"{base_url}/bench/start"):
+                pass
+            await asyncio.gather(*tasks)
+            duration = time.time() - started_at
+            cpu_used = _proc_cpu_seconds(server.pid) - cpu_start
+            rss_peak = _proc_rss_mb(server.pid)
+
+            async with session.get(f"{base_url}/bench/produced") as response:
+                produced = {int(k): v for k, v in (await response.json()).items()}
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    def latencies(group: List[ClientStats]) -> List[float]:
+        return [
+            received_at - produced[frame]
+            for stats in group
+            for frame, received_at in stats.received.items()
+            if frame in produced
+        ]
+
+    fast = [c for c in clients if not c.slow]
+    slow = [c for c in clients if c.slow]
+    cpu_for_clients = max(cpu_used - idle_cpu_per_s * duration, 0.0)
+
+    return {
+        'revision': _git_revision(),
+        'environment': environment_info(),
+        'parameters': {
+            'clients': args.clients,
+            'slow_clients': args.slow_clients,
+            'slow_delay_s': args.slow_delay,
+            'fps': args.fps,
+            'frames': args.frames,
+            'map_points': args.map_points,
+        },
+        'duration_s': duration,
+        'errors': sum(1 for c in clients if c.error),
+        'events_total': sum(c.events for c in clients),
+        'mb_sent_total': sum(c.bytes for c in clients) / 2**20,
+        'frames_seen_per_fast_client': float(np.mean([len(c.received) for c in fast])) if fast else 0.0,
+        'latency_fast': _percentiles(latencies(fast)),
+        'latency_slow': _percentiles(latencies(slow)),
+        'server_cpu_s': cpu_used,
+        'server_cpu_idle_per_s': idle_cpu_per_s,
+        'server_cpu_ms_per_client_per_s': cpu_for_clients / args.clients / duration * 1000.0 if args.clients else 0.0,
+        'server_rss_idle_mb': rss_idle,
+        'server_rss_peak_mb': rss_peak,
+        'server_rss_per_connection_kb': (rss_connected - rss_idle) / args.clients * 1024.0 if args.clients else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SSE fan-out load test")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--slow-clients", type=int, default=5, help="How many of the clients read slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="Pause after each event for slow clients, s")
+    parser.add_argument("--fps", type=float, default=30.0, help="Synthetic producer frame rate")
+    parser.add_argument("--frames", type=int, default=300, help="Frames produced before the job completes")
+    parser.add_argument("--map-points", type=int, default=5000, help="Size of all_map_points in each update")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", help="Write the report to this path")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args))
+
+    print(json.dumps({k: v for k, v in report.items() if k != 'environment'}, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Сервер для нагрузочного теста SSE: настоящий роутер /api/processing и
+синтетический продюсер, публикующий кадры задачи с заданной частотой.
+
+Запускается benchmarks.sse_load в отдельном процессе, чтобы CPU и память
+сервера мерились отдельно от клиентов.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import numpy as np
+
+from .common import install_fake_orbslam3
+
+
+def create_app(fps: float, frames: int, map_points: int):
+    install_fake_orbslam3()
+
+    from fastapi import FastAPI
+    from routes.processing_route import router as processing_router
+    from store import get_store
+
+    store = get_store()
+    state = {'job_id': None, 'produced': {}, 'started': False}
+
+    async def produce():
+        rng = np.random.default_rng(0)
+        processing = store.add(processing_type='video_processing', data={
+            'status': 'processing',
+            'processed_frames': 0,
+            'total_frames': frames,
+            'trajectory': [],
+        })
+        state['job_id'] = processing.id
+        # Ждём, пока клиенты подключатся
+        while not state['started']:
+            await asyncio.sleep(0.05)
+
+        cloud = rng.uniform(-10, 10, (map_points, 3)).tolist()
+        map_dicts = [{'x': x, 'y': y, 'z': z} for x, y, z in cloud]
+        keypoints = [{'x': float(x), 'y': float(y)} for x, y in rng.uniform(0, 1000, (200, 2))]
+        interval = 1.0 / fps
+
+        for frame in range(1, frames + 1):
+            pose = np.eye(4)
+            pose[:3, 3] = (frame * 0.01, 0.0, 0.0)
+            pose_list = pose.tolist()
+            store.update_data(processing.id, {
+                'processed_frames': frame,
+                'status': 'processing' if frame < frames else 'completed',
+                'current_pose': pose_list,
+                'tracked_points_count': 500,
+                'tracked_points': map_dicts[:500],
+                'keypoints_2d': keypoints,
+                'all_map_points': map_dicts,
+            }, append={'trajectory': [{'frame': frame, 'pose': pose_list}]})
+            state['produced'][frame] = time.time()
+            await asyncio.sleep(interval)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        producer = asyncio.create_task(produce())
+        yield
+        producer.cancel()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(processing_router, prefix="/api")
+
+    @app.get("/bench/job")
+    async def get_job():
+        return {'id': state['job_id']}
+
+    @app.post("/bench/start")
+    async def start():
+        state['started'] = True
+        return {'started': True}
+
+    @app.get("/bench/produced")
+    async def get_produced():
+        return state['produced']
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="SSE load-test server with a synthetic producer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--map-points", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    app = create_app(args.fps, args.frames, args.map_points)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Адаптивный бюджет ORB-признаков трекинга.
+
+ORBextractor.nFeatures в конфиге рассчитан на худший случай: в богатой
+текстуре трекингу хватает и половины признаков, а извлечение и
+сопоставление каждого стоит времени на каждом кадре. FeatureBudget
+держит число отслеживаемых точек карты в коридоре: выше коридора бюджет
+понемногу снижается, ниже — сразу растёт.
+
+Регулятор видит только кадры с трекингом в состоянии OK: при потере
+ORB-SLAM3 mono переинициализируется экстрактором mpIniORBextractor,
+которого бюджет не касается, и число точек там ничего не говорит о нём.
+"""
+from typing import Dict, Optional
+
+
+class FeatureBudget:
+    """
+    Регулятор nFeatures и порогов FAST по числу отслеживаемых точек.
+
+    Несимметричен, чтобы не раскачиваться и не терять трекинг:
+    - снижение — на step_down, только после patience кадров подряд выше target_high;
+    - рост — на step_up на первом же кадре ниже target_low;
+    - после изменения cooldown кадров не меняется (эффект виден не сразу).
+
+    Выше исходного бюджета пороги FAST снижаются (до половины исходных):
+    в бедной текстуре лишние признаки находятся только на менее
+    контрастных углах.
+    """
+
+    def __init__(
+        self,
+        n_features: int,
+        ini_th_fast: int,
+        min_th_fast: int,
+        target_low: int = 80,
+        target_high: int = 200,
+        min_features: int = 400,
+        max_features: Optional[int] = None,
+        step_down: float = 0.1,
+        step_up: float = 0.25,
+        patience: int = 30,
+        cooldown: int = 5,
+    ):
+        if target_low >= target_high:
+            raise ValueError("target_low must be below target_high")
+        self.base_features = n_features
+        self.base_ini_th_fast = ini_th_fast
+        self.base_min_th_fast = min_th_fast
+        self.target_low = target_low
+        self.target_high = target_high
+        self.min_features = min(min_features, n_features)
+        self.max_features = max(max_features or 2 * n_features, n_features)
+        self.step_down = step_down
+        self.step_up = step_up
+        self.patience = patience
+        self.cooldown = cooldown
+        self.n_features = n_features
+        # Сколько раз бюджет менялся
+        self.changes = 0
+        self._above = 0
+        self._wait = 0
+
+    @property
+    def parameters(self) -> Dict[str, int]:
+        """Текущие параметры в формате set_orb_parameters биндинга."""
+        scale = min(1.0, max(0.5, self.base_features / self.n_features))
+        min_th_fast = max(1, round(self.base_min_th_fast * scale))
+        return {
+            'n_features': self.n_features,
+            'ini_th_fast': max(min_th_fast, round(self.base_ini_th_fast * scale)),
+            'min_th_fast': min_th_fast,
+        }
+
+    def observe(self, tracked_points: int) -> Optional[Dict[str, int]]:
+        """
+        Args:
+            tracked_points: Точек карты, отслеженных на кадре с трекингом OK
+
+        Returns:
+            Новые параметры, если бюджет изменился, иначе None
+        """
+        if self._wait > 0:
+            self._wait -= 1
+            return None
+
+        if tracked_points < self.target_low:
+            self._above = 0
+            target = min(self.max_features, round(self.n_features * (1 + self.step_up)))
+        elif tracked_points > self.target_high:
+            self._above += 1
+            if self._above < self.patience:
+                return None
+            self._above = 0
+            target = max(self.min_features, round(self.n_features * (1 - self.step_down)))
+        else:
+            self._above = 0
+            return None
+
+        if target == self.n_features:
+            return None
+        self.n_features = target
+        self.changes += 1
+        self._wait = self.cooldown
+        return self.parameters
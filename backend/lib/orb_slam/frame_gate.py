@@ -0,0 +1,66 @@
+"""
+Пропуск избыточных кадров перед трекингом ORB-SLAM3.
+
+Кадры со штатива, паузы перед взлётом и т.п. почти не отличаются друг от
+друга, но стоят полного извлечения ORB и трекинга. FrameGate сравнивает
+миниатюру кадра с миниатюрой последнего поданного в SLAM кадра и
+пропускает кадр, если изменение меньше порога.
+"""
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class FrameGate:
+    """
+    Решает, подавать ли кадр в SLAM, по средней абсолютной разнице серых
+    миниатюр (0..255) с последним поданным кадром. Сравнение с поданным,
+    а не с предыдущим кадром, не даёт медленному движению потеряться.
+
+    Жёсткие ограничения, чтобы трекинг не голодал:
+    - подряд пропускается не больше max_skip кадров;
+    - force=True (трекинг потерян) — кадр подаётся всегда.
+    """
+
+    def __init__(self, threshold: float = 1.5, max_skip: int = 4, width: int = 64):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.width = width
+        self.skipped_total = 0
+        self._skipped = 0
+        self._reference: Optional[np.ndarray] = None
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, round(height * self.width / width)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGRA2GRAY if small.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+        return small
+
+    def should_track(self, frame: np.ndarray, force: bool = False) -> bool:
+        """
+        Args:
+            frame: Кадр BGR/BGRA/grayscale
+            force: Подать кадр независимо от движения
+
+        Returns:
+            False — кадр избыточен, его можно не подавать в SLAM
+        """
+        thumbnail = self._thumbnail(frame)
+        reference = self._reference
+        if (not force and reference is not None and self._skipped < self.max_skip
+                and reference.shape == thumbnail.shape
+                and float(cv2.absdiff(thumbnail, reference).mean()) < self.threshold):
+            self._skipped += 1
+            self.skipped_total += 1
+            return False
+        self._reference = thumbnail
+        self._skipped = 0
+        return True
+
+    def reset(self) -> None:
+        """Разрыв видео (seek): следующий кадр подаётся без сравнения."""
+        self._reference = None
+        self._skipped = 0
@@ -1,169 +1,367 @@
-#!/usr/bin/env python3
-"""
-Минимальный рабочий класс-обёртка ORB-SLAM3 monocular.
-1:1 по логике рабочего скрипта.
-"""
-from __future__ import annotations
-
-import os
-import sys
-import cv2
-import numpy as np
-from pathlib import Path
-from typing import Tuple, Optional, Dict, Any
-
-_HERE = Path(__file__).resolve().parent
-BIN_DIR = _HERE / "bin"
-VOCAB_DIR = _HERE / "vocab"
-
-sys.path.insert(0, str(BIN_DIR))
-import orbslam3  # noqa: E402
-
-
-class OrbslamMonoRunner:
-    """
-    Класс для работы с ORB-SLAM3 monocular.
-    Повторяет логику рабочего скрипта:
-    - инициализация SLAM сразу в конструкторе
-    - process_frame() → (ret, info)
-    - stop() — shutdown + release
-    """
-
-    def __init__(
-        self,
-        settings_file: str | os.PathLike,
-        min_init_frames: int = 20,
-    ) -> None:
-        self.vocab = Path(VOCAB_DIR / 'ORBvoc.txt')
-        self.settings = Path(settings_file)
-        self.min_init = min_init_frames
-
-        print(f"[DEBUG] Initializing ORB-SLAM3 with config: {self.settings}")
-        
-        # ---- инициализируем SLAM СРАЗУ (как в рабочем скрипте) ----
-        self.slam = orbslam3.system(
-            str(self.vocab),
-            str(self.settings),
-            orbslam3.Sensor.MONOCULAR,
-        )
-        self.slam.set_use_viewer(False)
-        self.slam.initialize()
-
-        # ---- видео-поток ----
-        self.cap: Optional[cv2.VideoCapture] = None
-        self.dt: float = 0.033
-        self.frame_idx: int = 0
-
-    # ---------- public ----------
-    def open_video(self, video_source: str | os.PathLike | int) -> None:
-        """Открыть видео (как в рабочем скрипте)."""
-        self.cap = cv2.VideoCapture(str(video_source))
-        if not self.cap.isOpened():
-            raise RuntimeError(f"Cannot open video: {video_source}")
-        
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        actual_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        actual_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        
-        print(f"[DEBUG] Video opened: {video_source}")
-        print(f"[DEBUG] Video params: {actual_width}x{actual_height}, {fps} fps, {frame_count} frames")
-        
-        self.dt = 1.0 / fps if fps > 0 else 0.033
-        self.frame_idx = 0
-
-    def process_frame(self) -> Tuple[bool, Optional[Dict[str, Any]]]:
-        """Один кадр = 1 вызов (логика рабочего while True)."""
-        if not self.cap:
-            raise RuntimeError("Video not opened. Call open_video() first.")
-
-        ret, frame = self.cap.read()
-        if not ret:
-            return False, None
-
-        timestamp = self.frame_idx * self.dt
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        ok = self.slam.process_image_mono(gray, timestamp)
-        self.frame_idx += 1
-
-        info: Optional[Dict[str, Any]] = None
-        if ok and self.frame_idx > self.min_init:
-            trajectory = self.slam.get_trajectory()
-            points = self.slam.get_tracked_map_points()
-            
-            # Получаем 2D ключевые точки напрямую из C++
-            keypoints_2d = None
-            try:
-                keypoints_2d = self.slam.get_current_keypoints()
-            except Exception as e:
-                print(f"[WARNING] Failed to get 2D keypoints: {e}")
-                keypoints_2d = None
-            
-            info = {
-                "frame": self.frame_idx - 1,
-                "pose": trajectory[-1] if trajectory else None,
-                "trajectory": trajectory,
-                "points": np.array(points) if points else None,
-                "keypoints_2d": np.array(keypoints_2d) if keypoints_2d else None,
-            }
-        return True, info
-
-    def stop(self) -> None:
-        """Shutdown + release (как в рабочем скрипте)."""
-        try:
-            if self.slam:
-                self.slam.shutdown()
-        except Exception as e:
-            print(f"[WARNING] Error during SLAM shutdown: {e}")
-        finally:
-            self.slam = None
-            
-        try:
-            if self.cap:
-                self.cap.release()
-        except Exception as e:
-            print(f"[WARNING] Error during video capture release: {e}")
-        finally:
-            self.cap = None
-
-
-
-
-# ---------------- CLI (опционально) ----------------
-def _main() -> None:
-    import argparse
-
-    parser = argparse.ArgumentParser(description="ORB-SLAM3 monocular (класс, 1:1)")
-    parser.add_argument("--settings", required=True, help="Path to settings YAML file")
-    parser.add_argument("--video", required=True)
-    parser.add_argument("--show", action="store_true")
-    args = parser.parse_args()
-
-    runner = OrbslamMonoRunner(args.settings)
-    runner.open_video(args.video)
-
-    try:
-        while True:
-            ret, info = runner.process_frame()
-            if not ret:
-                break
-            if info:
-                print(f"[Frame {info['frame']:05d}] Tracking OK")
-                print(f"Camera Pose:\n{info['pose']}")
-                if info["points"] is not None:
-                    print(f"  → {len(info['points'])} tracked 3-D points")
-            else:
-                print(f"[Frame {runner.frame_idx:05d}] Tracking LOST")
-
-            if args.show:
-                cv2.imshow("Mono SLAM", np.zeros((480, 640), np.uint8))
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
-    finally:
-        runner.stop()
-        cv2.destroyAllWindows()
-        print("[INFO] Finished processing video.")
-
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+"""
+Минимальный рабочий класс-обёртка ORB-SLAM3 monocular.
+1:1 по логике рабочего скрипта.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import cv2
+from contextlib import nullcontext
+import numpy as np
+from pathlib import Path
+from typing import Tuple, Optional, Dict, Any
+
+from .feature_budget import FeatureBudget
+from .frame_gate import FrameGate
+
+_HERE = Path(__file__).resolve().parent
+BIN_DIR = _HERE / "bin"
+VOCAB_DIR = _HERE / "vocab"
+
+logger = logging.getLogger(__name__)
+
+_orbslam3 = None
+
+
+def load_orbslam3():
+    """
+    Импортирует нативный модуль orbslam3 из bin/ при первом обращении,
+    а не при импорте этого файла.
+    """
+    global _orbslam3
+    if _orbslam3 is None:
+        if str(BIN_DIR) not in sys.path:
+            sys.path.insert(0, str(BIN_DIR))
+        import orbslam3
+        _orbslam3 = orbslam3
+    return _orbslam3
+
+
+class OrbslamMonoRunner:
+    """
+    Класс для работы с ORB-SLAM3 monocular.
+    Повторяет логику рабочего скрипта:
+    - инициализация SLAM сразу в конструкторе
+    - process_frame() → (ret, info)
+    - stop() — shutdown + release
+    """
+
+    def __init__(
+        self,
+        settings_file: str | os.PathLike,
+        min_init_frames: int = 20,
+        profiler: Optional[Any] = None,
+        frame_gate: Optional[Dict[str, Any]] = None,
+        feature_budget: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.vocab = Path(VOCAB_DIR / 'ORBvoc.txt')
+        self.settings = Path(settings_file)
+        self.min_init = min_init_frames
+        # Профайлер стадий (объект с методом stage(name) -> context manager)
+        self.profiler = profiler
+        # Пропуск почти неподвижных кадров в process_frame (параметры FrameGate)
+        self.frame_gate = FrameGate(**frame_gate) if frame_gate is not None else None
+        # Трекинг потерян после инициализации: кадры подаются все, без пропусков
+        self._tracking_lost = False
+
+        logger.debug("Initializing ORB-SLAM3 with config: %s", self.settings)
+        
+        # ---- инициализируем SLAM СРАЗУ (как в рабочем скрипте) ----
+        orbslam3 = load_orbslam3()
+        self.slam = orbslam3.system(
+            str(self.vocab),
+            str(self.settings),
+            orbslam3.Sensor.MONOCULAR,
+        )
+        self.slam.set_use_viewer(False)
+        self.slam.initialize()
+
+        # Адаптивный бюджет ORB-признаков (параметры FeatureBudget, кроме исходных из конфига)
+        self.feature_budget: Optional[FeatureBudget] = None
+        if feature_budget is not None:
+            get_parameters = getattr(self.slam, "get_orb_parameters", None)
+            parameters = get_parameters() if get_parameters else None
+            if not parameters or parameters['n_features'] <= 0:
+                logger.warning("orbslam3 module cannot change ORB parameters (see core/patches), "
+                               "feature budget disabled")
+            else:
+                self.feature_budget = FeatureBudget(**parameters, **feature_budget)
+
+        # ---- видео-поток ----
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.dt: float = 0.033
+        self.frame_idx: int = 0
+        # Кадров пропущено FrameGate (они всё равно учтены в frame_idx)
+        self.skipped_frames: int = 0
+        # Активная карта атласа после последнего кадра (None — биндинг без get_current_map_id)
+        self.map_id: Optional[int] = None
+        # Живых карт в атласе после последнего кадра (None — биндинг без get_num_maps)
+        self.num_maps: Optional[int] = None
+        # Выходные буферы геттеров биндинга, переиспользуются между кадрами
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def _stage(self, name: str):
+        return self.profiler.stage(name) if self.profiler else nullcontext()
+
+    def _fetch(self, name: str, getter) -> np.ndarray:
+        """
+        Вызывает геттер биндинга с out=буфер: результат — view на его начало.
+        Если буфер мал, биндинг отдаёт новый массив, а буфер растёт с запасом.
+        """
+        buffer = self._buffers.get(name)
+        result = getter(out=buffer)
+        if buffer is None or len(result) > len(buffer):
+            capacity = max(2 * len(result), 64)
+            self._buffers[name] = np.empty((capacity,) + result.shape[1:], dtype=np.float32)
+        return result
+
+    # ---------- public ----------
+    def open_video(self, video_source: str | os.PathLike | int, start_frame: int = 0) -> None:
+        """
+        Открыть видео (как в рабочем скрипте).
+
+        start_frame > 0 — продолжить с этого кадра (возобновление из чекпоинта):
+        метки времени идут дальше, как если бы кадры до него уже были поданы.
+        """
+        self.cap = cv2.VideoCapture(str(video_source))
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Cannot open video: {video_source}")
+        
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        actual_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        actual_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        
+        logger.debug("Video opened: %s", video_source)
+        logger.debug("Video params: %dx%d, %s fps, %d frames", actual_width, actual_height, fps, frame_count)
+        
+        self.dt = 1.0 / fps if fps > 0 else 0.033
+        self.frame_idx = 0
+        if self.frame_gate:
+            self.frame_gate.reset()
+        if start_frame > 0:
+            self.seek(start_frame)
+
+    def seek(self, frame_idx: int) -> None:
+        """Перемотать видео так, чтобы следующим был прочитан кадр frame_idx."""
+        if not self.cap:
+            raise RuntimeError("Video not opened. Call open_video() first.")
+
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        if int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) != frame_idx:
+            # Неточный seek (зависит от контейнера) — перематываем с начала grab()-ами
+            logger.debug("Inexact seek to frame %d, falling back to grab()", frame_idx)
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            for _ in range(frame_idx):
+                if not self.cap.grab():
+                    break
+        self.frame_idx = frame_idx
+        if self.frame_gate:
+            self.frame_gate.reset()
+
+    def current_map_id(self) -> Optional[int]:
+        """
+        Идентификатор активной карты атласа. После долгой потери трекинга
+        ORB-SLAM3 начинает новую карту, а при повторном узнавании места
+        сливает карты — тогда одна из них пропадает из атласа (см. live_map_count).
+        """
+        get_map_id = getattr(self.slam, "get_current_map_id", None) if self.slam else None
+        return int(get_map_id()) if get_map_id else None
+
+    def live_map_count(self) -> Optional[int]:
+        """
+        Число живых карт атласа. Слитая карта помечается плохой и убирается
+        из атласа, поэтому слияние видно по уменьшению этого числа, даже если
+        id активной карты не изменился.
+        """
+        get_num_maps = getattr(self.slam, "get_num_maps", None) if self.slam else None
+        return int(get_num_maps()) if get_num_maps else None
+
+    def set_localization_mode(self, enabled: bool) -> None:
+        """
+        Только трекинг по загруженному атласу (System.LoadAtlasFromFile):
+        локальное картирование останавливается, карта не меняется.
+        """
+        if enabled:
+            self.slam.activate_localization_mode()
+        else:
+            self.slam.deactivate_localization_mode()
+
+    @property
+    def orb_features(self) -> Optional[int]:
+        """Текущий бюджет ORB-признаков (None — без адаптивного бюджета)."""
+        return self.feature_budget.n_features if self.feature_budget else None
+
+    def _update_feature_budget(self, tracked_points: int) -> None:
+        parameters = self.feature_budget.observe(tracked_points)
+        if parameters is not None:
+            # Между кадрами: экстрактор перестраивается под mutex обёртки, трекинг не перезапускается
+            self.slam.set_orb_parameters(**parameters)
+            logger.debug("ORB feature budget %d (FAST %d/%d) at %d tracked points", parameters['n_features'],
+                         parameters['ini_th_fast'], parameters['min_th_fast'], tracked_points)
+
+    def save_atlas(self, path: str | os.PathLike) -> bool:
+        """
+        Сохранить атлас ORB-SLAM3 в <path>.osa, не останавливая SLAM.
+
+        Returns:
+            False, если нативный модуль собран без save_atlas (см. core/patches)
+        """
+        save = getattr(self.slam, "save_atlas", None) if self.slam else None
+        if save is None:
+            return False
+        return bool(save(str(path)))
+
+    def process_frame(self) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Один поданный в SLAM кадр = 1 вызов (логика рабочего while True).
+
+        С frame_gate кадры, почти не отличающиеся от последнего поданного,
+        читаются и пропускаются внутри вызова: frame_idx учитывает и их,
+        поэтому метки времени поданных кадров остаются frame_idx * dt.
+        """
+        if not self.cap:
+            raise RuntimeError("Video not opened. Call open_video() first.")
+
+        while True:
+            with self._stage("read"):
+                ret, frame = self.cap.read()
+            if not ret:
+                return False, None
+            if self.frame_gate is None:
+                break
+            with self._stage("gate"):
+                track = self.frame_gate.should_track(frame, force=self._tracking_lost)
+            if track:
+                break
+            self.frame_idx += 1
+            self.skipped_frames += 1
+
+        info = self.process_image(frame)
+        self._tracking_lost = info is None and self.frame_idx > self.min_init
+        return True, info
+
+    def process_image(self, frame: np.ndarray, color: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Трекинг уже декодированного кадра — для случаев, когда кадры приходят
+        не из своего VideoCapture (например, общий декодер для нескольких SLAM).
+        Метка времени — frame_idx * dt.
+
+        Кадр передаётся в биндинг как есть: C-contiguous массив оборачивается
+        в cv::Mat без копирования, в серый он переводится внутри биндинга
+        в переиспользуемый буфер.
+
+        Args:
+            frame: Кадр BGR/BGRA/grayscale или YUV
+            color: Имя orbslam3.ColorFormat ('I420', 'NV12', 'YUYV', ...);
+                   None — по числу каналов (1 — серый, 3 — BGR, 4 — BGRA)
+
+        Returns:
+            info как в process_frame() или None, если трекинга нет.
+            Массивы в info (float32: trajectory N×4×4, points N×3, keypoints_2d N×2)
+            — view на буферы, переиспользуемые на следующем кадре: что нужно
+            дольше, надо скопировать до следующего вызова.
+        """
+        timestamp = self.frame_idx * self.dt
+        with self._stage("track"):
+            if color is None:
+                ok = self.slam.process_image_mono(frame, timestamp)
+            else:
+                ok = self.slam.process_image_mono(frame, timestamp, getattr(load_orbslam3().ColorFormat, color))
+        self.frame_idx += 1
+        self.map_id = self.current_map_id()
+        self.num_maps = self.live_map_count()
+
+        info: Optional[Dict[str, Any]] = None
+        if ok and self.frame_idx > self.min_init:
+            with self._stage("get_trajectory"):
+                trajectory = self._fetch("trajectory", self.slam.get_trajectory)
+            with self._stage("get_tracked_map_points"):
+                points = self._fetch("points", self.slam.get_tracked_map_points)
+            
+            # Получаем 2D ключевые точки напрямую из C++
+            keypoints_2d = None
+            try:
+                with self._stage("get_current_keypoints"):
+                    keypoints_2d = self._fetch("keypoints_2d", self.slam.get_current_keypoints)
+            except Exception as e:
+                logger.warning("Failed to get 2D keypoints: %s", e)
+                keypoints_2d = None
+            
+            info = {
+                "frame": self.frame_idx - 1,
+                "pose": trajectory[-1] if len(trajectory) else None,
+                "trajectory": trajectory,
+                "points": points if len(points) else None,
+                "keypoints_2d": keypoints_2d if keypoints_2d is not None and len(keypoints_2d) else None,
+                "map_id": self.map_id,
+                "num_maps": self.num_maps,
+            }
+        # Только кадры с трекингом OK: во время потери и переинициализации бюджет не при чём
+        if self.feature_budget is not None and info is not None:
+            with self._stage("feature_budget"):
+                self._update_feature_budget(len(info["points"]) if info["points"] is not None else 0)
+        return info
+
+    def stop(self) -> None:
+        """Shutdown + release (как в рабочем скрипте)."""
+        try:
+            if self.slam:
+                self.slam.shutdown()
+        except Exception as e:
+            logger.warning("Error during SLAM shutdown: %s", e)
+        finally:
+            self.slam = None
+            
+        try:
+            if self.cap:
+                self.cap.release()
+        except Exception as e:
+            logger.warning("Error during video capture release: %s", e)
+        finally:
+            self.cap = None
+
+
+
+
+# ---------------- CLI (опционально) ----------------
+def _main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ORB-SLAM3 monocular (класс, 1:1)")
+    parser.add_argument("--settings", required=True, help="Path to settings YAML file")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--show", action="store_true")
+    args = parser.parse_args()
+
+    runner = OrbslamMonoRunner(args.settings)
+    runner.open_video(args.video)
+
+    try:
+        while True:
+            ret, info = runner.process_frame()
+            if not ret:
+                break
+            if info:
+                print(f"[Frame {info['frame']:05d}] Tracking OK")
+                print(f"Camera Pose:\n{info['pose']}")
+                if info["points"] is not None:
+                    print(f"  → {len(info['points'])} tracked 3-D points")
+            else:
+                print(f"[Frame {runner.frame_idx:05d}] Tracking LOST")
+
+            if args.show:
+                cv2.imshow("Mono SLAM", np.zeros((480, 640), np.uint8))
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+    finally:
+        runner.stop()
+        cv2.destroyAllWindows()
+        print("[INFO] Finished processing video.")
+
+
+if __name__ == "__main__":
     _main()
\ No newline at end of file
@@ -0,0 +1,14 @@
+from .logging_setup import (
+    RateLimitFilter,
+    StructuredFormatter,
+    configure_logging,
+    get_logger,
+)
+
+
+__all__ = [
+    'RateLimitFilter',
+    'StructuredFormatter',
+    'configure_logging',
+    'get_logger'
+]
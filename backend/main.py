@@ -5,15 +5,45 @@ import uvicorn
 from routes.add_route import router as add_router
 from routes.upload_route import router as upload_router
 from routes.processing_route import router as processing_router
+from routes.metrics_route import router as metrics_router
+from routes.health_route import router as health_router
+from routes.maps_route import router as maps_router
+from routes.sweep_route import router as sweep_router
+from services.runtime_service import SLAM_WARMUP, warm_up
+from services.dispatch_service import resume_interrupted_jobs, sync_from_queue
+from store import PROCESSING_MODE
+from contextlib import asynccontextmanager
 import asyncio
 #from webrtc.server import app as webrtc_app
 from aiohttp import web as aiohttp_web
 from store import create_store
+from log import configure_logging, get_logger
+from middleware import CompressionMiddleware
+
+configure_logging()
+logger = get_logger(__name__)
 
 HOST = "0.0.0.0"
 PORT = 8000
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Предзагрузка OpenCV/orbslam3 в фоне: сервер стартует сразу,
+    # а /api/health/ready ответит 200 после загрузки
+    # Ссылка держится до остановки: задачу без ссылки может собрать сборщик мусора
+    warmup_task = asyncio.create_task(warm_up()) if SLAM_WARMUP else None
+    # В режиме очереди обработку делают воркеры, а API-узел подтягивает прогресс
+    sync_task = asyncio.create_task(sync_from_queue()) if PROCESSING_MODE == 'queue' else None
+    # Обработки, прерванные перезапуском, продолжаются с последнего чекпоинта
+    resume_interrupted_jobs()
+    yield
+    if sync_task:
+        sync_task.cancel()
+    if warmup_task:
+        warmup_task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Добавляем CORS middleware
 app.add_middleware(
@@ -24,9 +54,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие JSON и SSE (br/gzip/deflate по Accept-Encoding); медиа и Range не трогает
+app.add_middleware(CompressionMiddleware)
+
 app.include_router(add_router, prefix="/api")
 app.include_router(upload_router, prefix="/api")
 app.include_router(processing_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
+app.include_router(health_router, prefix="/api")
+app.include_router(maps_router, prefix="/api")
+app.include_router(sweep_router, prefix="/api")
 
 app.mount("/", StaticFiles(directory="view", html=True), name="view")
 
@@ -35,7 +72,7 @@ async def run_webrtc():
     await runner.setup()
     site = aiohttp_web.TCPSite(runner, HOST, PORT)
     await site.start()
-    print("WebRTC server started on http://127.0.0.1:8081")
+    logger.info("WebRTC server started on http://127.0.0.1:8081")
 
 if __name__ == "__main__":
     create_store()
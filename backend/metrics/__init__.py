@@ -0,0 +1,41 @@
+from .memory import JobMemory, MemoryTracker
+from .profiler import FRAME_STAGE, StageHistogram, StageProfiler
+
+
+_global_profiler = None
+_memory_tracker = None
+
+
+def get_global_profiler() -> StageProfiler:
+    global _global_profiler
+    if _global_profiler is None:
+        _global_profiler = StageProfiler()
+    return _global_profiler
+
+
+def create_job_profiler() -> StageProfiler:
+    return StageProfiler(parent=get_global_profiler())
+
+
+def get_memory_tracker() -> MemoryTracker:
+    global _memory_tracker
+    if _memory_tracker is None:
+        _memory_tracker = MemoryTracker()
+    return _memory_tracker
+
+
+def create_job_memory(processing_id: str) -> JobMemory:
+    return get_memory_tracker().create_job(processing_id)
+
+
+__all__ = [
+    'FRAME_STAGE',
+    'JobMemory',
+    'MemoryTracker',
+    'StageHistogram',
+    'StageProfiler',
+    'get_global_profiler',
+    'create_job_profiler',
+    'get_memory_tracker',
+    'create_job_memory'
+]
@@ -0,0 +1,287 @@
+import ctypes
+import ctypes.util
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence, Set
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+# Периодичность замеров памяти внутри задачи (USS читается из smaps — это не бесплатно)
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get("MEMORY_SAMPLE_INTERVAL", "5.0"))
+# Сколько последних задач держать в отчёте
+MEMORY_JOBS_KEPT = int(os.environ.get("MEMORY_JOBS_KEPT", "50"))
+# tracemalloc: снимки Python-кучи в начале и конце каждой задачи (замедляет аллокации)
+MEMORY_TRACEMALLOC = os.environ.get("MEMORY_TRACEMALLOC", "0") == "1"
+MEMORY_TRACEMALLOC_TOP = 10
+_SAMPLES_KEPT = 256
+_MB = 2 ** 20
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (Linux /proc, иначе пиковый RSS из getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def uss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Память только этого (или pid) процесса (Private_* из smaps_rollup); None — не Linux."""
+    try:
+        total = 0
+        with open(f"/proc/{pid or 'self'}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Private_"):
+                    total += int(line.split()[1]) * 1024
+        return total
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_size_t) for name in (
+        'arena', 'ordblks', 'smblks', 'hblks', 'hblkhd', 'usmblks', 'fsmblks', 'uordblks', 'fordblks', 'keepcost'
+    )]
+
+
+_mallinfo2 = None
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        _mallinfo2 = _libc.mallinfo2
+        _mallinfo2.restype = _MallInfo2
+    except (OSError, AttributeError):
+        _mallinfo2 = None
+
+
+def native_heap_bytes() -> Optional[int]:
+    """
+    Занятая нативная куча glibc malloc (uordblks + mmap-блоки) — сюда попадают
+    аллокации ORB-SLAM3 и OpenCV. None — не glibc >= 2.33.
+    """
+    if _mallinfo2 is None:
+        return None
+    info = _mallinfo2()
+    return info.uordblks + info.hblkhd
+
+
+def sample() -> Dict[str, Optional[int]]:
+    return {'rss': rss_bytes(), 'uss': uss_bytes(), 'native_heap': native_heap_bytes()}
+
+
+def process_sample(pid: int) -> Dict[str, Optional[int]]:
+    """
+    Замер другого процесса (дочернего процесса SLAM) по /proc/<pid>.
+    Нативная куча снаружи не видна — native_heap всегда None.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        rss = None
+    return {'rss': rss, 'uss': uss_bytes(pid), 'native_heap': None}
+
+
+def _delta(before: Dict[str, Optional[int]], after: Dict[str, Optional[int]]) -> Dict[str, Optional[float]]:
+    return {f'{key}_mb': (after[key] - before[key]) / _MB if after[key] is not None and before[key] is not None else None
+            for key in before}
+
+
+def _to_mb(values: Dict[str, Optional[int]]) -> Dict[str, Optional[float]]:
+    return {f'{key}_mb': value / _MB if value is not None else None for key, value in values.items()}
+
+
+def deep_sizeof(value: Any, _seen: Optional[set] = None) -> int:
+    """Приблизительный размер объекта со всем вложенным (Mapping/Sequence/Set)."""
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes)):
+        return size
+    if isinstance(value, Mapping):
+        for key, item in value.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(item, seen)
+    elif isinstance(value, (Sequence, Set)):
+        for item in value:
+            size += deep_sizeof(item, seen)
+    return size
+
+
+class JobMemory:
+    """
+    Память одной задачи: замеры RSS/USS/нативной кучи в начале, по ходу
+    (не чаще MEMORY_SAMPLE_INTERVAL) и в конце, дельты вокруг отдельных
+    событий (создание и остановка SLAM) и, с MEMORY_TRACEMALLOC=1, топ
+    мест Python-кода, где куча выросла за время задачи.
+
+    Замеры процессные: при нескольких одновременных задачах дельты
+    включают и чужие аллокации. Для SLAM в дочернем процессе (SLAM_PROCESS=1)
+    дельты этого процесса вокруг создания и остановки SLAM ничего не
+    говорят — такие события помечаются недоступными (measure(in_process=False)),
+    а память дочернего процесса записывается отдельно (record_process).
+    """
+
+    def __init__(self, processing_id: str):
+        self.processing_id = processing_id
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.start = sample()
+        self.end: Optional[Dict[str, Optional[int]]] = None
+        self.peak_rss = self.start['rss']
+        self.samples: List[Dict[str, Any]] = []
+        self.events: Dict[str, Dict[str, Optional[float]]] = {}
+        self.data_bytes: Optional[int] = None
+        self.python_top: Optional[List[Dict[str, Any]]] = None
+        self._last_sample = time.monotonic()
+        self._snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+    def maybe_sample(self, frame: Optional[int] = None) -> None:
+        """Замер, если с прошлого прошло MEMORY_SAMPLE_INTERVAL; иначе — одна проверка времени."""
+        now = time.monotonic()
+        if now - self._last_sample < MEMORY_SAMPLE_INTERVAL:
+            return
+        self._last_sample = now
+        values = sample()
+        self.peak_rss = max(self.peak_rss, values['rss'])
+        if len(self.samples) >= _SAMPLES_KEPT:
+            # Длинная задача: прореживаем ряд вдвое, сохраняя охват по времени
+            self.samples = self.samples[::2]
+        self.samples.append({'t': round(time.time() - self.started_at, 3), 'frame': frame, **_to_mb(values)})
+
+    @contextmanager
+    def measure(self, event: str, in_process: bool = True) -> Iterator[None]:
+        """
+        Дельта памяти вокруг блока (например, создание или остановка SLAM).
+
+        Args:
+            in_process: False — память блока выделяется в другом процессе;
+                дельты не считаются, событие помечается недоступным
+        """
+        if not in_process:
+            try:
+                yield
+            finally:
+                self.events[event] = {'rss_mb': None, 'uss_mb': None, 'native_heap_mb': None,
+                                      'unavailable': 'measured in another process'}
+            return
+
+        before = sample()
+        try:
+            yield
+        finally:
+            after = sample()
+            self.peak_rss = max(self.peak_rss, after['rss'])
+            self.events[event] = _delta(before, after)
+
+    def record_process(self, event: str, pid: int) -> None:
+        """Записывает память процесса pid (RSS/USS, не дельту) как событие event."""
+        self.events[event] = _to_mb(process_sample(pid))
+
+    def finish(self, data: Any = None) -> None:
+        """
+        Итоговый замер. data — Processing.data: его размер (и, с tracemalloc,
+        топ роста кучи по строкам кода) показывает вклад Python-структур.
+        """
+        self.end = sample()
+        self.finished_at = time.time()
+        self.peak_rss = max(self.peak_rss, self.end['rss'])
+        if data is not None:
+            self.data_bytes = deep_sizeof(data)
+        if self._snapshot is not None and tracemalloc.is_tracing():
+            stats = tracemalloc.take_snapshot().compare_to(self._snapshot, 'lineno')
+            self.python_top = [{
+                'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_diff_kb': stat.size_diff / 1024,
+                'count_diff': stat.count_diff,
+            } for stat in stats[:MEMORY_TRACEMALLOC_TOP]]
+            self._snapshot = None
+
+    @property
+    def retained(self) -> Optional[Dict[str, Optional[float]]]:
+        """Сколько памяти процесса осталось занято после задачи."""
+        return _delta(self.start, self.end) if self.end is not None else None
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'processing_id': self.processing_id,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'start': _to_mb(self.start),
+            'end': _to_mb(self.end) if self.end is not None else None,
+            'peak_rss_mb': self.peak_rss / _MB,
+            'retained': self.retained,
+            'events': self.events,
+            'data_mb': self.data_bytes / _MB if self.data_bytes is not None else None,
+            'python_top': self.python_top,
+            'samples': self.samples,
+        }
+
+
+class MemoryTracker:
+    """
+    Учёт памяти процесса по задачам: последние MEMORY_JOBS_KEPT JobMemory
+    и агрегат — рост с запуска и суммарная память, оставшаяся после задач.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.start = sample()
+        self.jobs: 'OrderedDict[str, JobMemory]' = OrderedDict()
+        self.finished_jobs = 0
+        self.retained_rss = 0
+        self.retained_native = 0
+        self._lock = threading.Lock()
+        if MEMORY_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def create_job(self, processing_id: str) -> JobMemory:
+        job = JobMemory(processing_id)
+        with self._lock:
+            self.jobs.pop(processing_id, None)
+            self.jobs[processing_id] = job
+            while len(self.jobs) > MEMORY_JOBS_KEPT:
+                self.jobs.popitem(last=False)
+        return job
+
+    def finish_job(self, job: JobMemory, data: Any = None) -> None:
+        if job.end is not None:
+            return
+        job.finish(data)
+        retained = job.retained
+        with self._lock:
+            self.finished_jobs += 1
+            self.retained_rss += job.end['rss'] - job.start['rss']
+            if retained['native_heap_mb'] is not None:
+                self.retained_native += job.end['native_heap'] - job.start['native_heap']
+
+    def report(self, include_jobs: bool = True) -> Dict[str, Any]:
+        current = sample()
+        with self._lock:
+            jobs = list(self.jobs.values())
+            finished = self.finished_jobs
+            retained_rss = self.retained_rss
+            retained_native = self.retained_native
+        result = {
+            'started_at': self.started_at,
+            'start': _to_mb(self.start),
+            'current': _to_mb(current),
+            'growth': _delta(self.start, current),
+            'finished_jobs': finished,
+            'retained_rss_mb': retained_rss / _MB,
+            'retained_rss_mb_per_job': retained_rss / _MB / finished if finished else None,
+            'retained_native_heap_mb': retained_native / _MB if self.start['native_heap'] is not None else None,
+            'tracemalloc': tracemalloc.is_tracing(),
+        }
+        if include_jobs:
+            result['jobs'] = [job.report() for job in jobs]
+        return result
@@ -0,0 +1,136 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+# Границы корзин: от 1 мкс с шагом 2^(1/4) (~19%) до ~30 с
+_BUCKET_STEP = 4
+BUCKET_BOUNDS: List[float] = [1e-6 * 2 ** (i / _BUCKET_STEP) for i in range(25 * _BUCKET_STEP)]
+QUANTILES = (0.5, 0.95, 0.99)
+# Стадия полного кадра: доли остальных стадий считаются от неё
+FRAME_STAGE = 'frame'
+
+
+class StageHistogram:
+    """
+    Гистограмма длительностей одной стадии на фиксированных лог-корзинах.
+
+    Запись — один bisect и пара инкрементов, так что её можно держать
+    включённой в горячем цикле. Квантили оцениваются интерполяцией внутри
+    корзины (погрешность не больше ширины корзины, ~19%).
+    """
+
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: 'StageHistogram') -> None:
+        for i, value in enumerate(other.counts):
+            self.counts[i] += value
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        cumulative = 0
+        for i, value in enumerate(self.counts):
+            if value == 0:
+                continue
+            if cumulative + value >= rank:
+                lower = BUCKET_BOUNDS[i - 1] if i > 0 else 0.0
+                upper = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                fraction = (rank - cumulative) / value
+                return min(lower + (upper - lower) * fraction, self.max)
+            cumulative += value
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        result = {
+            'count': self.count,
+            'total_ms': self.sum * 1000.0,
+            'mean_ms': (self.sum / self.count) * 1000.0 if self.count else 0.0,
+            'max_ms': self.max * 1000.0,
+        }
+        for q in QUANTILES:
+            result[f'p{int(q * 100)}_ms'] = self.quantile(q) * 1000.0
+        return result
+
+
+class StageProfiler:
+    """
+    Набор гистограмм по стадиям обработки.
+
+    Если задан parent, каждое измерение дублируется в него — так
+    накапливается агрегат по всем задачам для /api/metrics.
+    """
+
+    def __init__(self, parent: Optional['StageProfiler'] = None):
+        self.parent = parent
+        self.stages: Dict[str, StageHistogram] = {}
+        self.started_at = time.time()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = StageHistogram()
+        histogram.observe(seconds)
+        if self.parent is not None:
+            self.parent.observe(stage, seconds)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def report(self) -> Dict:
+        """Сводка p50/p95/p99 по стадиям и доля каждой стадии во времени."""
+        if FRAME_STAGE in self.stages:
+            total = self.stages[FRAME_STAGE].sum
+        else:
+            total = sum(h.sum for h in self.stages.values())
+        stages = {}
+        for name, histogram in self.stages.items():
+            summary = histogram.summary()
+            summary['share'] = histogram.sum / total if total > 0 else 0.0
+            stages[name] = summary
+        return {
+            'started_at': self.started_at,
+            'total_ms': total * 1000.0,
+            'stages': stages
+        }
+
+    def to_prometheus(self, metric: str = 'processing_stage_duration_seconds') -> str:
+        """Гистограммы в текстовом формате Prometheus (корзины по степеням двойки)."""
+        lines = [
+            f'# HELP {metric} Time spent in each processing stage per frame.',
+            f'# TYPE {metric} histogram',
+        ]
+        for name, histogram in sorted(self.stages.items()):
+            cumulative = 0
+            for i, bound in enumerate(BUCKET_BOUNDS):
+                cumulative += histogram.counts[i]
+                if i % _BUCKET_STEP == 0:
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound:.9g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.sum:.9g}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,8 @@
+from .compression import CompressionMiddleware, negotiate_encoding, supported_encodings
+
+
+__all__ = [
+    'CompressionMiddleware',
+    'negotiate_encoding',
+    'supported_encodings'
+]
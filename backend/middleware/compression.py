@@ -0,0 +1,221 @@
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+import anyio.to_thread
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Ответы меньше этого размера не сжимаются: заголовки и CPU дороже выигрыша
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+# Куски больше этого размера сжимаются в пуле потоков, а не в event loop
+COMPRESSION_THREAD_THRESHOLD = int(os.environ.get("COMPRESSION_THREAD_THRESHOLD", "65536"))
+COMPRESSION_THREADS = int(os.environ.get("COMPRESSION_THREADS", "4"))
+GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'text/event-stream',
+    'text/',
+    'application/javascript',
+    'image/svg+xml',
+)
+
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def _get_limiter() -> anyio.CapacityLimiter:
+    # Отдельный лимит, чтобы сжатие не занимало потоки синхронных эндпоинтов
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(COMPRESSION_THREADS)
+    return _limiter
+
+
+def supported_encodings() -> List[str]:
+    """Кодировки в порядке предпочтения сервера."""
+    return (['br'] if brotli is not None else []) + ['gzip', 'deflate']
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Выбирает кодировку по заголовку Accept-Encoding с учётом q-значений.
+
+    Returns:
+        'br', 'gzip', 'deflate' или None, если сжимать нельзя
+    """
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name] = quality
+
+    best = None
+    for encoding in supported_encodings():
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+class _StreamCompressor:
+    """Потоковый компрессор с flush после каждого куска (для SSE)."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        if self.encoding == 'br':
+            return self._brotli.process(data) + (self._brotli.flush() if flush else b'')
+        return self._zlib.compress(data) + (self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else b'')
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+    def compress_all(self, data: bytes) -> bytes:
+        return self.compress(data, False) + self.finish()
+
+
+def _is_compressible(headers: List[Tuple[bytes, bytes]], status: int) -> bool:
+    if status < 200 or status in (204, 206, 304):
+        return False
+    content_type = ''
+    for name, value in headers:
+        lowered = name.lower()
+        if lowered == b'content-encoding':
+            return False
+        if lowered == b'content-type':
+            content_type = value.decode('latin-1').lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI-middleware согласованного сжатия ответов: br (если установлен
+    пакет brotli), gzip, deflate.
+
+    Обычные ответы сжимаются целиком, потоковые (SSE) — кусками с flush
+    после каждого, чтобы каждое событие уходило клиенту сразу. Большие
+    куски сжимаются в отдельном пуле потоков. Медиа (Range, zero-copy
+    отправка файлов) проходит без изменений.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ''
+        for name, value in scope.get('headers', []):
+            if name == b'accept-encoding':
+                accept_encoding = value.decode('latin-1')
+                break
+        encoding = negotiate_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start = None
+        self._compressor: Optional[_StreamCompressor] = None
+        self._passthrough = False
+
+    async def _run(self, fn, data: bytes):
+        if len(data) >= COMPRESSION_THREAD_THRESHOLD:
+            return await anyio.to_thread.run_sync(fn, data, limiter=_get_limiter())
+        return fn(data)
+
+    def _compressed_headers(self, length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        headers = [(name, value) for name, value in self._start['headers']
+                   if name.lower() not in (b'content-length', b'vary')]
+        vary = [value for name, value in self._start['headers'] if name.lower() == b'vary']
+        headers.append((b'vary', b', '.join(vary + [b'Accept-Encoding'])))
+        headers.append((b'content-encoding', self.encoding.encode('latin-1')))
+        if length is not None:
+            headers.append((b'content-length', str(length).encode('latin-1')))
+        return headers
+
+    async def send(self, message):
+        message_type = message['type']
+
+        if message_type == 'http.response.start':
+            self._start = message
+            self._start['headers'] = list(message.get('headers', []))
+            if not _is_compressible(self._start['headers'], message['status']):
+                self._passthrough = True
+                await self._send(message)
+            return
+
+        if self._passthrough:
+            await self._send(message)
+            return
+
+        if message_type != 'http.response.body':
+            # Отправка файла без тела (zero-copy/pathsend) — сжать нечего, отдаём как есть
+            if self._start is not None:
+                await self._send(self._start)
+                self._start = None
+            self._passthrough = True
+            await self._send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self._compressor is None:
+            if not more_body:
+                # Ответ целиком в одном сообщении
+                if len(body) < self.minimum_size:
+                    await self._send(self._start)
+                    await self._send(message)
+                    return
+                compressed = await self._run(_StreamCompressor(self.encoding).compress_all, body)
+                await self._send({**self._start, 'headers': self._compressed_headers(len(compressed))})
+                await self._send({'type': 'http.response.body', 'body': compressed})
+                return
+
+            # Потоковый ответ: заголовки сразу, длина неизвестна
+            self._compressor = _StreamCompressor(self.encoding)
+            await self._send({**self._start, 'headers': self._compressed_headers(None)})
+
+        if more_body:
+            chunk = await self._run(lambda data: self._compressor.compress(data, True), body)
+            if chunk:
+                await self._send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        else:
+            tail = await self._run(lambda data: self._compressor.compress(data, False) + self._compressor.finish(), body)
+            await self._send({'type': 'http.response.body', 'body': tail})
@@ -81,9 +81,9 @@ class OrbslamMonoRunner:
             points = self.slam.get_tracked_map_points()
             info = {
                 "frame": self.frame_idx - 1,
-                "pose": trajectory[-1] if trajectory else None,
+                "pose": trajectory[-1] if len(trajectory) else None,
                 "trajectory": trajectory,
-                "points": np.array(points) if points else None,
+                "points": points if len(points) else None,
             }
         return True, info
 
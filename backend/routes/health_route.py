@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services.runtime_service import get_runtime_state, is_ready
+
+
+router = APIRouter()
+
+
+@router.get("/health/live")
+def liveness():
+    """Процесс жив и обслуживает запросы."""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+def readiness():
+    """Готовность принимать трафик; при SLAM_WARMUP=1 — только после загрузки стека."""
+    state = get_runtime_state()
+    ready = is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", **state}
+    )
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+from services.codec_service import encode_points
+from services.map_library_service import delete_map, get_map, list_maps, load_map_points, save_named_map
+from store import get_store
+import asyncio
+
+
+router = APIRouter()
+
+FINISHED_STATUSES = {'completed', 'completed_with_warnings'}
+
+
+@router.get("/maps")
+def get_maps():
+    """Библиотека сохранённых карт, по которым можно обрабатывать новые видео."""
+    return {"maps": list_maps()}
+
+
+@router.get("/maps/{name}")
+def get_map_info(name: str):
+    meta = get_map(name)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"Map {name} not found")
+    meta.pop('atlas_path')
+    return meta
+
+
+@router.get("/maps/{name}/points")
+async def export_map_points(name: str, precision: str = Query('q16', pattern='^(q16|f32)$')):
+    """Полная карта точек в двоичном формате services.codec_service (q16 или f32 без потерь)."""
+    if get_map(name) is None:
+        raise HTTPException(status_code=404, detail=f"Map {name} not found")
+    points = await asyncio.to_thread(load_map_points, name)
+    if points is None:
+        raise HTTPException(status_code=404, detail=f"Map {name} has no saved points")
+    content = await asyncio.to_thread(encode_points, points, precision)
+    return Response(content, media_type="application/octet-stream",
+                    headers={"content-disposition": f"attachment; filename=\"{name}.slmq\""})
+
+
+@router.post("/processing/{id}/save-map")
+async def save_processing_map(id: str, name: str = Query(...), overwrite: bool = Query(False)):
+    """
+    Сохраняет атлас завершённой обработки в библиотеку под именем name.
+    Новые загрузки с ?map=name пойдут в режиме локализации по этой карте.
+    """
+    processing = get_store().get(id)
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+
+    data = processing.data or {}
+    if data.get('status') not in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail="Processing is not finished yet")
+    if data.get('mode') == 'localization':
+        raise HTTPException(status_code=409, detail="Localization runs do not build a new map")
+
+    try:
+        meta = await asyncio.to_thread(save_named_map, name, id, data, overwrite)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except FileExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return meta
+
+
+@router.delete("/maps/{name}")
+async def remove_map(name: str):
+    try:
+        deleted = await asyncio.to_thread(delete_map, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Map {name} not found")
+    return {"deleted": name}
@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from metrics import get_global_profiler, get_memory_tracker
+from store import get_store
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Метрики в текстовом формате Prometheus: гистограммы стадий и счётчики задач."""
+    store = get_store()
+    lines = [
+        '# HELP processing_jobs Number of processing jobs in the store.',
+        '# TYPE processing_jobs gauge',
+        f'processing_jobs{{state="active"}} {store.count_active()}',
+        f'processing_jobs{{state="all"}} {store.count()}',
+    ]
+    memory = get_memory_tracker().report(include_jobs=False)
+    lines += [
+        '# HELP process_memory_bytes Memory of the API process.',
+        '# TYPE process_memory_bytes gauge',
+    ]
+    for kind, value in memory['current'].items():
+        if value is not None:
+            lines.append(f'process_memory_bytes{{kind="{kind[:-3]}"}} {int(value * 2**20)}')
+    lines += [
+        '# HELP processing_retained_rss_bytes RSS left allocated after finished jobs.',
+        '# TYPE processing_retained_rss_bytes gauge',
+        f'processing_retained_rss_bytes {int(memory["retained_rss_mb"] * 2**20)}',
+    ]
+    body = '\n'.join(lines) + '\n' + get_global_profiler().to_prometheus()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/memory")
+def get_memory_metrics(jobs: bool = True):
+    """
+    Память процесса: рост с запуска, память, оставшаяся после завершённых задач
+    (в сумме и на задачу), и отчёты по последним задачам (jobs=false — без них).
+    """
+    return get_memory_tracker().report(include_jobs=jobs)
@@ -1,23 +1,34 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse, FileResponse
-from store import get_store
-from services.processing_service import start_processing
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Query
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from store import get_store, json_default
+from services.dispatch_service import dispatch_processing
+from services.media_service import build_file_response, get_playback_path
+from services.lod_service import VoxelPointCloud, get_point_map, points_to_dicts
+from services.codec_service import encode_points, encode_trajectory
+from services.map_library_service import get_map
+from services.result_service import load_result_point_map, load_result_points
+from log import get_logger
+from typing import List, Optional
+import numpy as np
 import json
 import asyncio
+import logging
 from pathlib import Path
 import os
 
-
 router = APIRouter()
+logger = get_logger(__name__)
 
 
 @router.post("/processing/start/{file_id}")
-async def start_video_processing(file_id: str, background_tasks: BackgroundTasks):
+async def start_video_processing(file_id: str, background_tasks: BackgroundTasks,
+                                 map: Optional[str] = Query(None)):
     """
     Запускает обработку загруженного видео через ORB-SLAM3.
     
     Args:
         file_id: ID загруженного файла
+        map: Имя карты из библиотеки для режима локализации
         
     Returns:
         processing_id: ID созданной обработки в store
@@ -33,12 +44,16 @@ async def start_video_processing(file_id: str, background_tasks: BackgroundTasks
     
     video_path = str(video_files[0])
     
+    if map and get_map(map) is None:
+        raise HTTPException(status_code=404, detail=f"Map {map} not found")
+    
     # Создаем предварительную запись в store для получения processing_id
     processing = store.add(
         processing_type='video_processing',
         data={
             'file_id': file_id,
             'video_path': video_path,
+            'localization_map': map,
             'status': 'queued'
         }
     )
@@ -47,7 +62,7 @@ async def start_video_processing(file_id: str, background_tasks: BackgroundTasks
     
     # Запускаем обработку в фоне с использованием processing_id
     async def run_processing():
-        await start_processing(processing_id, video_path)
+        await dispatch_processing(processing_id, video_path)
     
     background_tasks.add_task(run_processing)
     
@@ -59,6 +74,56 @@ async def start_video_processing(file_id: str, background_tasks: BackgroundTasks
     }
 
 
+# Верхняя граница размера страницы листинга
+MAX_PAGE_SIZE = 200
+
+
+@router.get("/processing")
+async def list_processings(
+    type: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    active: Optional[bool] = Query(None),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+):
+    """
+    Список обработок с фильтрами и курсорной пагинацией.
+    
+    Args:
+        type: Тип обработки (stream, video_processing, sweep)
+        status: Статус из data['status']
+        active: Только активные / только завершённые
+        limit: Размер страницы
+        cursor: next_cursor из предыдущей страницы
+        order: desc — сначала новые, asc — сначала старые
+        
+    Returns:
+        items: Краткие проекции обработок (без траектории и точек)
+        next_cursor: Курсор следующей страницы или null
+        total: Сколько всего обработок подходит под фильтры
+    """
+    store = get_store()
+    
+    try:
+        items, next_cursor, total = store.query(
+            processing_type=type,
+            status=status,
+            active=active,
+            limit=limit,
+            cursor=cursor,
+            descending=order == "desc",
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "items": [processing.to_summary() for processing in items],
+        "next_cursor": next_cursor,
+        "total": total,
+    }
+
+
 @router.get("/processing/{id}")
 async def get_processing_data_stream(id: str):
     """
@@ -103,18 +168,18 @@ async def get_processing_data_stream(id: str):
                     'progress': (current_frame / data.get('total_frames', 1)) * 100 if data.get('total_frames', 0) > 0 else 0
                 }
                 
-                # Логирование для отладки
-                print(f"[SSE] Sending update for frame {current_frame}: {len(keypoints_2d_data)} keypoints_2d")
-                if keypoints_2d_data:
-                    print(f"[SSE] First keypoint: {keypoints_2d_data[0]}")
+                # Логирование для отладки (покадровое, только на уровне DEBUG)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("SSE update for frame %d: %d keypoints_2d", current_frame, len(keypoints_2d_data),
+                                 extra={'processing_id': processing.id})
                 
-                yield f"data: {json.dumps(update)}\n\n"
+                yield f"data: {json.dumps(update, default=json_default)}\n\n"
                 last_frame = current_frame
             
             # Если обработка завершена или провалилась, отправляем финальное сообщение
-            if data.get('status') in ['completed', 'failed']:
+            if data.get('status') in ['completed', 'completed_with_warnings', 'failed']:
                 final_message = {
-                    'type': 'complete' if data.get('status') == 'completed' else 'error',
+                    'type': 'error' if data.get('status') == 'failed' else 'complete',
                     'id': processing.id,
                     'status': data.get('status'),
                     'processed_frames': current_frame,
@@ -122,9 +187,11 @@ async def get_processing_data_stream(id: str):
                     'trajectory': data.get('trajectory', []),
                     'keypoints_2d': data.get('keypoints_2d', []),  # Добавляем 2D точки!
                     'all_map_points': data.get('all_map_points', []),
+                    'segments': data.get('segments', []),
+                    'warning': data.get('warning'),
                     'error': data.get('error')
                 }
-                yield f"data: {json.dumps(final_message)}\n\n"
+                yield f"data: {json.dumps(final_message, default=json_default)}\n\n"
                 break
             
             # Ждем перед следующей проверкой
@@ -142,10 +209,11 @@ async def get_processing_data_stream(id: str):
 
 
 @router.get("/processing/{id}/video")
-async def get_processing_video(id: str):
+async def get_processing_video(id: str, request: Request):
     """
     Получение видеофайла по ID обработки.
-    Возвращает оригинальный видеофайл для воспроизведения.
+    Возвращает видео для воспроизведения (fast-start MP4, если ремукс готов,
+    иначе оригинал) с поддержкой Range, ETag и Last-Modified.
     """
     store = get_store()
     processing = store.get(id)
@@ -155,7 +223,7 @@ async def get_processing_video(id: str):
     
     # Получаем путь к видеофайлу из данных обработки
     data = processing.data or {}
-    video_path = data.get('video_path')
+    video_path = get_playback_path(data)
     
     if not video_path:
         raise HTTPException(status_code=404, detail="Video path not found in processing data")
@@ -164,14 +232,251 @@ async def get_processing_video(id: str):
     if not os.path.exists(video_path):
         raise HTTPException(status_code=404, detail=f"Video file not found: {video_path}")
     
-    # Возвращаем видеофайл с правильными headers для streaming
-    return FileResponse(
-        path=video_path,
-        media_type="video/mp4",
-        headers={
-            "Accept-Ranges": "bytes",
-            "Content-Disposition": f"inline; filename=\"video_{id}.mp4\"",
-            "Cache-Control": "public, max-age=3600"
-        }
+    extension = Path(video_path).suffix or ".mp4"
+    return build_file_response(
+        video_path,
+        request.headers,
+        download_name=f"video_{id}{extension}"
+    )
+
+
+@router.get("/processing/{id}/preview")
+async def get_processing_preview(id: str, request: Request):
+    """
+    Превью видео низкого разрешения для просмотра рядом с траекторией.
+    Пока превью не готово, отдаётся исходное видео без долгого кеширования.
+    """
+    store = get_store()
+    processing = store.get(id)
+    
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+    
+    data = processing.data or {}
+    preview_path = data.get('preview_path')
+    
+    if preview_path and os.path.exists(preview_path):
+        return build_file_response(
+            preview_path,
+            request.headers,
+            download_name=f"preview_{id}.mp4",
+            cache_control="public, max-age=86400"
+        )
+    
+    video_path = get_playback_path(data)
+    if not video_path or not os.path.exists(video_path):
+        raise HTTPException(status_code=404, detail="Video file not found")
+    
+    return build_file_response(video_path, request.headers, cache_control="no-cache")
+
+
+@router.get("/processing/{id}/thumbnails")
+async def get_processing_thumbnails(id: str):
+    """
+    Метаданные спрайта миниатюр: размер плитки, сетка и таймстемпы кадров.
+    """
+    store = get_store()
+    processing = store.get(id)
+    
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+    
+    thumbnails = (processing.data or {}).get('thumbnails')
+    if not thumbnails:
+        raise HTTPException(status_code=404, detail="Thumbnails are not ready yet")
+    
+    return JSONResponse(
+        content={**thumbnails, 'sprite_url': f"/api/processing/{id}/thumbnails.jpg"},
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
+
+
+@router.get("/processing/{id}/thumbnails.jpg")
+async def get_processing_thumbnail_sprite(id: str, request: Request):
+    """
+    JPEG-спрайт миниатюр по ключевым кадрам.
+    """
+    store = get_store()
+    processing = store.get(id)
+    
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+    
+    sprite_path = (processing.data or {}).get('sprite_path')
+    if not sprite_path or not os.path.exists(sprite_path):
+        raise HTTPException(status_code=404, detail="Thumbnails are not ready yet")
+    
+    return build_file_response(sprite_path, request.headers, cache_control="public, max-age=86400")
+
+
+def _parse_floats(value: Optional[str], expected: int, name: str) -> Optional[List[float]]:
+    if value is None:
+        return None
+    try:
+        numbers = [float(v) for v in value.split(',')]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be comma-separated numbers")
+    if len(numbers) != expected:
+        raise HTTPException(status_code=400, detail=f"{name} must contain {expected} numbers")
+    return numbers
+
+
+def _processing_point_map(processing) -> VoxelPointCloud:
+    """
+    Живая карта идущей обработки, иначе полная карта, сохранённая при
+    завершении (services.result_service), иначе — выборка all_map_points.
+    """
+    point_map = get_point_map(processing.id)
+    if point_map is None:
+        point_map = load_result_point_map(processing.id)
+    if point_map is not None:
+        return point_map
+    # Полной карты нет (обработка упала или результат уже убран) — только выборка для клиентов
+    stored = (processing.data or {}).get('all_map_points') or []
+    point_map = VoxelPointCloud()
+    point_map.add(np.array([[p['x'], p['y'], p['z']] for p in stored], dtype=np.float32).reshape(-1, 3))
+    return point_map
+
+
+def _processing_map_points(processing_id: str) -> Optional[np.ndarray]:
+    """Полная карта для выгрузки: живая карта идущей обработки или сохранённая при завершении."""
+    point_map = get_point_map(processing_id)
+    if point_map is not None:
+        return point_map.points.copy()
+    return load_result_points(processing_id)
+
+
+def _encoded_response(content: bytes, filename: str) -> Response:
+    return Response(content, media_type="application/octet-stream",
+                    headers={"content-disposition": f"attachment; filename=\"{filename}\""})
+
+
+@router.get("/processing/{id}/map")
+async def get_processing_map(
+    id: str,
+    max_points: int = Query(20000, ge=1, le=1_000_000),
+    bbox: Optional[str] = Query(None, description="min_x,min_y,min_z,max_x,max_y,max_z"),
+    view: Optional[str] = Query(None, description="16 чисел: матрица world -> camera 4x4 по строкам"),
+    fov: float = Query(60.0, gt=0, lt=180),
+    aspect: float = Query(16.0 / 9.0, gt=0),
+    near: float = Query(0.01, ge=0),
+    far: float = Query(1000.0, gt=0),
+):
+    """
+    Карта точек с уровнем детализации под бюджет клиента.
+    
+    Сервер выбирает самый детальный воксельный уровень, в котором точек
+    не больше max_points. Опционально карта обрезается боксом (bbox)
+    или пирамидой видимости камеры (view + fov/aspect/near/far).
+    """
+    store = get_store()
+    processing = store.get(id)
+    
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+    
+    bbox_values = _parse_floats(bbox, 6, 'bbox')
+    view_values = _parse_floats(view, 16, 'view')
+    view_matrix = np.array(view_values, dtype=np.float32).reshape(4, 4) if view_values else None
+    
+    point_map = await asyncio.to_thread(_processing_point_map, processing)
+    
+    points, voxel_size, points_in_region = await asyncio.to_thread(
+        point_map.sample,
+        max_points,
+        bbox=bbox_values,
+        view=view_matrix,
+        fov=fov,
+        aspect=aspect,
+        near=near,
+        far=far
     )
+    
+    return {
+        'id': id,
+        'total_points': len(point_map),
+        'points_in_region': points_in_region,
+        'returned_points': len(points),
+        'voxel_size': voxel_size,
+        'points': points_to_dicts(points)
+    }
+
+
+@router.get("/processing/{id}/export/map")
+async def export_processing_map(id: str, precision: str = Query('q16', pattern='^(q16|f32)$')):
+    """
+    Полная карта точек в двоичном формате services.codec_service:
+    q16 — 16-битные координаты в bbox карты, f32 — без потерь.
+    """
+    processing = get_store().get(id)
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+    
+    points = await asyncio.to_thread(_processing_map_points, id)
+    if points is None:
+        # Выборка all_map_points — не полная карта, выдавать её за выгрузку нельзя
+        raise HTTPException(status_code=404, detail=f"Full map of processing {id} is not available")
+    content = await asyncio.to_thread(encode_points, points, precision)
+    return _encoded_response(content, f"map_{id}.slmq")
+
+
+@router.get("/processing/{id}/export/trajectory")
+async def export_processing_trajectory(id: str, precision: str = Query('q16', pattern='^(q16|f32)$')):
+    """
+    Траектория в двоичном формате services.codec_service: номера кадров
+    и участков разностным кодом, позы — q16 или f32 (без потерь).
+    """
+    processing = get_store().get(id)
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+    
+    trajectory = processing.data.get('trajectory') or []
+    content = await asyncio.to_thread(encode_trajectory, trajectory, precision)
+    return _encoded_response(content, f"trajectory_{id}.slmq")
 
+
+@router.get("/processing/{id}/profile")
+async def get_processing_profile(id: str):
+    """
+    Профиль покадрового цикла обработки: p50/p95/p99 и доля времени по стадиям.
+    """
+    store = get_store()
+    processing = store.get(id)
+    
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+    
+    if not processing.profile:
+        raise HTTPException(status_code=404, detail="Profile is not available for this processing")
+    
+    data = processing.data or {}
+    return {
+        'id': id,
+        'status': data.get('status'),
+        'processed_frames': data.get('processed_frames', 0),
+        **processing.profile.report()
+    }
+
+
+@router.get("/processing/{id}/memory")
+async def get_processing_memory(id: str):
+    """
+    Память процесса за время обработки: RSS/USS/нативная куча в начале, по ходу
+    и в конце, дельты вокруг создания и остановки SLAM, размер data.
+    """
+    store = get_store()
+    processing = store.get(id)
+    
+    if not processing:
+        raise HTTPException(status_code=404, detail=f"Processing with id {id} not found")
+    
+    if not processing.memory:
+        raise HTTPException(status_code=404, detail="Memory report is not available for this processing")
+    
+    data = processing.data or {}
+    return {
+        'id': id,
+        'status': data.get('status'),
+        'processed_frames': data.get('processed_frames', 0),
+        **processing.memory.report()
+    }
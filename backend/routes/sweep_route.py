@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, BackgroundTasks
+from pydantic import BaseModel
+from store import get_store
+from services.sweep_service import SWEEP_MAX_CONFIGS, run_sweep, validate_overrides
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+
+router = APIRouter()
+
+
+class SweepConfig(BaseModel):
+    name: str
+    overrides: Dict[str, Union[int, float, str]] = {}
+
+
+class SweepRequest(BaseModel):
+    file_id: str
+    configs: List[SweepConfig]
+    max_frames: Optional[int] = None
+
+
+@router.post("/sweep")
+async def start_sweep(request: SweepRequest, background_tasks: BackgroundTasks):
+    """
+    Перебор параметров ORB-SLAM3 на одном загруженном видео: кадры
+    декодируются один раз и параллельно идут во все наборы параметров.
+    Прогресс каждого набора (processed_frames) и итог — /api/sweep/{id}.
+    """
+    if not 1 <= len(request.configs) <= SWEEP_MAX_CONFIGS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {SWEEP_MAX_CONFIGS} configs are allowed")
+    names = [config.name for config in request.configs]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="Config names must be unique")
+    try:
+        for config in request.configs:
+            validate_overrides(config.overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    video_files = list(Path("uploads").glob(f"{request.file_id}.*"))
+    if not video_files:
+        raise HTTPException(status_code=404, detail=f"Video file with id {request.file_id} not found")
+    video_path = str(video_files[0])
+
+    configs = [{'name': config.name, 'overrides': config.overrides} for config in request.configs]
+    sweep = get_store().add(
+        processing_type='sweep',
+        data={
+            'file_id': request.file_id,
+            'video_path': video_path,
+            'configs': configs,
+            'max_frames': request.max_frames,
+            'status': 'queued'
+        }
+    )
+    background_tasks.add_task(run_sweep, sweep.id, video_path, configs, request.max_frames)
+    return {"sweep_id": sweep.id, "video_path": video_path}
+
+
+@router.get("/sweep/{id}")
+def get_sweep(id: str):
+    """Таблица сравнения наборов параметров (заполняется по мере готовности)."""
+    sweep = get_store().get(id)
+    if not sweep or sweep.type != 'sweep':
+        raise HTTPException(status_code=404, detail=f"Sweep with id {id} not found")
+    return {'id': id, **(sweep.data or {})}
@@ -1,22 +1,36 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Response
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Response, Query
 from fastapi.responses import StreamingResponse
 from controllers.upload_controller import upload_controller, upload_controller_with_progress
-from services.processing_service import start_processing
+from services.dispatch_service import dispatch_processing
+from services.media_service import spawn_media_pipeline
+from services.map_library_service import get_map
 from store import get_store
+import asyncio
 import json
+from typing import Optional
 
 
 router = APIRouter()
 
 
+def _check_map(map_name: Optional[str]) -> None:
+    if map_name and get_map(map_name) is None:
+        raise HTTPException(status_code=404, detail=f"Map {map_name} not found")
+
+
 @router.post("/upload")
-async def upload_video(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
-    """Загрузка видео файла и автоматический запуск обработки"""
+async def upload_video(file: UploadFile = File(...), background_tasks: BackgroundTasks = None,
+                       map: Optional[str] = Query(None)):
+    """
+    Загрузка видео файла и автоматический запуск обработки.
+    С ?map=<имя> видео обрабатывается в режиме локализации по карте из библиотеки.
+    """
     if file.content_type not in {"video/mp4", "video/mpeg", "video/quicktime", "video/x-msvideo", "video/x-matroska"}:
         raise HTTPException(
             status_code=400, 
             detail="Unsupported content type. Use video/mp4, video/mpeg, video/quicktime, video/x-msvideo or video/x-matroska"
         )
+    _check_map(map)
     
     data = await file.read()
     
@@ -33,6 +47,7 @@ async def upload_video(file: UploadFile = File(...), background_tasks: Backgroun
                 'video_path': file_path,
                 'filename': unique_filename,
                 'original_filename': file.filename,
+                'localization_map': map,
                 'status': 'queued'
             }
         )
@@ -41,7 +56,9 @@ async def upload_video(file: UploadFile = File(...), background_tasks: Backgroun
         
         # Запускаем обработку в фоне
         async def run_processing():
-            await start_processing(processing_id, file_path)
+            # Медиа-стадия идёт параллельно с SLAM, не задерживая его старт
+            spawn_media_pipeline(processing_id)
+            await dispatch_processing(processing_id, file_path)
         
         if background_tasks:
             background_tasks.add_task(run_processing)
@@ -60,13 +77,14 @@ async def upload_video(file: UploadFile = File(...), background_tasks: Backgroun
 
 
 @router.post("/upload/stream")
-async def upload_video_with_progress(file: UploadFile = File(...)):
+async def upload_video_with_progress(file: UploadFile = File(...), map: Optional[str] = Query(None)):
     """Загрузка видео с отображением прогресса через Server-Sent Events и автоматический запуск обработки"""
     if file.content_type not in {"video/mp4", "video/mpeg", "video/quicktime", "video/x-msvideo", "video/x-matroska"}:
         raise HTTPException(
             status_code=400, 
             detail="Unsupported content type. Use video/mp4, video/mpeg, video/quicktime, video/x-msvideo or video/x-matroska"
         )
+    _check_map(map)
     
     data = await file.read()
     
@@ -92,6 +110,7 @@ async def upload_video_with_progress(file: UploadFile = File(...)):
                             'file_id': file_id,
                             'video_path': file_path,
                             'filename': update.get('filename'),
+                            'localization_map': map,
                             'status': 'queued'
                         }
                     )
@@ -102,8 +121,8 @@ async def upload_video_with_progress(file: UploadFile = File(...)):
                     yield f"data: {json.dumps({'type': 'processing_started', 'processing_id': processing_id, 'file_id': file_id})}\n\n"
                     
                     # Запускаем обработку в фоне
-                    import asyncio
-                    asyncio.create_task(start_processing(processing_id, file_path))
+                    asyncio.create_task(dispatch_processing(processing_id, file_path))
+                    spawn_media_pipeline(processing_id)
                     
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
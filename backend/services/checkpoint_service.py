@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.codec_service import decode_points, decode_trajectory, encode_points, encode_trajectory
+from log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Каталог чекпоинтов (относительно рабочего каталога, как media/ и uploads/).
+# В режиме очереди он должен лежать на общем томе вместе с uploads/.
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_ENABLED = os.environ.get("CHECKPOINTS", "1") != "0"
+# Чекпоинт пишется не чаще, чем раз в CHECKPOINT_INTERVAL секунд обработки
+CHECKPOINT_INTERVAL = float(os.environ.get("CHECKPOINT_INTERVAL", "120"))
+# Покадровые поля не имеет смысла восстанавливать — они перезапишутся первым же кадром
+TRANSIENT_DATA_KEYS = ('tracked_points', 'keypoints_2d', 'status', 'error', 'warning')
+# Выборка карты для клиентов строится заново из полной карты, траектория хранится отдельно
+ENCODED_DATA_KEYS = ('all_map_points', 'trajectory')
+
+_STATE_FILE = "state.json"
+# Карта и траектория в формате codec_service, всегда f32: возобновление не должно
+# терять точность, RESULT_PRECISION относится только к выдаче клиентам
+_MAP_FILE = "map.slmq"
+_TRAJECTORY_FILE = "trajectory.slmq"
+_ATLAS_NAME = "atlas"
+
+
+def checkpoint_path(processing_id: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, processing_id)
+
+
+def atlas_base(processing_id: str) -> str:
+    """
+    Путь к атласу без расширения: ORB-SLAM3 сам дописывает .osa и ищет файл
+    относительно рабочего каталога, поэтому путь остаётся относительным.
+    """
+    return os.path.join(checkpoint_path(processing_id), _ATLAS_NAME)
+
+
+def _replace_atomically(path: str, write) -> None:
+    temp_path = f"{path}.next"
+    with open(temp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def save_checkpoint(
+    processing_id: str,
+    processing_type: str,
+    video_path: str,
+    frame_idx: int,
+    data: Dict,
+    map_points: Optional[np.ndarray] = None,
+    runner=None,
+) -> Dict:
+    """
+    Сохраняет чекпоинт обработки: атлас ORB-SLAM3 (через обёртку), полную
+    карту точек и снимок Processing.data. Блокирующая функция — вызывать
+    через asyncio.to_thread, пока цикл обработки стоит на await.
+
+    state.json пишется последним и служит точкой фиксации: до его замены
+    при падении остаётся предыдущий целый чекпоинт. Карта и траектория
+    лежат рядом в компактном двоичном формате (services.codec_service).
+
+    Args:
+        processing_id: ID обработки
+        processing_type: Тип обработки из store
+        video_path: Путь к исходному видео
+        frame_idx: Индекс следующего кадра для обработки
+        data: Снимок Processing.data
+        map_points: Полная накопленная карта N×3
+        runner: OrbslamMonoRunner, атлас которого нужно сохранить
+
+    Returns:
+        Содержимое state.json
+    """
+    start = time.perf_counter()
+    directory = checkpoint_path(processing_id)
+    os.makedirs(directory, exist_ok=True)
+
+    atlas_saved = False
+    if runner is not None:
+        base = atlas_base(processing_id)
+        try:
+            if runner.save_atlas(f"{base}.next"):
+                os.replace(f"{base}.next.osa", f"{base}.osa")
+                atlas_saved = True
+        except Exception as e:
+            logger.warning("Failed to save atlas: %s", e, extra={'processing_id': processing_id})
+
+    if map_points is not None:
+        map_blob = encode_points(map_points, 'f32')
+        _replace_atomically(os.path.join(directory, _MAP_FILE), lambda f: f.write(map_blob))
+    trajectory_blob = encode_trajectory(data.get('trajectory') or [], 'f32')
+    _replace_atomically(os.path.join(directory, _TRAJECTORY_FILE), lambda f: f.write(trajectory_blob))
+
+    state = {
+        'processing_id': processing_id,
+        'processing_type': processing_type,
+        'video_path': video_path,
+        'frame_idx': frame_idx,
+        'atlas': atlas_saved or os.path.exists(f"{atlas_base(processing_id)}.osa"),
+        'saved_at': time.time(),
+        'data': {key: value for key, value in data.items()
+                 if key not in TRANSIENT_DATA_KEYS and key not in ENCODED_DATA_KEYS},
+    }
+    payload = json.dumps(state, default=str).encode()
+    _replace_atomically(os.path.join(directory, _STATE_FILE), lambda f: f.write(payload))
+
+    logger.info("Checkpoint saved at frame %d in %.2fs (atlas: %s)", frame_idx, time.perf_counter() - start,
+                state['atlas'], extra={'processing_id': processing_id})
+    return state
+
+
+def load_checkpoint(processing_id: str) -> Optional[Dict]:
+    """
+    Читает последний чекпоинт обработки.
+
+    Returns:
+        Содержимое state.json плюс 'map_points' (N×3 или None) и 'atlas_path'
+        (путь без .osa или None), либо None, если чекпоинта нет. Траектория
+        возвращается в data['trajectory'], выборки карты (all_map_points) нет
+    """
+    directory = checkpoint_path(processing_id)
+    try:
+        with open(os.path.join(directory, _STATE_FILE), 'r') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Ignoring unreadable checkpoint: %s", e, extra={'processing_id': processing_id})
+        return None
+
+    try:
+        state['map_points'] = _load_map(directory)
+        trajectory_file = os.path.join(directory, _TRAJECTORY_FILE)
+        if os.path.exists(trajectory_file):
+            with open(trajectory_file, 'rb') as f:
+                state['data']['trajectory'] = decode_trajectory(f.read())
+    except ValueError as e:
+        logger.warning("Ignoring unreadable checkpoint: %s", e, extra={'processing_id': processing_id})
+        return None
+    base = atlas_base(processing_id)
+    state['atlas_path'] = base if state.get('atlas') and os.path.exists(f"{base}.osa") else None
+    return state
+
+
+def _load_map(directory: str) -> Optional[np.ndarray]:
+    map_file = os.path.join(directory, _MAP_FILE)
+    if os.path.exists(map_file):
+        with open(map_file, 'rb') as f:
+            return decode_points(f.read())
+    return None
+
+
+def list_checkpoints() -> List[Dict]:
+    """Состояния всех чекпоинтов на диске (без карты точек)."""
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return []
+
+    states = []
+    for processing_id in sorted(os.listdir(CHECKPOINT_DIR)):
+        try:
+            with open(os.path.join(CHECKPOINT_DIR, processing_id, _STATE_FILE), 'r') as f:
+                states.append(json.load(f))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        except Exception as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", processing_id, e)
+    return states
+
+
+def delete_checkpoint(processing_id: str) -> None:
+    shutil.rmtree(checkpoint_path(processing_id), ignore_errors=True)
@@ -0,0 +1,211 @@
+"""
+Компактное двоичное кодирование карт точек и траекторий — для файлов
+на диске (чекпоинты, библиотека карт) и выгрузки через API.
+
+Формат (little endian):
+
+    заголовок   magic b'SLMQ', version u8, kind u8 (1 — точки, 2 — траектория),
+                precision u8 (0 — f32, 1 — q16), reserved u8, count u32
+
+    точки       f32: count×3 float32
+                q16: bbox min 3×f32, bbox max 3×f32, count×3 uint16 —
+                     координата = min + q / 65535 × (max − min)
+
+    траектория  номера кадров: первый i64, width u8, count−1 разностей
+                в zigzag-коде как uintW (W = width байт); то же для номеров
+                участков;
+                позы — верхние 3 строки матриц 4×4:
+                f32: count×12 float32
+                q16: bbox переносов (2×3 f32), count×3 uint16 переносов,
+                     count×9 int16 поворотов — элемент = q / 32767
+
+Погрешность q16: шаг bbox/65535 по каждой оси для точек и переносов
+(2 см на карте в километр), ~3e-5 для элементов матрицы поворота. f32
+хранит значения без потерь.
+"""
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+PRECISIONS = ('q16', 'f32')
+# Точность для сохраняемых результатов (чекпоинты, карты); f32 — без потерь
+RESULT_PRECISION = os.environ.get("RESULT_PRECISION", "q16")
+
+MAGIC = b'SLMQ'
+VERSION = 1
+KIND_POINTS = 1
+KIND_TRAJECTORY = 2
+_PRECISION_CODES = {'f32': 0, 'q16': 1}
+_PRECISION_NAMES = {code: name for name, code in _PRECISION_CODES.items()}
+_HEADER = struct.Struct('<4sBBBBI')
+_Q16_MAX = 65535
+_ROTATION_SCALE = 32767
+
+
+def _check_precision(precision: str) -> int:
+    if precision not in _PRECISION_CODES:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+    return _PRECISION_CODES[precision]
+
+
+def _quantize(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """N×3 → (min, max, N×3 uint16) по bbox значений."""
+    if len(values) == 0:
+        zeros = np.zeros(3, dtype=np.float32)
+        return zeros, zeros, np.empty((0, 3), dtype='<u2')
+    low = values.min(axis=0).astype(np.float32)
+    high = values.max(axis=0).astype(np.float32)
+    extent = np.where(high > low, high.astype(np.float64) - low, 1.0)
+    scaled = np.rint((values - low) / extent * _Q16_MAX)
+    return low, high, np.clip(scaled, 0, _Q16_MAX).astype('<u2')
+
+
+def _dequantize(low: np.ndarray, high: np.ndarray, quantized: np.ndarray) -> np.ndarray:
+    extent = (high.astype(np.float64) - low)
+    return (low + quantized.astype(np.float64) / _Q16_MAX * extent).astype(np.float32)
+
+
+_DELTA_HEADER = struct.Struct('<qB')
+
+
+def _encode_deltas(values: np.ndarray) -> bytes:
+    """Целые → первый элемент и разности (zigzag) минимальной ширины: 1 байт на кадр подряд."""
+    if len(values) == 0:
+        return _DELTA_HEADER.pack(0, 1)
+    deltas = np.diff(values.astype(np.int64))
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+    largest = int(zigzag.max()) if len(zigzag) else 0
+    width = 1 if largest < 2 ** 8 else 2 if largest < 2 ** 16 else 4 if largest < 2 ** 32 else 8
+    return _DELTA_HEADER.pack(int(values[0]), width) + zigzag.astype(f'<u{width}').tobytes()
+
+
+def _decode_deltas(buffer: memoryview, offset: int, count: int) -> Tuple[np.ndarray, int]:
+    first, width = _DELTA_HEADER.unpack_from(buffer, offset)
+    offset += _DELTA_HEADER.size
+    if count == 0:
+        return np.empty(0, dtype=np.int64), offset
+    zigzag = np.frombuffer(buffer, dtype=f'<u{width}', count=count - 1, offset=offset).astype(np.uint64)
+    offset += (count - 1) * width
+    deltas = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+    return np.concatenate(([first], first + np.cumsum(deltas))), offset
+
+
+def _read_header(blob: bytes, kind: int) -> Tuple[str, int]:
+    if len(blob) < _HEADER.size:
+        raise ValueError("Truncated encoded data")
+    magic, version, blob_kind, precision, _, count = _HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an encoded point cloud or trajectory")
+    if version != VERSION:
+        raise ValueError(f"Unsupported encoding version {version}")
+    if blob_kind != kind:
+        raise ValueError(f"Expected kind {kind}, got {blob_kind}")
+    if precision not in _PRECISION_NAMES:
+        raise ValueError(f"Unknown precision code {precision}")
+    return _PRECISION_NAMES[precision], count
+
+
+def encode_points(points: np.ndarray, precision: str = RESULT_PRECISION) -> bytes:
+    """
+    Args:
+        points: Облако N×3
+        precision: 'q16' (6 байт на точку) или 'f32' (без потерь, 12 байт)
+    """
+    code = _check_precision(precision)
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    header = _HEADER.pack(MAGIC, VERSION, KIND_POINTS, code, 0, len(points))
+    if precision == 'f32':
+        return header + points.astype('<f4').tobytes()
+    low, high, quantized = _quantize(points)
+    return header + low.astype('<f4').tobytes() + high.astype('<f4').tobytes() + quantized.tobytes()
+
+
+def decode_points(blob: bytes) -> np.ndarray:
+    """
+    Returns:
+        Облако N×3 float32
+
+    Raises:
+        ValueError: Данные повреждены или это не облако точек
+    """
+    precision, count = _read_header(blob, KIND_POINTS)
+    buffer = memoryview(blob)
+    offset = _HEADER.size
+    try:
+        if precision == 'f32':
+            return np.frombuffer(buffer, dtype='<f4', count=count * 3, offset=offset).reshape(-1, 3).astype(np.float32)
+        low = np.frombuffer(buffer, dtype='<f4', count=3, offset=offset)
+        high = np.frombuffer(buffer, dtype='<f4', count=3, offset=offset + 12)
+        quantized = np.frombuffer(buffer, dtype='<u2', count=count * 3, offset=offset + 24).reshape(-1, 3)
+    except ValueError as e:
+        raise ValueError("Truncated encoded data") from e
+    return _dequantize(low, high, quantized)
+
+
+def encode_trajectory(trajectory: List[Dict], precision: str = RESULT_PRECISION) -> bytes:
+    """
+    Args:
+        trajectory: Записи Processing.data['trajectory']: {'frame', 'pose' (4×4), 'segment'}
+        precision: 'q16' или 'f32' (без потерь)
+    """
+    code = _check_precision(precision)
+    count = len(trajectory)
+    frames = np.fromiter((entry['frame'] for entry in trajectory), dtype=np.int64, count=count)
+    segments = np.fromiter((entry.get('segment') or 0 for entry in trajectory), dtype=np.int64, count=count)
+    poses = np.asarray([entry['pose'] for entry in trajectory], dtype=np.float32).reshape(-1, 4, 4)
+
+    parts = [_HEADER.pack(MAGIC, VERSION, KIND_TRAJECTORY, code, 0, count),
+             _encode_deltas(frames), _encode_deltas(segments)]
+    if precision == 'f32':
+        parts.append(poses[:, :3, :].astype('<f4').tobytes())
+    else:
+        low, high, translations = _quantize(poses[:, :3, 3])
+        rotations = np.clip(np.rint(poses[:, :3, :3] * _ROTATION_SCALE), -_ROTATION_SCALE, _ROTATION_SCALE)
+        parts += [low.astype('<f4').tobytes(), high.astype('<f4').tobytes(), translations.tobytes(),
+                  rotations.astype('<i2').tobytes()]
+    return b''.join(parts)
+
+
+def decode_trajectory(blob: bytes) -> List[Dict]:
+    """
+    Returns:
+        Записи траектории в формате Processing.data['trajectory']
+
+    Raises:
+        ValueError: Данные повреждены или это не траектория
+    """
+    precision, count = _read_header(blob, KIND_TRAJECTORY)
+    buffer = memoryview(blob)
+    try:
+        frames, offset = _decode_deltas(buffer, _HEADER.size, count)
+        segments, offset = _decode_deltas(buffer, offset, count)
+        poses = np.zeros((count, 4, 4), dtype=np.float32)
+        poses[:, 3, 3] = 1.0
+        if precision == 'f32':
+            poses[:, :3, :] = np.frombuffer(buffer, dtype='<f4', count=count * 12, offset=offset).reshape(-1, 3, 4)
+        else:
+            low = np.frombuffer(buffer, dtype='<f4', count=3, offset=offset)
+            high = np.frombuffer(buffer, dtype='<f4', count=3, offset=offset + 12)
+            offset += 24
+            translations = np.frombuffer(buffer, dtype='<u2', count=count * 3, offset=offset).reshape(-1, 3)
+            offset += count * 6
+            rotations = np.frombuffer(buffer, dtype='<i2', count=count * 9, offset=offset).reshape(-1, 3, 3)
+            poses[:, :3, 3] = _dequantize(low, high, translations)
+            poses[:, :3, :3] = rotations.astype(np.float32) / _ROTATION_SCALE
+    except (ValueError, struct.error) as e:
+        raise ValueError("Truncated encoded data") from e
+    return [{'frame': int(frame), 'pose': pose.tolist(), 'segment': int(segment)}
+            for frame, pose, segment in zip(frames, poses, segments)]
+
+
+def save_points(path: str, points: np.ndarray, precision: Optional[str] = None) -> None:
+    with open(path, 'wb') as f:
+        f.write(encode_points(points, precision or RESULT_PRECISION))
+
+
+def load_points(path: str) -> np.ndarray:
+    with open(path, 'rb') as f:
+        return decode_points(f.read())
@@ -0,0 +1,111 @@
+import asyncio
+from typing import Optional, Set
+
+from store import PROCESSING_MODE, get_job_queue, get_store
+from services.processing_service import start_processing
+from services.checkpoint_service import CHECKPOINT_ENABLED, list_checkpoints
+from log import get_logger
+
+
+logger = get_logger(__name__)
+
+QUEUE_SYNC_INTERVAL = 0.2
+FINISHED_STATUSES = {'completed', 'completed_with_warnings', 'failed'}
+
+# Ссылки на возобновлённые обработки: на задачу без ссылки event loop держит
+# только слабую, и сборщик мусора может убрать её посреди работы
+_resumed_tasks: Set[asyncio.Task] = set()
+
+
+async def dispatch_processing(processing_id: str, video_path: str) -> Optional[str]:
+    """
+    Запускает обработку в зависимости от PROCESSING_MODE.
+
+    local — прямо в этом процессе (как раньше); queue — ставит задачу в общую
+    очередь, откуда её заберёт воркер (python -m worker), а прогресс вернётся
+    в store через sync_from_queue().
+    """
+    if PROCESSING_MODE != 'queue':
+        return await start_processing(processing_id, video_path)
+
+    store = get_store()
+    processing = store.get(processing_id)
+    if not processing:
+        logger.error("Processing %s not found in store", processing_id)
+        return None
+
+    await asyncio.to_thread(
+        get_job_queue().enqueue,
+        processing_id,
+        video_path,
+        processing.data.to_dict(),
+        processing.type
+    )
+    logger.info("Queued processing %s for workers", processing_id)
+    return processing_id
+
+
+async def sync_from_queue(interval: float = QUEUE_SYNC_INTERVAL) -> None:
+    """
+    Переносит прогресс задач из общей очереди в локальный store API-узла,
+    чтобы SSE и остальные эндпоинты работали без изменений.
+
+    Читает с начала (seq = 0): очередь хранит живые задачи и последние
+    JOB_QUEUE_KEPT завершённых, прогресс которых уже свёрнут в итоговые
+    ключи, поэтому новый узел подтягивает ограниченный объём.
+    """
+    queue = get_job_queue()
+    store = get_store()
+    seq = 0
+
+    while True:
+        try:
+            seq, changes = await asyncio.to_thread(queue.changes_since, seq)
+        except Exception as e:
+            logger.warning("Queue sync failed: %s", e)
+            await asyncio.sleep(interval)
+            continue
+
+        for change in changes:
+            processing_id = change['processing_id']
+            data = change['data']
+            if store.get(processing_id) is None:
+                store.add(processing_type=change['processing_type'], data={}, processing_id=processing_id)
+            # Из очереди приходят только изменения: дописанное к траектории — через append
+            store.update_data(processing_id, data, append=change['append'])
+            if data.get('status') in FINISHED_STATUSES:
+                store.set_active(processing_id, False)
+
+        if not changes:
+            await asyncio.sleep(interval)
+
+
+def resume_interrupted_jobs() -> int:
+    """
+    Возобновляет обработки, прерванные перезапуском сервера: у них на диске
+    остался чекпоинт. start_processing сам продолжит с сохранённого кадра.
+
+    В режиме очереди не нужен — брошенные задачи возвращает в очередь
+    requeue_stale, и воркер находит тот же чекпоинт на общем томе.
+
+    Returns:
+        Количество возобновлённых обработок
+    """
+    if not CHECKPOINT_ENABLED or PROCESSING_MODE == 'queue':
+        return 0
+
+    store = get_store()
+    resumed = 0
+    for state in list_checkpoints():
+        processing_id = state['processing_id']
+        if store.get(processing_id) is not None:
+            continue
+        data = dict(state.get('data') or {})
+        data['status'] = 'queued'
+        store.add(processing_type=state['processing_type'], data=data, processing_id=processing_id)
+        task = asyncio.create_task(dispatch_processing(processing_id, state['video_path']))
+        _resumed_tasks.add(task)
+        task.add_done_callback(_resumed_tasks.discard)
+        logger.info("Resuming interrupted processing %s from frame %d", processing_id, state['frame_idx'])
+        resumed += 1
+    return resumed
@@ -0,0 +1,127 @@
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# Хвост отключённого потребителя: больше не сдерживает производителя
+_DETACHED = 1 << 62
+
+
+class SharedFrameRing:
+    """
+    Кольцевой буфер кадров в общей памяти: один производитель (декодер),
+    несколько потребителей в других процессах, каждый читает все кадры.
+
+    Слот освобождается, когда его отпустили все потребители, поэтому
+    потребитель получает view без копирования и держит его до release().
+    Объект передаётся в multiprocessing.Process как аргумент; в дочернем
+    процессе общая память подключается заново по имени.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], slots: int, consumers: int,
+                 context: Optional[multiprocessing.context.BaseContext] = None):
+        context = context or multiprocessing.get_context()
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.consumers = consumers
+        frame_bytes = int(np.prod(self.shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=frame_bytes * slots)
+        self._owner = True
+        self._condition = context.Condition()
+        self._head = context.Value('q', 0, lock=False)
+        self._closed = context.Value('b', 0, lock=False)
+        self._tails = context.Array('q', consumers, lock=False)
+        self._frames = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shm_name'] = self._shm.name
+        del state['_shm']
+        state['_frames'] = None
+        state['_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        name = state.pop('_shm_name')
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def frames(self) -> np.ndarray:
+        if self._frames is None:
+            self._frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=self._shm.buf)
+        return self._frames
+
+    # ---------- производитель ----------
+    def _has_room(self) -> bool:
+        return self._head.value - min(self._tails) < self.slots
+
+    def put(self, frame: np.ndarray, timeout: Optional[float] = None) -> bool:
+        """
+        Кладёт кадр, ожидая свободный слот.
+
+        Returns:
+            False, если слот не освободился за timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(self._has_room, timeout):
+                return False
+            index = self._head.value
+        # Слот index % slots никто не читает, пока head не сдвинут
+        self.frames[index % self.slots] = frame
+        with self._condition:
+            self._head.value = index + 1
+            self._condition.notify_all()
+        return True
+
+    def close(self) -> None:
+        """Конец потока: потребители получат None после последнего кадра."""
+        with self._condition:
+            self._closed.value = 1
+            self._condition.notify_all()
+
+    def detach(self, consumer: int) -> None:
+        """Отключает упавшего потребителя, чтобы он не блокировал остальных."""
+        with self._condition:
+            self._tails[consumer] = _DETACHED
+            self._condition.notify_all()
+
+    @property
+    def produced(self) -> int:
+        return self._head.value
+
+    # ---------- потребитель ----------
+    def get(self, consumer: int, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Следующий кадр для потребителя (view в общую память) или None,
+        если поток закрыт и кадры кончились. После обработки — release().
+
+        Raises:
+            TimeoutError: Кадр не появился за timeout
+        """
+        with self._condition:
+            ready = self._condition.wait_for(
+                lambda: self._tails[consumer] < self._head.value or self._closed.value,
+                timeout
+            )
+            if not ready:
+                raise TimeoutError("No frame from producer")
+            position = self._tails[consumer]
+            if position >= self._head.value:
+                return None
+        return self.frames[position % self.slots]
+
+    def release(self, consumer: int) -> None:
+        with self._condition:
+            self._tails[consumer] += 1
+            self._condition.notify_all()
+
+    # ---------- ресурсы ----------
+    def dispose(self) -> None:
+        """Закрывает общую память; владелец (создатель) её ещё и удаляет."""
+        self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,343 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+# Базовый размер вокселя совпадает с прежней дедупликацией (округление до 1 мм)
+BASE_VOXEL_SIZE = 0.001
+# Бюджеты по умолчанию для SSE-обновлений
+MAP_STREAM_BUDGET = 5000
+TRACKED_POINTS_BUDGET = 500
+KEYPOINTS_2D_BUDGET = 200
+# Доля прироста карты, после которой потоковая выборка пересчитывается
+STREAM_REFRESH_RATIO = 0.02
+# Число шагов бинарного поиска размера вокселя
+LOD_SEARCH_STEPS = 8
+# Сколько выборок без фильтров (по разным бюджетам) держит кеш одной карты
+SAMPLE_CACHE_SIZE = 4
+# Новые ключи вокселей копятся отдельно и вливаются в основной индекс, когда
+# их больше этой доли индекса: вставка в отсортированный массив копирует его целиком
+INDEX_MERGE_RATIO = 0.125
+INDEX_MERGE_MIN = 4096
+
+_KEY_BITS = 21
+_KEY_MASK = (1 << _KEY_BITS) - 1
+
+
+def _row_keys(cells: np.ndarray) -> np.ndarray:
+    """
+    Ключи вокселей без потерь: строка N×3 int64 как одно значение void
+    (24 байта). Такие ключи сортируются и сравниваются как обычный массив.
+    """
+    cells = np.ascontiguousarray(cells, dtype=np.int64)
+    return cells.view(np.dtype((np.void, 3 * cells.itemsize))).ravel()
+
+
+def _voxel_keys(cells: np.ndarray) -> np.ndarray:
+    """
+    Ключи вокселей (N×3) для сравнения внутри одного массива. Если размах
+    по каждой оси укладывается в 21 бит, координаты относительно минимума
+    упаковываются в int64 (быстрее сортируются), иначе — _row_keys.
+    """
+    cells = cells.astype(np.int64)
+    if len(cells):
+        cells -= cells.min(axis=0)
+        if cells.max() <= _KEY_MASK:
+            return (cells[:, 0] << (2 * _KEY_BITS)) | (cells[:, 1] << _KEY_BITS) | cells[:, 2]
+    return _row_keys(cells)
+
+
+def _contains(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Маска keys, которые есть в отсортированном массиве sorted_keys."""
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[positions] == keys
+
+
+def _merge_sorted(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Вливает отсортированные ключи, которых ещё нет, в отсортированный массив."""
+    return np.insert(sorted_keys, np.searchsorted(sorted_keys, keys), keys)
+
+
+def spatial_subsample(points: np.ndarray, budget: int) -> np.ndarray:
+    """
+    Прореживает точки равномерно по пространству, а не по порядку в массиве.
+
+    Ограничивающий бокс делится на сетку примерно из budget ячеек, из каждой
+    ячейки берётся первая точка. Работает для 2D (ключевые точки) и 3D.
+
+    Args:
+        points: Массив N×D
+        budget: Максимальное количество точек
+
+    Returns:
+        Индексы выбранных точек (не больше budget)
+    """
+    count = len(points)
+    if count <= budget:
+        return np.arange(count)
+    if budget <= 0:
+        return np.arange(0)
+
+    dims = points.shape[1]
+    lower = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lower, 1e-9)
+    cells_per_axis = max(1, int(budget ** (1.0 / dims)))
+
+    cells = np.minimum(((points - lower) / extent * cells_per_axis).astype(np.int64), cells_per_axis - 1)
+    flat = np.zeros(count, dtype=np.int64)
+    for axis in range(dims):
+        flat = flat * cells_per_axis + cells[:, axis]
+
+    _, first_indices = np.unique(flat, return_index=True)
+    first_indices.sort()
+
+    if len(first_indices) > budget:
+        # Пустых ячеек мало — добираем равномерным шагом
+        first_indices = first_indices[np.linspace(0, len(first_indices) - 1, budget).astype(np.int64)]
+    return first_indices
+
+
+def points_to_dicts(points: np.ndarray) -> List[Dict[str, float]]:
+    """N×3 → [{'x', 'y', 'z'}, ...] в формате, который ждёт фронтенд."""
+    return [{'x': x, 'y': y, 'z': z} for x, y, z in points[:, :3].tolist()]
+
+
+def keypoints_to_dicts(keypoints: np.ndarray) -> List[Dict[str, float]]:
+    """N×2 → [{'x', 'y'}, ...]."""
+    return [{'x': x, 'y': y} for x, y in keypoints[:, :2].tolist()]
+
+
+def frustum_mask(
+    points: np.ndarray,
+    view: np.ndarray,
+    fov: float,
+    aspect: float,
+    near: float,
+    far: float,
+) -> np.ndarray:
+    """
+    Маска точек, попадающих в пирамиду видимости камеры.
+
+    Args:
+        points: N×3 точки в мировой системе координат
+        view: 4×4 матрица world -> camera (как в project_3d_to_2d)
+        fov: Вертикальный угол обзора в градусах
+        aspect: Отношение ширины к высоте
+        near: Ближняя плоскость отсечения
+        far: Дальняя плоскость отсечения
+    """
+    camera = points @ view[:3, :3].T + view[:3, 3]
+    z = camera[:, 2]
+    tan_y = math.tan(math.radians(fov) / 2.0)
+    tan_x = tan_y * aspect
+    return (
+        (z > near) & (z < far)
+        & (np.abs(camera[:, 0]) <= z * tan_x)
+        & (np.abs(camera[:, 1]) <= z * tan_y)
+    )
+
+
+def bbox_mask(points: np.ndarray, bbox: Sequence[float]) -> np.ndarray:
+    """Маска точек внутри бокса (min_x, min_y, min_z, max_x, max_y, max_z)."""
+    lower = np.asarray(bbox[:3], dtype=np.float32)
+    upper = np.asarray(bbox[3:6], dtype=np.float32)
+    return np.all((points >= lower) & (points <= upper), axis=1)
+
+
+class VoxelPointCloud:
+    """
+    Накопленная карта точек на воксельной сетке с уровнями детализации.
+
+    Базовый уровень хранит по одной точке на воксель BASE_VOXEL_SIZE.
+    Уровень L использует воксели размером BASE_VOXEL_SIZE * 2^L, и sample()
+    выбирает самый детальный (в том числе дробный) уровень, укладывающийся
+    в бюджет клиента. Выборки без фильтров кешируются по бюджету: потоковая
+    (MAP_STREAM_BUDGET) и ещё несколько последних, всего SAMPLE_CACHE_SIZE.
+
+    Занятые воксели — отсортированные массивы ключей (_row_keys): новые
+    точки проверяются на вхождение бинарным поиском, без цикла по точкам.
+    """
+
+    def __init__(self, voxel_size: float = BASE_VOXEL_SIZE, capacity: int = 4096):
+        self.voxel_size = voxel_size
+        self._points = np.empty((capacity, 3), dtype=np.float32)
+        self._count = 0
+        # Ключи занятых вокселей: основной индекс и недавно добавленные, оба отсортированы
+        self._keys = _row_keys(np.empty((0, 3), dtype=np.int64))
+        self._recent_keys = self._keys
+        self._lock = threading.Lock()
+        self._sample_cache: 'OrderedDict[int, tuple]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def points(self) -> np.ndarray:
+        """Все точки базового уровня (view без копирования)."""
+        return self._points[:self._count]
+
+    def add(self, points: np.ndarray) -> int:
+        """
+        Добавляет точки, отбрасывая те, чей воксель уже занят.
+
+        Returns:
+            Количество новых точек
+        """
+        if points is None or len(points) == 0:
+            return 0
+
+        points = np.asarray(points, dtype=np.float32)
+        points = points.reshape(-1, points.shape[-1])[:, :3]
+        points = points[np.isfinite(points).all(axis=1)]
+        # float64: в float32 номера вокселей теряют точность уже за 2^24 вокселей от начала
+        keys, first_rows = np.unique(_row_keys(np.floor(points.astype(np.float64) / self.voxel_size)),
+                                     return_index=True)
+
+        with self._lock:
+            fresh = ~(_contains(self._keys, keys) | _contains(self._recent_keys, keys))
+            if not fresh.any():
+                return 0
+
+            self._recent_keys = _merge_sorted(self._recent_keys, keys[fresh])
+            if len(self._recent_keys) > max(INDEX_MERGE_MIN, len(self._keys) * INDEX_MERGE_RATIO):
+                self._keys = _merge_sorted(self._keys, self._recent_keys)
+                self._recent_keys = self._recent_keys[:0]
+
+            # Точки добавляются в порядке появления в кадре
+            new_rows = np.sort(first_rows[fresh])
+            needed = self._count + len(new_rows)
+            if needed > len(self._points):
+                grown = np.empty((max(needed, len(self._points) * 2), 3), dtype=np.float32)
+                grown[:self._count] = self._points[:self._count]
+                self._points = grown
+
+            self._points[self._count:needed] = points[new_rows]
+            self._count = needed
+            return len(new_rows)
+
+    def _level_sample(self, points: np.ndarray, max_points: int) -> tuple:
+        """
+        Выбор по одной точке на воксель: бинарный поиск по log2 размера вокселя
+        самого мелкого уровня, в котором точек не больше бюджета.
+        """
+        count = len(points)
+        if count <= max_points:
+            return np.arange(count), self.voxel_size
+        if max_points <= 0:
+            return np.arange(0), self.voxel_size
+
+        extent = float(np.max(points.max(axis=0) - points.min(axis=0)))
+        low = 0.0
+        high = max(1.0, math.log2(max(extent, self.voxel_size) / self.voxel_size) + 1.0)
+        best = None
+
+        for _ in range(LOD_SEARCH_STEPS):
+            level = (low + high) / 2.0
+            size = self.voxel_size * (2.0 ** level)
+            keys = _voxel_keys(np.floor(points / size))
+            _, indices = np.unique(keys, return_index=True)
+            if len(indices) <= max_points:
+                best = (indices, size)
+                high = level
+            else:
+                low = level
+
+        if best is None:
+            size = self.voxel_size * (2.0 ** high)
+            _, indices = np.unique(_voxel_keys(np.floor(points / size)), return_index=True)
+            best = (indices, size)
+
+        indices, size = best
+        indices.sort()
+        return indices, size
+
+    def sample(
+        self,
+        max_points: int,
+        bbox: Optional[Sequence[float]] = None,
+        view: Optional[np.ndarray] = None,
+        fov: float = 60.0,
+        aspect: float = 16.0 / 9.0,
+        near: float = 0.01,
+        far: float = 1000.0,
+    ) -> tuple:
+        """
+        Выборка карты под бюджет точек и (опционально) область видимости.
+
+        Returns:
+            (points N×3, voxel_size уровня, количество точек в области)
+        """
+        with self._lock:
+            count = self._count
+            points = self.points.copy()
+
+        unfiltered = bbox is None and view is None
+        cached = self._cached_sample(max_points) if unfiltered else None
+        if cached is not None and cached[0] == count:
+            return cached[1], cached[2], count
+
+        if bbox is not None:
+            points = points[bbox_mask(points, bbox)]
+        if view is not None:
+            points = points[frustum_mask(points, view, fov, aspect, near, far)]
+
+        indices, size = self._level_sample(points, max_points)
+        sampled = points[indices]
+        if unfiltered:
+            with self._lock:
+                self._sample_cache[max_points] = (count, sampled, size)
+                self._sample_cache.move_to_end(max_points)
+                while len(self._sample_cache) > SAMPLE_CACHE_SIZE:
+                    # Потоковая выборка нужна на каждом кадре — её не вытесняют бюджеты клиентов
+                    oldest = next(iter(self._sample_cache))
+                    if oldest == MAP_STREAM_BUDGET:
+                        self._sample_cache.move_to_end(oldest)
+                        continue
+                    del self._sample_cache[oldest]
+        return sampled, size, len(points)
+
+    def _cached_sample(self, max_points: int) -> Optional[tuple]:
+        """(count, points, voxel_size) последней выборки под этот бюджет или None."""
+        with self._lock:
+            cached = self._sample_cache.get(max_points)
+            if cached is not None:
+                self._sample_cache.move_to_end(max_points)
+            return cached
+
+    def stream_sample(self, max_points: int = MAP_STREAM_BUDGET) -> np.ndarray:
+        """
+        Выборка для потоковых обновлений, общая для всех клиентов с тем же
+        бюджетом. Пересчитывается, только когда карта заметно выросла.
+        """
+        count = self._count
+        if count <= max_points:
+            return self.points.copy()
+
+        cached = self._cached_sample(max_points)
+        if cached is not None and count - cached[0] <= cached[0] * STREAM_REFRESH_RATIO:
+            return cached[1]
+
+        points, _, _ = self.sample(max_points)
+        return points
+
+
+_point_maps: Dict[str, VoxelPointCloud] = {}
+
+
+def create_point_map(processing_id: str) -> VoxelPointCloud:
+    point_map = VoxelPointCloud()
+    _point_maps[processing_id] = point_map
+    return point_map
+
+
+def get_point_map(processing_id: str) -> Optional[VoxelPointCloud]:
+    return _point_maps.get(processing_id)
+
+
+def drop_point_map(processing_id: str) -> None:
+    _point_maps.pop(processing_id, None)
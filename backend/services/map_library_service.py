@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.codec_service import load_points, save_points
+from log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Библиотека карт (относительно рабочего каталога; в режиме очереди — на общем томе)
+MAP_LIBRARY_DIR = "maps"
+# Сохранять атлас каждой завершённой обработки, чтобы его можно было назвать картой
+KEEP_JOB_ATLAS = os.environ.get("MAP_LIBRARY_KEEP_ATLAS", "1") != "0"
+# Сколько атласов последних обработок хранить до сохранения в библиотеку
+JOB_ATLAS_LIMIT = int(os.environ.get("MAP_LIBRARY_JOB_ATLAS_LIMIT", "20"))
+
+_JOBS_DIR = os.path.join(MAP_LIBRARY_DIR, "_jobs")
+_ATLAS_NAME = "atlas"
+# Полная карта точек в формате codec_service (RESULT_PRECISION)
+_MAP_FILE = "map.slmq"
+_META_FILE = "meta.json"
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+
+def _map_dir(name: str) -> str:
+    if not _NAME_PATTERN.match(name or ''):
+        raise ValueError(f"Invalid map name: {name!r}")
+    return os.path.join(MAP_LIBRARY_DIR, name)
+
+
+def job_atlas_base(processing_id: str) -> str:
+    """
+    Путь (без .osa), куда ORB-SLAM3 сохранит атлас обработки при Shutdown()
+    через System.SaveAtlasToFile. Путь относительный: ORB-SLAM3 ищет его
+    от рабочего каталога.
+    """
+    return os.path.join(_JOBS_DIR, processing_id, _ATLAS_NAME)
+
+
+def prepare_job_atlas(processing_id: str) -> str:
+    """Создаёт каталог атласа обработки и убирает самые старые из них."""
+    os.makedirs(os.path.join(_JOBS_DIR, processing_id), exist_ok=True)
+
+    entries = sorted(
+        (entry for entry in os.scandir(_JOBS_DIR) if entry.is_dir() and entry.name != processing_id),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in entries[:max(0, len(entries) - JOB_ATLAS_LIMIT + 1)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+    return job_atlas_base(processing_id)
+
+
+def save_job_map_points(processing_id: str, map_points: np.ndarray) -> None:
+    """Сохраняет полную карту точек рядом с атласом обработки."""
+    directory = os.path.join(_JOBS_DIR, processing_id)
+    os.makedirs(directory, exist_ok=True)
+    save_points(os.path.join(directory, _MAP_FILE), map_points)
+
+
+def has_job_atlas(processing_id: str) -> bool:
+    return os.path.exists(f"{job_atlas_base(processing_id)}.osa")
+
+
+def save_named_map(name: str, processing_id: str, data: Dict, overwrite: bool = False) -> Dict:
+    """
+    Сохраняет атлас завершённой обработки в библиотеку под именем name.
+
+    Args:
+        name: Имя карты (латиница, цифры, '_', '-', '.')
+        processing_id: ID завершённой обработки
+        data: Processing.data этой обработки (параметры видео, статистика)
+        overwrite: Заменить существующую карту с тем же именем
+
+    Returns:
+        Метаданные сохранённой карты
+
+    Raises:
+        ValueError: Недопустимое имя
+        FileNotFoundError: Для обработки нет сохранённого атласа
+        FileExistsError: Карта с таким именем уже есть, а overwrite=False
+    """
+    directory = _map_dir(name)
+    if not has_job_atlas(processing_id):
+        raise FileNotFoundError(f"No saved atlas for processing {processing_id}")
+    if os.path.exists(directory) and not overwrite:
+        raise FileExistsError(f"Map {name!r} already exists")
+
+    # Имена с '_' в начале не бывают картами — незавершённая копия не попадёт в список
+    staging = os.path.join(MAP_LIBRARY_DIR, f"_staging_{name}")
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.copytree(os.path.join(_JOBS_DIR, processing_id), staging)
+
+    meta = {
+        'name': name,
+        'source_processing_id': processing_id,
+        'created_at': time.time(),
+        'width': data.get('width'),
+        'height': data.get('height'),
+        'fps': data.get('fps'),
+        'map_points_total': data.get('map_points_total', 0),
+        'trajectory_length': len(data.get('trajectory') or []),
+    }
+    with open(os.path.join(staging, _META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    logger.info("Saved map %s from processing %s", name, processing_id)
+    return meta
+
+
+def get_map(name: str) -> Optional[Dict]:
+    """
+    Returns:
+        Метаданные карты плюс 'atlas_path' (путь без .osa) или None
+    """
+    try:
+        directory = _map_dir(name)
+    except ValueError:
+        return None
+    try:
+        with open(os.path.join(directory, _META_FILE), 'r') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    meta['atlas_path'] = os.path.join(directory, _ATLAS_NAME)
+    return meta
+
+
+def load_map_points(name: str) -> Optional[np.ndarray]:
+    directory = _map_dir(name)
+    map_file = os.path.join(directory, _MAP_FILE)
+    return load_points(map_file) if os.path.exists(map_file) else None
+
+
+def list_maps() -> List[Dict]:
+    if not os.path.isdir(MAP_LIBRARY_DIR):
+        return []
+    maps = []
+    for name in sorted(os.listdir(MAP_LIBRARY_DIR)):
+        meta = get_map(name)
+        if meta:
+            meta.pop('atlas_path')
+            maps.append(meta)
+    return maps
+
+
+def delete_map(name: str) -> bool:
+    directory = _map_dir(name)
+    if not os.path.exists(directory):
+        return False
+    shutil.rmtree(directory)
+    return True
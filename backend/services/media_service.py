@@ -0,0 +1,634 @@
+import asyncio
+import math
+import mimetypes
+import os
+import shutil
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from store import get_store
+from log import get_logger
+
+
+logger = get_logger(__name__)
+
+MEDIA_DIR = "media"
+MEDIA_CHUNK_SIZE = 256 * 1024
+
+# Фоновый ремукс не-MP4 загрузок в fast-start MP4 (нужен ffmpeg в PATH)
+REMUX_ENABLED = os.environ.get("MEDIA_REMUX", "1") != "0"
+# Превью низкого разрешения и спрайт миниатюр для просмотра рядом с траекторией
+PREVIEW_ENABLED = os.environ.get("MEDIA_PREVIEW", "1") != "0"
+PREVIEW_HEIGHT = 480
+PREVIEW_CRF = 30
+SPRITE_THUMB_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_MAX_THUMBNAILS = 100
+# Если сервер стоит за nginx, отдачу файла можно делегировать ему (sendfile)
+ACCEL_REDIRECT_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX")
+
+VIDEO_MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4v": "video/mp4",
+    ".mov": "video/quicktime",
+    ".avi": "video/x-msvideo",
+    ".mkv": "video/x-matroska",
+    ".mpeg": "video/mpeg",
+    ".mpg": "video/mpeg",
+    ".webm": "video/webm",
+}
+
+# Ссылки на фоновые медиа-задачи: event loop держит только слабые, и задача без
+# ссылки может быть собрана сборщиком мусора посреди работы
+_pipeline_tasks: Set[asyncio.Task] = set()
+
+
+def guess_media_type(path: str) -> str:
+    """Определяет Content-Type по расширению файла."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in VIDEO_MEDIA_TYPES:
+        return VIDEO_MEDIA_TYPES[extension]
+    media_type, _ = mimetypes.guess_type(path)
+    return media_type or "application/octet-stream"
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает заголовок Range для одного диапазона байт.
+
+    Args:
+        range_header: Значение заголовка, например "bytes=0-1023"
+        file_size: Размер файла в байтах
+
+    Returns:
+        (start, end) включительно или None, если заголовок нужно проигнорировать
+        (несколько диапазонов, другая единица измерения)
+
+    Raises:
+        ValueError: Диапазон невыполним (ответ 416)
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    if file_size == 0:
+        # В пустом файле нет ни одного байта, никакой диапазон не выполним
+        raise ValueError(f"Unsatisfiable range for empty file: {range_header}")
+
+    start_str, _, end_str = ranges.strip().partition("-")
+    start_str, end_str = start_str.strip(), end_str.strip()
+
+    try:
+        if not start_str:
+            # Суффиксный диапазон: последние N байт
+            suffix = int(end_str)
+            if suffix <= 0:
+                raise ValueError("Empty suffix range")
+            return max(file_size - suffix, 0), file_size - 1
+
+        start = int(start_str)
+        end = int(end_str) if end_str else file_size - 1
+    except ValueError:
+        raise ValueError(f"Malformed range: {range_header}")
+
+    if start >= file_size or start > end:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+
+    return start, min(end, file_size - 1)
+
+
+class RangeFileResponse(Response):
+    """
+    Отдача файла (целиком или диапазоном) с поддержкой zero-copy.
+
+    Если ASGI-сервер поддерживает расширение http.response.zerocopysend,
+    тело отправляется через os.sendfile, иначе читается чанками в потоке.
+    """
+
+    chunk_size = MEDIA_CHUNK_SIZE
+
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+    ) -> None:
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        self.init_headers(headers)
+        self.headers["content-length"] = str(max(end - start + 1, 0))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        count = self.end - self.start + 1
+        if scope.get("method") == "HEAD" or count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0,
+                })
+            if remaining > 0:
+                # Файл укоротился во время отдачи — закрываем тело
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _is_not_modified(request_headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _range_allowed(request_headers: Mapping[str, str], etag: str, last_modified: str) -> bool:
+    if_range = request_headers.get("if-range")
+    if if_range is None:
+        return True
+    return if_range.strip() in (etag, last_modified)
+
+
+def build_file_response(
+    path: str,
+    request_headers: Mapping[str, str],
+    download_name: Optional[str] = None,
+    cache_control: str = "public, max-age=3600",
+) -> Response:
+    """
+    Формирует ответ для медиафайла с учётом Range/If-Range/If-None-Match.
+
+    Args:
+        path: Путь к файлу на диске
+        request_headers: Заголовки входящего запроса
+        download_name: Имя файла для Content-Disposition
+        cache_control: Значение заголовка Cache-Control
+
+    Returns:
+        200/206 с телом файла, 304 или 416
+    """
+    stat_result = os.stat(path)
+    file_size = stat_result.st_size
+    etag = make_etag(stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    media_type = guess_media_type(path)
+
+    headers: Dict[str, str] = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": last_modified,
+        "cache-control": cache_control,
+    }
+    if download_name:
+        headers["content-disposition"] = f"inline; filename=\"{download_name}\""
+
+    if _is_not_modified(request_headers, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, file_size - 1, 200
+    range_header = request_headers.get("range")
+    if range_header and _range_allowed(request_headers, etag, last_modified):
+        try:
+            byte_range = parse_range_header(range_header, file_size)
+        except ValueError:
+            headers["content-range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+
+    if ACCEL_REDIRECT_PREFIX:
+        # nginx сам обработает Range и отдаст файл через sendfile
+        headers["x-accel-redirect"] = f"{ACCEL_REDIRECT_PREFIX.rstrip('/')}/{Path(path).as_posix().lstrip('/')}"
+        headers.pop("content-range", None)
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    return RangeFileResponse(
+        path=path,
+        start=start,
+        end=end,
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+def get_playback_path(data: Dict) -> Optional[str]:
+    """Путь к файлу для воспроизведения: ремукс, если готов, иначе оригинал."""
+    playback_path = data.get('playback_path')
+    if playback_path and os.path.exists(playback_path):
+        return playback_path
+    return data.get('video_path')
+
+
+def _needs_remux(video_path: str) -> bool:
+    return guess_media_type(video_path) != "video/mp4"
+
+
+async def remux_to_faststart(processing_id: str) -> Optional[str]:
+    """
+    Перепаковывает не-MP4 загрузку в fast-start MP4 без перекодирования.
+
+    Args:
+        processing_id: ID обработки в store
+
+    Returns:
+        Путь к MP4 или None, если ремукс не нужен или не удался
+    """
+    store = get_store()
+    processing = store.get(processing_id)
+    if not processing:
+        return None
+
+    data = processing.data or {}
+    video_path = data.get('video_path')
+    if not video_path or not _needs_remux(video_path):
+        return None
+
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        store.update_data(processing_id, {'remux_status': 'unavailable'})
+        return None
+
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    output_path = os.path.join(MEDIA_DIR, f"{processing_id}.mp4")
+    temp_path = f"{output_path}.part"
+
+    store.update_data(processing_id, {'remux_status': 'running'})
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            ffmpeg, "-y", "-loglevel", "error",
+            "-i", video_path,
+            "-map", "0:v:0", "-map", "0:a?",
+            "-c", "copy",
+            "-movflags", "+faststart",
+            "-f", "mp4", temp_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+
+        if process.returncode != 0:
+            message = stderr.decode(errors="replace").strip()
+            logger.warning("Remux failed for %s: %s", processing_id, message)
+            store.update_data(processing_id, {'remux_status': 'failed'})
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+
+        os.replace(temp_path, output_path)
+        store.update_data(processing_id, {
+            'playback_path': output_path,
+            'remux_status': 'done'
+        })
+        logger.info("Remuxed %s -> %s", video_path, output_path)
+        return output_path
+
+    except Exception as e:
+        logger.warning("Remux failed for %s: %s", processing_id, e)
+        store.update_data(processing_id, {'remux_status': 'failed'})
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+
+async def _probe_keyframe_times(video_path: str) -> List[float]:
+    """Таймстемпы ключевых кадров через ffprobe (пустой список, если недоступен)."""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return []
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            ffprobe, "-v", "error",
+            "-select_streams", "v:0",
+            "-skip_frame", "nokey",
+            "-show_entries", "frame=pts_time",
+            "-of", "csv=p=0",
+            video_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+    except Exception as e:
+        logger.warning("ffprobe failed for %s: %s", video_path, e)
+        return []
+
+    times = []
+    for line in stdout.decode(errors="replace").splitlines():
+        value = line.strip().rstrip(",")
+        try:
+            times.append(float(value))
+        except ValueError:
+            continue
+    return times
+
+
+def _select_thumbnail_times(keyframe_times: List[float], duration: float) -> List[float]:
+    """Равномерно прореживает ключевые кадры до SPRITE_MAX_THUMBNAILS."""
+    if not keyframe_times:
+        if duration <= 0:
+            return [0.0]
+        count = min(SPRITE_MAX_THUMBNAILS, max(1, int(duration)))
+        step = duration / count
+        return [i * step for i in range(count)]
+
+    if len(keyframe_times) <= SPRITE_MAX_THUMBNAILS:
+        return keyframe_times
+
+    step = len(keyframe_times) / SPRITE_MAX_THUMBNAILS
+    return [keyframe_times[int(i * step)] for i in range(SPRITE_MAX_THUMBNAILS)]
+
+
+def _render_sprite(video_path: str, keyframe_times: List[float], output_path: str) -> Optional[Dict]:
+    """
+    Собирает JPEG-спрайт из кадров в моменты, выбранные по ключевым кадрам
+    (_select_thumbnail_times). Блокирующий: импорт cv2, открытие контейнера
+    и декодирование — вызывать через asyncio.to_thread.
+
+    Returns:
+        Метаданные спрайта (размер плитки, сетка, координаты миниатюр) или None
+    """
+    import cv2
+    import numpy as np
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        duration = frame_count / fps if fps > 0 else 0.0
+        times = _select_thumbnail_times(keyframe_times, duration)
+
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if width <= 0 or height <= 0:
+            return None
+
+        tile_width = SPRITE_THUMB_WIDTH
+        tile_height = max(2, int(round(height * tile_width / width)))
+
+        tiles = []
+        thumbnails = []
+        for timestamp in times:
+            cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000.0)
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            tiles.append(cv2.resize(frame, (tile_width, tile_height), interpolation=cv2.INTER_AREA))
+            thumbnails.append(timestamp)
+    finally:
+        cap.release()
+
+    if not tiles:
+        return None
+
+    columns = min(SPRITE_COLUMNS, len(tiles))
+    rows = math.ceil(len(tiles) / columns)
+    sprite = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+
+    entries = []
+    for index, (tile, timestamp) in enumerate(zip(tiles, thumbnails)):
+        x = (index % columns) * tile_width
+        y = (index // columns) * tile_height
+        sprite[y:y + tile_height, x:x + tile_width] = tile
+        entries.append({'time': timestamp, 'x': x, 'y': y})
+
+    ok, encoded = cv2.imencode(".jpg", sprite, [cv2.IMWRITE_JPEG_QUALITY, 75])
+    if not ok:
+        return None
+
+    temp_path = f"{output_path}.part"
+    with open(temp_path, "wb") as f:
+        f.write(encoded.tobytes())
+    os.replace(temp_path, output_path)
+
+    return {
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'columns': columns,
+        'rows': rows,
+        'thumbnails': entries
+    }
+
+
+async def generate_thumbnail_sprite(processing_id: str) -> Optional[str]:
+    """
+    Генерирует спрайт миниатюр по ключевым кадрам видео.
+
+    Args:
+        processing_id: ID обработки в store
+
+    Returns:
+        Путь к JPEG-спрайту или None при ошибке
+    """
+    store = get_store()
+    processing = store.get(processing_id)
+    if not processing:
+        return None
+
+    video_path = (processing.data or {}).get('video_path')
+    if not video_path or not os.path.exists(video_path):
+        return None
+
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    output_path = os.path.join(MEDIA_DIR, f"{processing_id}_sprite.jpg")
+
+    try:
+        keyframe_times = await _probe_keyframe_times(video_path)
+        # Длительность читается там же, где рендер: cv2 не трогает event loop
+        sprite = await asyncio.to_thread(_render_sprite, video_path, keyframe_times, output_path)
+        if sprite is None:
+            logger.warning("Failed to render thumbnail sprite for %s", processing_id)
+            return None
+
+        store.update_data(processing_id, {
+            'sprite_path': output_path,
+            'thumbnails': sprite
+        })
+        logger.info("Generated thumbnail sprite: %s (%d thumbnails)", output_path, len(sprite['thumbnails']))
+        return output_path
+
+    except Exception as e:
+        logger.warning("Thumbnail sprite failed for %s: %s", processing_id, e)
+        return None
+
+
+def _transcode_preview_opencv(video_path: str, output_path: str) -> bool:
+    """Запасной вариант превью через cv2.VideoWriter, если ffmpeg недоступен."""
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return False
+
+    writer = None
+    try:
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        if width <= 0 or height <= 0:
+            return False
+
+        target_height = min(PREVIEW_HEIGHT, height)
+        target_width = int(round(width * target_height / height)) // 2 * 2
+        target_size = (target_width, target_height)
+
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"avc1"), fps, target_size)
+        if not writer.isOpened():
+            writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, target_size)
+        if not writer.isOpened():
+            return False
+
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if (frame.shape[1], frame.shape[0]) != target_size:
+                frame = cv2.resize(frame, target_size, interpolation=cv2.INTER_AREA)
+            writer.write(frame)
+        return True
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+
+
+async def generate_preview(processing_id: str) -> Optional[str]:
+    """
+    Транскодирует видео в лёгкое превью (H.264, не выше PREVIEW_HEIGHT строк).
+
+    Args:
+        processing_id: ID обработки в store
+
+    Returns:
+        Путь к превью или None при ошибке
+    """
+    store = get_store()
+    processing = store.get(processing_id)
+    if not processing:
+        return None
+
+    video_path = (processing.data or {}).get('video_path')
+    if not video_path or not os.path.exists(video_path):
+        return None
+
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    output_path = os.path.join(MEDIA_DIR, f"{processing_id}_preview.mp4")
+    temp_path = os.path.join(MEDIA_DIR, f"{processing_id}_preview.part.mp4")
+
+    store.update_data(processing_id, {'preview_status': 'running'})
+
+    try:
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg:
+            process = await asyncio.create_subprocess_exec(
+                ffmpeg, "-y", "-loglevel", "error",
+                "-i", video_path,
+                "-map", "0:v:0",
+                "-vf", f"scale=-2:'min({PREVIEW_HEIGHT},ih)'",
+                "-c:v", "libx264", "-preset", "veryfast",
+                "-crf", str(PREVIEW_CRF), "-pix_fmt", "yuv420p",
+                "-an",
+                "-movflags", "+faststart",
+                temp_path,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await process.communicate()
+            ok = process.returncode == 0
+            if not ok:
+                logger.warning("Preview transcode failed for %s: %s",
+                               processing_id, stderr.decode(errors='replace').strip())
+        else:
+            ok = await asyncio.to_thread(_transcode_preview_opencv, video_path, temp_path)
+
+        if not ok:
+            store.update_data(processing_id, {'preview_status': 'failed'})
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+
+        os.replace(temp_path, output_path)
+        store.update_data(processing_id, {
+            'preview_path': output_path,
+            'preview_status': 'done'
+        })
+        logger.info("Generated preview: %s", output_path)
+        return output_path
+
+    except Exception as e:
+        logger.warning("Preview transcode failed for %s: %s", processing_id, e)
+        store.update_data(processing_id, {'preview_status': 'failed'})
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+
+async def start_media_pipeline(processing_id: str) -> None:
+    """Фоновая медиа-стадия после загрузки: ремукс, спрайт миниатюр, превью."""
+    if REMUX_ENABLED:
+        await remux_to_faststart(processing_id)
+    if PREVIEW_ENABLED:
+        await generate_thumbnail_sprite(processing_id)
+        await generate_preview(processing_id)
+
+
+def spawn_media_pipeline(processing_id: str) -> asyncio.Task:
+    """Запускает start_media_pipeline фоновой задачей и держит ссылку на неё до завершения."""
+    task = asyncio.create_task(start_media_pipeline(processing_id))
+    _pipeline_tasks.add(task)
+    task.add_done_callback(_pipeline_tasks.discard)
+    return task
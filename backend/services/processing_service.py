@@ -1,13 +1,100 @@
 import asyncio
-import cv2
+import logging
 import os
 import tempfile
+import time
 import re
 import numpy as np
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 from store import get_store
-from lib.orb_slam.orb_slam import OrbslamMonoRunner
+from metrics import create_job_memory, create_job_profiler, get_memory_tracker, FRAME_STAGE
+from services.lod_service import (
+    KEYPOINTS_2D_BUDGET,
+    TRACKED_POINTS_BUDGET,
+    VoxelPointCloud,
+    create_point_map,
+    drop_point_map,
+    keypoints_to_dicts,
+    points_to_dicts,
+    spatial_subsample,
+)
+from services.result_service import save_result_points
+from services.runtime_service import load_slam_stack_async
+from services.slam_process import SlamProcessRunner
+from services.segment_service import MapSegments
+from services.checkpoint_service import (
+    CHECKPOINT_ENABLED,
+    CHECKPOINT_INTERVAL,
+    delete_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from services.map_library_service import (
+    KEEP_JOB_ATLAS,
+    get_map,
+    load_map_points,
+    prepare_job_atlas,
+    save_job_map_points,
+)
+from log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Нативные вызовы (инициализация, трекинг, shutdown) — в пуле потоков: биндинг
+# отпускает GIL, поэтому event loop не замирает на кадре, а обработки идут параллельно
+SLAM_THREADED = os.environ.get("SLAM_THREADED", "1") != "0"
+# SLAM в дочернем процессе (SlamProcessRunner): падение нативного кода завершает
+# только обработку, а не сервер; результаты кадров приходят через общую память
+SLAM_PROCESS = os.environ.get("SLAM_PROCESS", "0") == "1"
+# Пропуск почти неподвижных кадров перед трекингом (lib/orb_slam/frame_gate.py):
+# порог — средняя разница серых миниатюр 0..255, подряд пропускается не больше MAX_SKIP
+FRAME_GATE = os.environ.get("FRAME_GATE", "0") == "1"
+FRAME_GATE_THRESHOLD = float(os.environ.get("FRAME_GATE_THRESHOLD", "1.5"))
+FRAME_GATE_MAX_SKIP = int(os.environ.get("FRAME_GATE_MAX_SKIP", "4"))
+# Адаптивный бюджет ORB-признаков (lib/orb_slam/feature_budget.py): nFeatures меняется
+# в пределах MIN..MAX так, чтобы отслеживаемых точек было от TARGET_LOW до TARGET_HIGH
+ORB_ADAPTIVE = os.environ.get("ORB_ADAPTIVE", "0") == "1"
+ORB_TARGET_LOW = int(os.environ.get("ORB_TARGET_LOW", "80"))
+ORB_TARGET_HIGH = int(os.environ.get("ORB_TARGET_HIGH", "200"))
+ORB_MIN_FEATURES = int(os.environ.get("ORB_MIN_FEATURES", "400"))
+ORB_MAX_FEATURES = int(os.environ.get("ORB_MAX_FEATURES", "2000"))
+
+
+async def _call_slam(fn, *args, **kwargs):
+    if SLAM_THREADED:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+def _track_frame(runner, point_map: VoxelPointCloud, profiler) -> tuple:
+    """
+    Кадр SLAM и накопление карты за один переход в поток (_call_slam):
+    дедупликация точек и пересчёт потоковой выборки не занимают event loop.
+
+    Returns:
+        (ret, info, новых точек карты, выборка карты для клиентов или None)
+    """
+    ret, info = runner.process_frame()
+    new_points = 0
+    stream_points = None
+    if info and info['points'] is not None and len(info['points']) > 0:
+        with profiler.stage('map_accumulate'):
+            # Дубликаты отбрасываются; клиентам уходит выборка под бюджет, а не первые N точек
+            new_points = point_map.add(info['points'])
+            if new_points > 0:
+                stream_points = points_to_dicts(point_map.stream_sample())
+    return ret, info, new_points, stream_points
+
+
+def _restore_point_map(point_map: VoxelPointCloud, points: np.ndarray) -> Dict[str, Any]:
+    """Загружает в карту сохранённые точки; возвращает поля выборки для клиентов."""
+    point_map.add(points)
+    return {
+        'all_map_points': points_to_dicts(point_map.stream_sample()),
+        'map_points_total': len(point_map)
+    }
 
 
 def project_3d_to_2d(points_3d, camera_pose, camera_params):
@@ -23,11 +110,11 @@ def project_3d_to_2d(points_3d, camera_pose, camera_params):
         List of 2D points [(x, y), ...] that are within image bounds
     """
     if points_3d is None or len(points_3d) == 0:
-        print("[DEBUG] project_3d_to_2d: No 3D points provided")
+        logger.debug("project_3d_to_2d: no 3D points provided")
         return []
     
     try:
-        print(f"[DEBUG] project_3d_to_2d: Processing {len(points_3d)} 3D points")
+        logger.debug("project_3d_to_2d: processing %d 3D points", len(points_3d))
         # Извлекаем параметры камеры
         fx = camera_params['fx']
         fy = camera_params['fy'] 
@@ -65,11 +152,24 @@ def project_3d_to_2d(points_3d, camera_pose, camera_params):
         return keypoints_2d
         
     except Exception as e:
-        print(f"[ERROR] Failed to project 3D points to 2D: {e}")
+        logger.error("Failed to project 3D points to 2D: %s", e)
         return []
 
 
-def _generate_temp_config(width: int, height: int, fps: float, processing_id: str) -> Optional[str]:
+def _format_setting(value: Any) -> str:
+    """Значение для YAML ORB-SLAM3: float всегда с точкой (иначе OpenCV прочитает int)."""
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, int):
+        return str(value)
+    return f'"{value}"'
+
+
+def _generate_temp_config(width: int, height: int, fps: float, processing_id: str,
+                          load_atlas: Optional[str] = None, save_atlas: Optional[str] = None,
+                          overrides: Optional[Dict[str, Any]] = None) -> Optional[str]:
     """
     Генерирует временный конфигурационный файл на основе параметров видео.
     
@@ -78,6 +178,9 @@ def _generate_temp_config(width: int, height: int, fps: float, processing_id: st
         height: Высота видео
         fps: FPS видео
         processing_id: ID обработки для уникального имени
+        load_atlas: Путь к атласу без .osa (чекпоинт или карта из библиотеки)
+        save_atlas: Путь без .osa, куда сохранить атлас при завершении
+        overrides: Значения параметров поверх шаблона ({'ORBextractor.nFeatures': 2000, ...})
         
     Returns:
         Путь к временному конфигу или None при ошибке
@@ -87,7 +190,7 @@ def _generate_temp_config(width: int, height: int, fps: float, processing_id: st
         template_path = Path(__file__).parent.parent / "lib" / "orb_slam" / "config.yaml"
         
         if not template_path.exists():
-            print(f"[ERROR] Template config not found: {template_path}")
+            logger.error("Template config not found: %s", template_path)
             return None
         
         # Читаем шаблон
@@ -121,6 +224,22 @@ def _generate_temp_config(width: int, height: int, fps: float, processing_id: st
         content = re.sub(r'Camera\.newWidth:\s*\d+', f'Camera.newWidth: {width}', content)
         content = re.sub(r'Camera\.newHeight:\s*\d+', f'Camera.newHeight: {height}', content)
         
+        # ORB-SLAM3 загрузит сохранённый атлас при инициализации
+        if load_atlas:
+            content = content.rstrip('\n') + f'\n\nSystem.LoadAtlasFromFile: "{load_atlas}"\n'
+        # ...и сохранит атлас при Shutdown(), чтобы обработку можно было сохранить как карту
+        if save_atlas:
+            content = content.rstrip('\n') + f'\nSystem.SaveAtlasToFile: "{save_atlas}"\n'
+        
+        # Переопределения параметров: заменяем строку ключа или дописываем её в конец
+        for key, value in (overrides or {}).items():
+            line = f'{key}: {_format_setting(value)}'
+            pattern = rf'^{re.escape(key)}:.*$'
+            if re.search(pattern, content, flags=re.MULTILINE):
+                content = re.sub(pattern, lambda _: line, content, flags=re.MULTILINE)
+            else:
+                content = content.rstrip('\n') + f'\n{line}\n'
+        
         # Создаем временный файл
         temp_dir = Path(__file__).parent.parent / "lib" / "orb_slam"
         temp_config_path = temp_dir / f"config_temp_{processing_id}.yaml"
@@ -128,13 +247,13 @@ def _generate_temp_config(width: int, height: int, fps: float, processing_id: st
         with open(temp_config_path, 'w') as f:
             f.write(content)
         
-        print(f"[INFO] Generated temp config: {temp_config_path}")
-        print(f"[INFO] Camera params: fx={focal_length}, fy={focal_length}, cx={cx}, cy={cy}")
+        logger.info("Generated temp config: %s", temp_config_path)
+        logger.info("Camera params: fx=%s, fy=%s, cx=%s, cy=%s", focal_length, focal_length, cx, cy)
         
         return str(temp_config_path)
         
     except Exception as e:
-        print(f"[ERROR] Failed to generate temp config: {e}")
+        logger.error("Failed to generate temp config: %s", e)
         return None
 
 
@@ -154,23 +273,35 @@ async def start_processing(processing_id: str, video_path: str) -> Optional[str]
     # Проверяем существование записи в store
     processing = store.get(processing_id)
     if not processing:
-        print(f"[ERROR] Processing {processing_id} not found in store")
+        logger.error("Processing %s not found in store", processing_id)
         return None
     
     # Проверяем существование файла
     video_file = Path(video_path)
     if not video_file.exists():
-        print(f"[ERROR] Video file not found: {video_path}")
+        logger.error("Video file not found: %s", video_path, extra={'processing_id': processing_id})
         store.update_data(processing_id, {
             'status': 'failed',
             'error': f'Video file not found: {video_path}'
         })
         return None
     
+    # Тяжёлый стек (OpenCV + orbslam3) грузится при первой обработке
+    try:
+        slam_stack = await load_slam_stack_async()
+    except Exception as e:
+        store.update_data(processing_id, {
+            'status': 'failed',
+            'error': f'SLAM stack is not available: {e}'
+        })
+        store.set_active(processing_id, False)
+        return None
+    cv2 = slam_stack.cv2
+    
     # Получаем параметры видео
     cap = cv2.VideoCapture(str(video_path))
     if not cap.isOpened():
-        print(f"[ERROR] Cannot open video: {video_path}")
+        logger.error("Cannot open video: %s", video_path, extra={'processing_id': processing_id})
         store.update_data(processing_id, {
             'status': 'failed',
             'error': f'Cannot open video: {video_path}'
@@ -183,8 +314,30 @@ async def start_processing(processing_id: str, video_path: str) -> Optional[str]
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     cap.release()
     
+    # Чекпоинт остаётся на диске, только если прошлый запуск был прерван
+    checkpoint = load_checkpoint(processing_id) if CHECKPOINT_ENABLED else None
+    start_frame = 0
+    
+    # Обработка "по карте" из библиотеки: атлас загружается, SLAM только локализуется
+    map_name = (processing.data or {}).get('localization_map')
+    library_map = None
+    if map_name:
+        library_map = get_map(map_name)
+        error = None
+        if library_map is None:
+            error = f'Map not found: {map_name}'
+        elif (library_map.get('width'), library_map.get('height')) != (width, height):
+            # Калибровка в конфиге выводится из разрешения — атлас с другой камерой не подойдёт
+            error = (f"Map {map_name} was built for {library_map.get('width')}x{library_map.get('height')} video, "
+                     f"got {width}x{height}")
+        if error:
+            logger.error(error, extra={'processing_id': processing_id})
+            store.update_data(processing_id, {'status': 'failed', 'error': error})
+            store.set_active(processing_id, False)
+            return None
+    
     # Обновляем запись в store с параметрами видео
-    store.update_data(processing_id, {
+    initial_data = {
         'width': width,
         'height': height,
         'fps': fps,
@@ -193,52 +346,123 @@ async def start_processing(processing_id: str, video_path: str) -> Optional[str]
         'trajectory': [],
         'current_pose': None,
         'tracked_points_count': 0,
-        'all_map_points': [],  # Все точки карты (накапливаем)
+        'all_map_points': [],  # Выборка карты для клиентов (полная карта в lod_service)
+        'map_points_total': 0,
+        'segments': [],  # Участки траектории по картам атласа (см. MapSegments)
+        'map_merges': [],
         'video_path': video_path,  # Путь к видеофайлу для воспроизведения
+        'mode': 'localization' if library_map else 'mapping',
         'status': 'initializing'
-    })
+    }
+    if checkpoint:
+        start_frame = checkpoint['frame_idx']
+        initial_data.update(checkpoint['data'])
+        initial_data.update({
+            'processed_frames': start_frame,
+            'resumed_from_frame': start_frame,
+            'status': 'initializing',
+        })
+        logger.info("Resuming processing %s from frame %d (atlas: %s)", processing_id, start_frame,
+                    bool(checkpoint['atlas_path']), extra={'processing_id': processing_id})
+    store.update_data(processing_id, initial_data)
     
-    print(f"[INFO] Starting processing {processing_id} for video: {video_path}")
+    logger.info("Starting processing %s for video: %s", processing_id, video_path)
     
     # Создаем временный конфиг для этого видео
     temp_config_path = None
+    runner = None
+    memory = None
     
     try:
         # Генерируем временный конфиг на основе параметров видео
-        temp_config_path = _generate_temp_config(width, height, fps, processing_id)
+        load_atlas = checkpoint['atlas_path'] if checkpoint else None
+        if library_map and not load_atlas:
+            load_atlas = library_map['atlas_path']
+        # Атлас сохраняем только там, где он строится; карта из библиотеки не меняется
+        save_atlas = prepare_job_atlas(processing_id) if KEEP_JOB_ATLAS and not library_map else None
+        temp_config_path = _generate_temp_config(
+            width, height, fps, processing_id,
+            load_atlas=load_atlas,
+            save_atlas=save_atlas
+        )
         
         if not temp_config_path or not Path(temp_config_path).exists():
-            print(f"[ERROR] Failed to generate temp config")
+            logger.error("Failed to generate temp config", extra={'processing_id': processing_id})
             store.update_data(processing_id, {
                 'status': 'failed',
                 'error': 'Failed to generate temporary config file'
             })
             return None
         
-        print(f"[DEBUG] Created temp config: {temp_config_path}")
-        
-        # Инициализируем ORB-SLAM с временным конфигом
-        runner = OrbslamMonoRunner(str(temp_config_path))
-        runner.open_video(str(video_path))
+        logger.debug("Created temp config: %s", temp_config_path)
+        
+        # Гистограммы времени по стадиям покадрового цикла
+        profiler = create_job_profiler()
+        store.update(processing_id, profile=profiler)
+        # Память процесса по ходу задачи и дельты вокруг создания/остановки SLAM
+        memory = create_job_memory(processing_id)
+        store.update(processing_id, memory=memory)
+        
+        # Полная карта точек с уровнями детализации
+        point_map = create_point_map(processing_id)
+        if checkpoint and checkpoint['map_points'] is not None:
+            # Выборка для клиентов в чекпоинте не хранится — строим из восстановленной карты
+            store.update_data(processing_id,
+                              await asyncio.to_thread(_restore_point_map, point_map, checkpoint['map_points']))
+        elif library_map:
+            # Клиенты сразу видят всю карту места, а не только то, что попало в кадр
+            map_points = await asyncio.to_thread(load_map_points, map_name)
+            store.update_data(processing_id, await asyncio.to_thread(_restore_point_map, point_map, map_points))
+        
+        # Инициализируем ORB-SLAM с временным конфигом.
+        # По готовой карте инициализация не нужна — позы валидны с первого кадра
+        runner_options = {'min_init_frames': 0} if library_map else {}
+        if FRAME_GATE:
+            runner_options['frame_gate'] = {'threshold': FRAME_GATE_THRESHOLD, 'max_skip': FRAME_GATE_MAX_SKIP}
+        if ORB_ADAPTIVE:
+            runner_options['feature_budget'] = {
+                'target_low': ORB_TARGET_LOW, 'target_high': ORB_TARGET_HIGH,
+                'min_features': ORB_MIN_FEATURES, 'max_features': ORB_MAX_FEATURES,
+            }
+        runner_class = SlamProcessRunner if SLAM_PROCESS else slam_stack.OrbslamMonoRunner
+        # С SLAM_PROCESS=1 ORB-SLAM3 живёт в дочернем процессе: дельты API-процесса недоступны
+        with memory.measure('runner_create', in_process=not SLAM_PROCESS):
+            runner = await _call_slam(runner_class, str(temp_config_path),
+                                      profiler=profiler, **runner_options)
+        if library_map:
+            await _call_slam(runner.set_localization_mode, True)
+        # Открытие видео и перемотка к кадру чекпоинта — блокирующий вызов
+        await _call_slam(runner.open_video, str(video_path), start_frame=start_frame)
         
         store.update_data(processing_id, {'status': 'processing'})
         
         # Обрабатываем видео покадрово
         lost_tracking_count = 0
-        max_lost_frames = 50  # Максимум кадров без трекинга перед остановкой
+        # После стольких кадров без трекинга участок считается оборванным: обработка
+        # продолжается, ORB-SLAM3 сам заводит в атласе новую карту
+        max_lost_frames = 50
+        segments = MapSegments(initial_data.get('segments'), initial_data.get('map_merges'))
+        # Проверяем уровень один раз: при выключенном DEBUG покадровые сообщения ничего не стоят
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        last_checkpoint = time.monotonic()
         
         while True:
-            ret, info = runner.process_frame()
+            frame_start = time.perf_counter()
+            ret, info, new_points_added, stream_points = await _call_slam(_track_frame, runner, point_map, profiler)
             
             if not ret:
-                print(f"[INFO] Finished processing video {processing_id}")
+                logger.info("Finished processing video %s", processing_id)
                 break
             
             # Обновляем данные в store
             update_data = {
                 'processed_frames': runner.frame_idx,
+                'skipped_frames': runner.skipped_frames,
                 'status': 'processing'
             }
+            if runner.orb_features is not None:
+                update_data['orb_features'] = runner.orb_features
+            append_data = {}
             
             if info:
                 # Трекинг успешен
@@ -246,144 +470,174 @@ async def start_processing(processing_id: str, video_path: str) -> Optional[str]
                 update_data['current_pose'] = info['pose'].tolist() if info['pose'] is not None else None
                 update_data['tracked_points_count'] = tracked_points
                 
-                # Текущие отслеживаемые точки (для отображения)
-                current_points_list = []
-                if info['points'] is not None and len(info['points']) > 0:
-                    max_current = min(500, len(info['points']))
-                    for i in range(max_current):
-                        point = info['points'][i]
-                        if len(point) >= 3:
-                            current_points_list.append({
-                                'x': float(point[0]),
-                                'y': float(point[1]),
-                                'z': float(point[2])
-                            })
-                update_data['tracked_points'] = current_points_list
-                
-                # Получаем 2D ключевые точки напрямую из C++
-                keypoints_2d_list = []
-                if 'keypoints_2d' in info and info['keypoints_2d'] is not None and len(info['keypoints_2d']) > 0:
-                    max_keypoints = min(200, len(info['keypoints_2d']))
-                    for i in range(max_keypoints):
-                        kp = info['keypoints_2d'][i]
-                        if len(kp) >= 2:
-                            keypoints_2d_list.append({
-                                'x': float(kp[0]),
-                                'y': float(kp[1])
-                            })
-                    
-                    print(f"[DEBUG] Got {len(keypoints_2d_list)} 2D keypoints from C++")
-                    if keypoints_2d_list:
-                        print(f"[DEBUG] First 2D point: ({keypoints_2d_list[0]['x']:.1f}, {keypoints_2d_list[0]['y']:.1f})")
-                
-                update_data['keypoints_2d'] = keypoints_2d_list
-                
-                # Накапливаем все точки карты (добавляем только новые уникальные точки)
-                if info['points'] is not None and len(info['points']) > 0:
-                    # Получаем существующие точки карты
-                    processing_data = store.get(processing_id).data
-                    all_map_points = processing_data.get('all_map_points', [])
-                    
-                    # Создаём set существующих точек для быстрой проверки
-                    existing_points_set = {(p['x'], p['y'], p['z']) for p in all_map_points}
+                with profiler.stage('postprocess'):
+                    # Текущие отслеживаемые точки (для отображения), прореженные по пространству
+                    current_points_list = []
+                    if info['points'] is not None and len(info['points']) > 0:
+                        points = np.asarray(info['points'], dtype=np.float32)
+                        selected = spatial_subsample(points, TRACKED_POINTS_BUDGET)
+                        current_points_list = points_to_dicts(points[selected])
+                    update_data['tracked_points'] = current_points_list
                     
-                    # Добавляем новые точки
-                    new_points_added = 0
-                    for point in info['points']:
-                        if len(point) >= 3:
-                            point_tuple = (float(point[0]), float(point[1]), float(point[2]))
-                            # Проверяем уникальность с небольшим допуском (округление до 3 знаков)
-                            rounded_point = (round(point_tuple[0], 3), round(point_tuple[1], 3), round(point_tuple[2], 3))
-                            if rounded_point not in existing_points_set:
-                                all_map_points.append({
-                                    'x': point_tuple[0],
-                                    'y': point_tuple[1],
-                                    'z': point_tuple[2]
-                                })
-                                existing_points_set.add(rounded_point)
-                                new_points_added += 1
-                                
-                                # Ограничиваем общее количество точек для производительности
-                                if len(all_map_points) >= 5000:
-                                    break
+                    # Получаем 2D ключевые точки напрямую из C++
+                    keypoints_2d_list = []
+                    if 'keypoints_2d' in info and info['keypoints_2d'] is not None and len(info['keypoints_2d']) > 0:
+                        keypoints = np.asarray(info['keypoints_2d'], dtype=np.float32)
+                        selected = spatial_subsample(keypoints, KEYPOINTS_2D_BUDGET)
+                        keypoints_2d_list = keypoints_to_dicts(keypoints[selected])
                     
-                    update_data['all_map_points'] = all_map_points
+                        if debug_enabled:
+                            logger.debug("Got %d 2D keypoints from C++", len(keypoints_2d_list),
+                                         extra={'processing_id': processing_id, 'frame': info['frame']})
                     
-                    if new_points_added > 0:
-                        print(f"[Frame {info['frame']:05d}] Added {new_points_added} new map points, total: {len(all_map_points)}")
+                    update_data['keypoints_2d'] = keypoints_2d_list
+                
+                # Карта точек накоплена в _track_frame, здесь — только готовая выборка
+                if stream_points is not None:
+                    update_data['all_map_points'] = stream_points
+                    update_data['map_points_total'] = len(point_map)
+                    if debug_enabled:
+                        logger.debug("Added %d new map points, total: %d", new_points_added, len(point_map),
+                                     extra={'processing_id': processing_id, 'frame': info['frame']})
                 
                 # Проверяем количество точек
                 if tracked_points < 15:
                     lost_tracking_count += 1
-                    print(f"[WARNING] Frame {info['frame']:05d} - Low tracking quality: {tracked_points} points")
+                    logger.warning("Low tracking quality: %d points", tracked_points,
+                                   extra={'processing_id': processing_id, 'frame': info['frame']})
                 else:
                     lost_tracking_count = 0  # Сбрасываем счетчик при хорошем трекинге
                 
                 # Добавляем позицию в траекторию только если есть достаточно точек
                 if info['pose'] is not None and tracked_points >= 15:
-                    trajectory = store.get(processing_id).data.get('trajectory', [])
-                    trajectory.append({
+                    event = segments.observe(info['frame'], info.get('map_id'), info.get('num_maps'))
+                    if event == 'merged':
+                        logger.info("Map %s merged into map %s", segments.merges[-1][0], segments.merges[-1][1],
+                                    extra={'processing_id': processing_id, 'frame': info['frame']})
+                    elif event == 'new_segment':
+                        logger.info("Started trajectory segment %d (map %s)", segments.current['id'], info.get('map_id'),
+                                    extra={'processing_id': processing_id, 'frame': info['frame']})
+                    
+                    # Траектория только растёт: новый снимок дописывает позу, не копируя прежние
+                    append_data['trajectory'] = [{
                         'frame': info['frame'],
-                        'pose': info['pose'].tolist()
-                    })
-                    update_data['trajectory'] = trajectory
+                        'pose': info['pose'].tolist(),
+                        'segment': segments.current['id']
+                    }]
+                    update_data['segments'] = segments.to_list()
+                    update_data['map_merges'] = segments.merges
                 
-                if tracked_points >= 15:
-                    print(f"[Frame {info['frame']:05d}] Tracking OK - {tracked_points} points")
+                if tracked_points >= 15 and debug_enabled:
+                    logger.debug("Tracking OK - %d points", tracked_points,
+                                 extra={'processing_id': processing_id, 'frame': info['frame']})
             else:
                 # Трекинг потерян
                 lost_tracking_count += 1
-                print(f"[Frame {runner.frame_idx:05d}] Tracking LOST")
+                logger.info("Tracking LOST", extra={'processing_id': processing_id, 'frame': runner.frame_idx})
                 
                 # Не пытаемся сбросить трекинг, так как это вызывает segfault
                 # Просто продолжаем обработку - ORB-SLAM3 может восстановиться самостоятельно
             
-            # Проверяем, не потерян ли трекинг надолго
-            if lost_tracking_count >= max_lost_frames:
-                print(f"[WARNING] Tracking lost for {lost_tracking_count} frames. Stopping processing.")
-                update_data['status'] = 'completed_with_warnings'
-                update_data['warning'] = f'Tracking lost after frame {runner.frame_idx - max_lost_frames}'
-                store.update_data(processing_id, update_data)
-                break
+            # Трекинг потерян надолго: закрываем участок и идём дальше по видео
+            if lost_tracking_count == max_lost_frames:
+                segments.mark_lost()
+                logger.warning("Tracking lost for %d frames, continuing in a new map", lost_tracking_count,
+                               extra={'processing_id': processing_id, 'frame': runner.frame_idx})
             
-            store.update_data(processing_id, update_data)
+            with profiler.stage('store_update'):
+                store.update_data(processing_id, update_data, append=append_data)
+            profiler.observe(FRAME_STAGE, time.perf_counter() - frame_start)
+            memory.maybe_sample(runner.frame_idx)
+            
+            # Периодический чекпоинт: SLAM стоит, пока атлас пишется в отдельном потоке
+            if CHECKPOINT_ENABLED and time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                with profiler.stage('checkpoint'):
+                    processing = store.get(processing_id)
+                    try:
+                        await asyncio.to_thread(
+                            save_checkpoint,
+                            processing_id,
+                            processing.type,
+                            video_path,
+                            runner.frame_idx,
+                            processing.data.to_dict(),
+                            point_map.points.copy(),
+                            runner
+                        )
+                    except Exception as e:
+                        logger.warning("Failed to save checkpoint: %s", e, extra={'processing_id': processing_id})
+                last_checkpoint = time.monotonic()
             
             # Даем возможность другим задачам выполняться
             await asyncio.sleep(0)
         
         # Безопасно завершаем обработку
         try:
-            runner.stop()
+            if SLAM_PROCESS:
+                # Память дочернего процесса перед остановкой — всё, что SLAM накопил за задачу
+                memory.record_process('slam_process', runner.pid)
+            with memory.measure('runner_stop', in_process=not SLAM_PROCESS):
+                await _call_slam(runner.stop)
         except Exception as e:
-            print(f"[WARNING] Error during shutdown: {e}")
+            logger.warning("Error during shutdown: %s", e)
         
-        store.update_data(processing_id, {'status': 'completed'})
+        # Атлас записан при shutdown; рядом кладём полную карту точек для библиотеки
+        if save_atlas:
+            try:
+                await asyncio.to_thread(save_job_map_points, processing_id, point_map.points.copy())
+            except Exception as e:
+                logger.warning("Failed to save map points: %s", e, extra={'processing_id': processing_id})
+        # Полная карта — на диск для выгрузки и LOD; в памяти она живёт только пока идёт обработка
+        try:
+            await asyncio.to_thread(save_result_points, processing_id, point_map.points)
+        except Exception as e:
+            logger.warning("Failed to save result map: %s", e, extra={'processing_id': processing_id})
+        drop_point_map(processing_id)
+        
+        # Несколько несвязанных карт — результат полный, но в разных системах координат
+        final_data = {'status': 'completed', 'segments': segments.to_list(), 'map_merges': segments.merges}
+        maps_count = segments.count_maps()
+        if maps_count > 1:
+            final_data['status'] = 'completed_with_warnings'
+            final_data['warning'] = f'Video is covered by {maps_count} disconnected maps'
+        store.update_data(processing_id, final_data)
         store.set_active(processing_id, False)
+        # Обход data и снимок tracemalloc не быстрые — не на event loop
+        await asyncio.to_thread(get_memory_tracker().finish_job, memory, store.snapshot(processing_id))
+        delete_checkpoint(processing_id)
         
         # Удаляем временный конфиг
         if temp_config_path and Path(temp_config_path).exists():
             try:
                 os.remove(temp_config_path)
-                print(f"[INFO] Removed temp config: {temp_config_path}")
+                logger.info("Removed temp config: %s", temp_config_path)
             except Exception as e:
-                print(f"[WARNING] Failed to remove temp config: {e}")
+                logger.warning("Failed to remove temp config: %s", e)
         
         return processing_id
         
     except Exception as e:
-        print(f"[ERROR] Processing failed: {e}")
+        logger.exception("Processing failed: %s", e, extra={'processing_id': processing_id})
         store.update_data(processing_id, {
             'status': 'failed',
             'error': str(e)
         })
         store.set_active(processing_id, False)
+        drop_point_map(processing_id)
+        # Дочерний процесс SLAM и его общая память не должны пережить обработку
+        if isinstance(runner, SlamProcessRunner):
+            await _call_slam(runner.terminate)
+        if memory is not None:
+            await asyncio.to_thread(get_memory_tracker().finish_job, memory, store.snapshot(processing_id))
+        # Ошибка повторится и при возобновлении — чекпоинт больше не нужен
+        delete_checkpoint(processing_id)
         
         # Удаляем временный конфиг при ошибке
         if temp_config_path and Path(temp_config_path).exists():
             try:
                 os.remove(temp_config_path)
-                print(f"[INFO] Removed temp config after error: {temp_config_path}")
+                logger.info("Removed temp config after error: %s", temp_config_path)
             except Exception as e:
-                print(f"[WARNING] Failed to remove temp config: {e}")
+                logger.warning("Failed to remove temp config: %s", e)
         
         return None
\ No newline at end of file
@@ -0,0 +1,198 @@
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+# Поля заголовка слота (int64)
+_PROCESSED, _FLAGS, _MAP_ID, _POINTS, _KEYPOINTS, _POINTS_DROPPED, _END, _SKIPPED, _FEATURES, _NUM_MAPS = range(10)
+_HAS_INFO, _HAS_POSE = 1, 2
+_META_FIELDS = 10
+_NO_MAP = -1
+
+
+class SlamResultRing:
+    """
+    Кольцевой буфер покадровых результатов SLAM в общей памяти: один
+    производитель (процесс с ORB-SLAM3), один потребитель (процесс API).
+
+    Слот фиксированной раскладки: заголовок (кадров подано, флаги, id карты,
+    длины), поза 4×4, до max_points точек N×3 и до max_keypoints точек N×2,
+    всё float32. Потребитель получает view на слот без копирования и
+    держит его до release().
+
+    Синхронизация — только семафорами (свободные и готовые слоты) и
+    счётчиками последовательности: в отличие от блокировок, семафор не
+    остаётся захваченным, если производитель упал, поэтому потребитель
+    ждёт с таймаутом и проверяет, жив ли процесс.
+    """
+
+    def __init__(self, slots: int, max_points: int, max_keypoints: int,
+                 context: Optional[multiprocessing.context.BaseContext] = None):
+        context = context or multiprocessing.get_context()
+        self.slots = slots
+        self.max_points = max_points
+        self.max_keypoints = max_keypoints
+        self._layout()
+        self._shm = shared_memory.SharedMemory(create=True, size=self._slot_bytes * slots + 16)
+        self._owner = True
+        self._free = context.Semaphore(slots)
+        self._ready = context.Semaphore(0)
+        self._views = None
+        self.sequence[:] = 0
+
+    def _layout(self) -> None:
+        self._meta_bytes = _META_FIELDS * 8
+        self._pose_bytes = 16 * 4
+        self._points_bytes = self.max_points * 3 * 4
+        self._keypoints_bytes = self.max_keypoints * 2 * 4
+        self._slot_bytes = self._meta_bytes + self._pose_bytes + self._points_bytes + self._keypoints_bytes
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shm_name'] = self._shm.name
+        del state['_shm']
+        state['_views'] = None
+        state['_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        name = state.pop('_shm_name')
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def sequence(self) -> np.ndarray:
+        """[опубликовано кадров, прочитано кадров] — для диагностики отставания."""
+        return np.ndarray((2,), dtype=np.int64, buffer=self._shm.buf, offset=self._slot_bytes * self.slots)
+
+    def _slot(self, index: int) -> Dict[str, np.ndarray]:
+        if self._views is None:
+            views = []
+            buf = self._shm.buf
+            for slot in range(self.slots):
+                offset = slot * self._slot_bytes
+                meta = np.ndarray((_META_FIELDS,), dtype=np.int64, buffer=buf, offset=offset)
+                offset += self._meta_bytes
+                pose = np.ndarray((4, 4), dtype=np.float32, buffer=buf, offset=offset)
+                offset += self._pose_bytes
+                points = np.ndarray((self.max_points, 3), dtype=np.float32, buffer=buf, offset=offset)
+                offset += self._points_bytes
+                keypoints = np.ndarray((self.max_keypoints, 2), dtype=np.float32, buffer=buf, offset=offset)
+                views.append({'meta': meta, 'pose': pose, 'points': points, 'keypoints': keypoints})
+            self._views = views
+        return self._views[index % self.slots]
+
+    # ---------- производитель ----------
+    def acquire_slot(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт свободный слот; False — не освободился за timeout."""
+        return self._free.acquire(timeout=timeout)
+
+    def publish(self, processed: int, map_id: Optional[int], info: Optional[Dict[str, Any]],
+                end: bool = False, skipped: int = 0, features: Optional[int] = None,
+                num_maps: Optional[int] = None) -> None:
+        """
+        Пишет результат кадра в слот, захваченный acquire_slot(), и отдаёт
+        его потребителю. Точки сверх ёмкости слота отбрасываются (их число
+        передаётся в points_dropped).
+
+        Args:
+            processed: Сколько кадров подано в SLAM (runner.frame_idx)
+            map_id: Активная карта атласа
+            info: Результат process_frame() или None, если трекинга нет
+            end: Видео кончилось, кадра нет
+            skipped: Сколько кадров всего пропущено FrameGate
+            features: Текущий бюджет ORB-признаков (FeatureBudget) или None
+            num_maps: Живых карт в атласе или None
+        """
+        sequence = self.sequence
+        slot = self._slot(int(sequence[0]))
+        meta = slot['meta']
+        meta[:] = 0
+        meta[_PROCESSED] = processed
+        meta[_END] = int(end)
+        meta[_SKIPPED] = skipped
+        meta[_FEATURES] = features or 0
+        meta[_MAP_ID] = _NO_MAP if map_id is None else map_id
+        meta[_NUM_MAPS] = _NO_MAP if num_maps is None else num_maps
+        if info is not None:
+            meta[_FLAGS] = _HAS_INFO
+            pose = info.get('pose')
+            if pose is not None:
+                meta[_FLAGS] |= _HAS_POSE
+                slot['pose'][:] = pose
+            for key, field, capacity in (('points', _POINTS, self.max_points),
+                                         ('keypoints_2d', _KEYPOINTS, self.max_keypoints)):
+                rows = info.get(key)
+                count = 0 if rows is None else len(rows)
+                stored = min(count, capacity)
+                if stored:
+                    slot['points' if key == 'points' else 'keypoints'][:stored] = rows[:stored]
+                meta[field] = stored
+                if key == 'points':
+                    meta[_POINTS_DROPPED] = count - stored
+        sequence[0] += 1
+        self._ready.release()
+
+    # ---------- потребитель ----------
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Следующий результат или None, если за timeout его не было.
+
+        Returns:
+            {'processed', 'skipped', 'features', 'map_id', 'num_maps', 'end', 'points_dropped',
+            'info'}; info — как
+            у OrbslamMonoRunner.process_frame(), но без траектории (None),
+            массивы — view на слот до release()
+        """
+        if not self._ready.acquire(timeout=timeout):
+            return None
+        slot = self._slot(int(self.sequence[1]))
+        meta = slot['meta']
+        processed = int(meta[_PROCESSED])
+        map_id = int(meta[_MAP_ID]) if meta[_MAP_ID] != _NO_MAP else None
+        num_maps = int(meta[_NUM_MAPS]) if meta[_NUM_MAPS] != _NO_MAP else None
+        info = None
+        if meta[_FLAGS] & _HAS_INFO:
+            points = int(meta[_POINTS])
+            keypoints = int(meta[_KEYPOINTS])
+            info = {
+                'frame': processed - 1,
+                'pose': slot['pose'] if meta[_FLAGS] & _HAS_POSE else None,
+                'trajectory': None,
+                'points': slot['points'][:points] if points else None,
+                'keypoints_2d': slot['keypoints'][:keypoints] if keypoints else None,
+                'map_id': map_id,
+                'num_maps': num_maps,
+            }
+        return {
+            'processed': processed,
+            'skipped': int(meta[_SKIPPED]),
+            'features': int(meta[_FEATURES]) or None,
+            'map_id': map_id,
+            'num_maps': num_maps,
+            'end': bool(meta[_END]),
+            'points_dropped': int(meta[_POINTS_DROPPED]),
+            'info': info,
+        }
+
+    def release(self) -> None:
+        """Возвращает прочитанный слот производителю."""
+        self.sequence[1] += 1
+        self._free.release()
+
+    # ---------- ресурсы ----------
+    def dispose(self) -> None:
+        """
+        Закрывает общую память; владелец (создатель) её ещё и удаляет.
+        Если у потребителя остались view на слот, отображение закроется
+        вместе с ними при сборке мусора.
+        """
+        self._views = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+        if self._owner:
+            self._shm.unlink()
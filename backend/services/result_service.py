@@ -0,0 +1,95 @@
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from services.codec_service import load_points, save_points
+from services.lod_service import VoxelPointCloud
+from log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Результаты завершённых обработок (относительно рабочего каталога; в режиме
+# очереди — на общем томе: пишет воркер, читает API-узел)
+RESULTS_DIR = "results"
+# Сколько результатов последних обработок хранить на диске
+RESULTS_KEPT = int(os.environ.get("RESULTS_KEPT", "200"))
+# Сколько карт завершённых обработок держать перестроенными в памяти для /map
+RESULT_MAPS_CACHED = int(os.environ.get("RESULT_MAPS_CACHED", "4"))
+
+# Полная карта точек в формате codec_service, всегда f32 — без потерь
+_MAP_FILE = "map.slmq"
+
+# processing_id -> (mtime файла карты, перестроенная карта); последние RESULT_MAPS_CACHED
+_point_maps: 'OrderedDict[str, Tuple[float, VoxelPointCloud]]' = OrderedDict()
+_point_maps_lock = threading.Lock()
+
+
+def _result_dir(processing_id: str) -> str:
+    return os.path.join(RESULTS_DIR, processing_id)
+
+
+def _prune(keep: str) -> None:
+    """Убирает самые старые результаты сверх RESULTS_KEPT."""
+    entries = sorted(
+        (entry for entry in os.scandir(RESULTS_DIR) if entry.is_dir() and entry.name != keep),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in entries[:max(0, len(entries) - RESULTS_KEPT + 1)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def save_result_points(processing_id: str, map_points: np.ndarray) -> None:
+    """
+    Сохраняет полную карту точек завершённой обработки: после этого живая
+    карта в памяти не нужна, а выгрузка и LOD читают её отсюда.
+    """
+    directory = _result_dir(processing_id)
+    os.makedirs(directory, exist_ok=True)
+    _prune(processing_id)
+    temp_path = os.path.join(directory, f"{_MAP_FILE}.next")
+    save_points(temp_path, map_points, 'f32')
+    os.replace(temp_path, os.path.join(directory, _MAP_FILE))
+
+
+def load_result_points(processing_id: str) -> Optional[np.ndarray]:
+    """Полная карта точек обработки или None, если она не сохранялась (или уже убрана)."""
+    map_file = os.path.join(_result_dir(processing_id), _MAP_FILE)
+    return load_points(map_file) if os.path.exists(map_file) else None
+
+
+
+def load_result_point_map(processing_id: str) -> Optional[VoxelPointCloud]:
+    """
+    Полная карта обработки на воксельной сетке (для выборок /map) или None.
+
+    Перестройка большой карты и её выборки стоят секунд, поэтому последние
+    RESULT_MAPS_CACHED карт держатся в памяти. Запись сверяется с mtime
+    файла: перезаписанный или убранный результат не отдаётся из кеша.
+    """
+    map_file = os.path.join(_result_dir(processing_id), _MAP_FILE)
+    try:
+        mtime = os.stat(map_file).st_mtime
+    except OSError:
+        with _point_maps_lock:
+            _point_maps.pop(processing_id, None)
+        return None
+
+    with _point_maps_lock:
+        cached = _point_maps.get(processing_id)
+        if cached is not None and cached[0] == mtime:
+            _point_maps.move_to_end(processing_id)
+            return cached[1]
+
+    point_map = VoxelPointCloud()
+    point_map.add(load_points(map_file))
+    with _point_maps_lock:
+        _point_maps[processing_id] = (mtime, point_map)
+        _point_maps.move_to_end(processing_id)
+        while len(_point_maps) > RESULT_MAPS_CACHED:
+            _point_maps.popitem(last=False)
+    return point_map
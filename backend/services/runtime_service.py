@@ -0,0 +1,92 @@
+import asyncio
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Загрузить OpenCV и orbslam3 заранее, в фоне после старта сервера
+SLAM_WARMUP = os.environ.get("SLAM_WARMUP", "0") == "1"
+
+_lock = threading.Lock()
+_stack: Optional[SimpleNamespace] = None
+_state: Dict = {
+    'slam_loaded': False,
+    'slam_load_seconds': None,
+    'slam_error': None,
+    'warmup_requested': SLAM_WARMUP,
+}
+_started_at = time.time()
+
+
+def load_slam_stack() -> SimpleNamespace:
+    """
+    Лениво импортирует тяжёлый стек обработки: OpenCV, обёртку ORB-SLAM3
+    и нативный модуль orbslam3. Реплики, которые только принимают загрузки
+    и отдают статику, эти модули не загружают вовсе.
+
+    Returns:
+        Пространство имён с cv2 и OrbslamMonoRunner
+
+    Raises:
+        ImportError: Нативный модуль не найден или не загрузился
+    """
+    global _stack
+    if _stack is not None:
+        return _stack
+
+    with _lock:
+        if _stack is not None:
+            return _stack
+
+        start = time.perf_counter()
+        try:
+            import cv2
+            from lib.orb_slam.orb_slam import OrbslamMonoRunner, load_orbslam3
+            load_orbslam3()
+        except Exception as e:
+            _state['slam_error'] = str(e)
+            logger.error("Failed to load SLAM stack: %s", e)
+            raise
+
+        _stack = SimpleNamespace(cv2=cv2, OrbslamMonoRunner=OrbslamMonoRunner)
+        _state['slam_loaded'] = True
+        _state['slam_error'] = None
+        _state['slam_load_seconds'] = time.perf_counter() - start
+        logger.info("SLAM stack loaded in %.2f s", _state['slam_load_seconds'])
+        return _stack
+
+
+async def load_slam_stack_async() -> SimpleNamespace:
+    """load_slam_stack() в потоке, чтобы первая загрузка не блокировала event loop."""
+    if _stack is not None:
+        return _stack
+    return await asyncio.to_thread(load_slam_stack)
+
+
+async def warm_up() -> None:
+    """Фоновая предзагрузка стека при SLAM_WARMUP=1."""
+    try:
+        await load_slam_stack_async()
+    except Exception:
+        # Ошибка уже в логе и в состоянии readiness
+        pass
+
+
+def get_runtime_state() -> Dict:
+    return {
+        **_state,
+        'uptime_seconds': time.time() - _started_at,
+    }
+
+
+def is_ready() -> bool:
+    """Готов ли процесс принимать трафик: без предзагрузки — сразу, иначе после неё."""
+    if not _state['warmup_requested']:
+        return True
+    return _state['slam_loaded']
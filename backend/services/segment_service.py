@@ -0,0 +1,124 @@
+from typing import Dict, List, Optional
+
+
+class MapSegments:
+    """
+    Разбиение траектории на сегменты по картам атласа ORB-SLAM3.
+
+    Сегмент — непрерывный участок трекинга в одной карте. Новый сегмент
+    начинается, когда активная карта сменилась на новую (ORB-SLAM3 завёл её
+    после потери трекинга) или трекинг вернулся после долгой потери.
+
+    Слияние карт видно двумя способами:
+    - число живых карт атласа уменьшилось (get_num_maps): ORB-SLAM3
+      помечает слитую карту плохой и убирает из атласа, а активной может
+      остаться текущая карта;
+    - активной снова стала карта одного из прошлых сегментов.
+    Слитая карта записывается в merges парой [карта, куда слита].
+
+    Состояние целиком лежит в Processing.data ('segments', 'map_merges'),
+    поэтому переживает чекпоинты.
+    """
+
+    def __init__(self, segments: Optional[List[Dict]] = None, merges: Optional[List[List[int]]] = None):
+        self.segments: List[Dict] = [dict(segment) for segment in segments or []]
+        # Пары [карта, в которую она слита]
+        self.merges: List[List[int]] = [list(pair) for pair in merges or []]
+        self._lost = False
+        # Живых карт в атласе на прошлом кадре (None — биндинг без get_num_maps)
+        self._live_maps: Optional[int] = None
+
+    @property
+    def current(self) -> Optional[Dict]:
+        return self.segments[-1] if self.segments else None
+
+    def _start(self, frame: int, map_id: Optional[int]) -> Dict:
+        segment = {
+            'id': len(self.segments),
+            'map_id': map_id,
+            'start_frame': frame,
+            'end_frame': frame,
+            'poses': 0,
+        }
+        self.segments.append(segment)
+        self._lost = False
+        return segment
+
+    def _absorbed(self, count: int, map_id: int) -> List[int]:
+        """Карты прошлых сегментов, ещё не слитые с map_id, — последние count из них."""
+        target = self.resolve_map(map_id)
+        candidates: List[int] = []
+        for segment in reversed(self.segments):
+            root = self.resolve_map(segment['map_id'])
+            if root is not None and root != target and root not in candidates:
+                candidates.append(root)
+        return candidates[:count]
+
+    def observe(self, frame: int, map_id: Optional[int], num_maps: Optional[int] = None) -> Optional[str]:
+        """
+        Учитывает кадр с успешным трекингом.
+
+        Args:
+            num_maps: Живых карт в атласе (get_num_maps) или None
+
+        Returns:
+            'new_segment', 'merged' или None, если сегмент продолжился
+        """
+        event = None
+        if num_maps is not None:
+            previous, self._live_maps = self._live_maps, num_maps
+            if previous is not None and num_maps < previous and map_id is not None:
+                # Какие карты ушли, атлас не сообщает: в типичном случае (потеря → новая
+                # карта → узнанное место) это самая свежая из прошлых несвязанных
+                for absorbed in self._absorbed(previous - num_maps, map_id):
+                    self.merges.append([absorbed, map_id])
+                    event = 'merged'
+
+        current = self.current
+
+        if current is None:
+            self._start(frame, map_id)
+        elif map_id is not None and map_id != current['map_id']:
+            known_maps = {segment['map_id'] for segment in self.segments[:-1]}
+            if map_id in known_maps and current['map_id'] is not None:
+                if self.resolve_map(current['map_id']) != self.resolve_map(map_id):
+                    self.merges.append([current['map_id'], map_id])
+                event = 'merged'
+            else:
+                event = event or 'new_segment'
+            self._start(frame, map_id)
+        elif self._lost:
+            # Карта та же (или биндинг не сообщает id), но между участками долгая потеря
+            self._start(frame, map_id)
+            event = 'new_segment'
+
+        segment = self.current
+        segment['end_frame'] = frame
+        segment['poses'] += 1
+        return event
+
+    def mark_lost(self) -> None:
+        """Долгая потеря трекинга: следующий удачный кадр откроет новый сегмент."""
+        self._lost = True
+
+    def resolve_map(self, map_id: Optional[int]) -> Optional[int]:
+        """Карта, в которой в итоге оказалась map_id после всех слияний."""
+        merged = {source: target for source, target in self.merges}
+        seen = set()
+        while map_id in merged and map_id not in seen:
+            seen.add(map_id)
+            map_id = merged[map_id]
+        return map_id
+
+    def to_list(self) -> List[Dict]:
+        result = []
+        for segment in self.segments:
+            root = self.resolve_map(segment['map_id'])
+            result.append({**segment, 'merged_into': root if root != segment['map_id'] else None})
+        return result
+
+    def count_maps(self) -> int:
+        """Сколько несвязанных карт покрывают видео после слияний."""
+        if any(segment['map_id'] is None for segment in self.segments):
+            return len(self.segments)
+        return len({self.resolve_map(segment['map_id']) for segment in self.segments})
@@ -0,0 +1,234 @@
+"""
+ORB-SLAM3 в отдельном процессе.
+
+SlamProcessRunner повторяет интерфейс OrbslamMonoRunner, но сам SLAM
+(декодирование и трекинг) работает в дочернем процессе, а покадровые
+результаты приходят через SlamResultRing в общей памяти без копирования
+и сериализации. Падение нативного кода (segfault, abort) убивает только
+дочерний процесс: API видит это как RuntimeError в process_frame().
+"""
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Dict, Optional, Tuple
+
+from services.result_ring import SlamResultRing
+from log import configure_logging, get_logger
+
+
+logger = get_logger(__name__)
+
+# Слотов в кольце: насколько дочерний процесс может обогнать API
+SLAM_RESULT_SLOTS = int(os.environ.get("SLAM_RESULT_SLOTS", "8"))
+# Ёмкость слота; больше точек на кадре ORB-SLAM3 обычно не отслеживает
+SLAM_RESULT_MAX_POINTS = int(os.environ.get("SLAM_RESULT_MAX_POINTS", "4096"))
+SLAM_RESULT_MAX_KEYPOINTS = int(os.environ.get("SLAM_RESULT_MAX_KEYPOINTS", "2048"))
+# Как часто API проверяет, жив ли процесс, пока ждёт кадр или ответ
+LIVENESS_INTERVAL = 0.5
+# Запуск процесса и загрузка словаря ORB-SLAM3 занимают секунды
+STARTUP_TIMEOUT = 300.0
+STOP_TIMEOUT = 60.0
+
+
+def _slam_worker(settings_file: str, runner_options: Dict[str, Any], ring: SlamResultRing, conn) -> None:
+    """
+    Дочерний процесс: OrbslamMonoRunner, команды из conn, результаты в ring.
+
+    Команды проверяются между кадрами и пока кольцо заполнено, поэтому
+    save_atlas и stop не ждут, пока API дочитает кольцо.
+    """
+    configure_logging()
+    from services.runtime_service import load_slam_stack
+    try:
+        runner = load_slam_stack().OrbslamMonoRunner(settings_file, **runner_options)
+    except Exception as e:
+        conn.send(('error', str(e)))
+        return
+    conn.send(('ok', None))
+
+    running = False
+    while True:
+        if not running or conn.poll():
+            command, args = conn.recv()
+            if command == 'stop':
+                runner.stop()
+                conn.send(('ok', None))
+                return
+            try:
+                if command == 'open_video':
+                    runner.open_video(*args)
+                    running = True
+                    result = runner.dt
+                elif command == 'set_localization_mode':
+                    result = runner.set_localization_mode(*args)
+                elif command == 'save_atlas':
+                    result = runner.save_atlas(*args)
+                else:
+                    raise ValueError(f"Unknown command: {command}")
+            except Exception as e:
+                conn.send(('error', str(e)))
+            else:
+                conn.send(('ok', result))
+            continue
+
+        if not ring.acquire_slot(timeout=LIVENESS_INTERVAL):
+            continue
+        ret, info = runner.process_frame()
+        ring.publish(runner.frame_idx, runner.map_id, info, end=not ret, skipped=runner.skipped_frames,
+                     features=runner.orb_features, num_maps=runner.num_maps)
+        if not ret:
+            running = False
+
+
+class SlamProcessRunner:
+    """
+    Прокси OrbslamMonoRunner: тот же интерфейс (open_video, process_frame,
+    set_localization_mode, save_atlas, stop, frame_idx, skipped_frames,
+    orb_features, map_id, num_maps), SLAM — в дочернем процессе.
+
+    Отличия от OrbslamMonoRunner:
+    - в info нет траектории (trajectory = None), поза, точки и ключевые
+      точки — view на слот кольца, действительные до следующего вызова;
+    - точки сверх SLAM_RESULT_MAX_POINTS на кадре отбрасываются;
+    - дочерний процесс обгоняет API на SLAM_RESULT_SLOTS кадров, поэтому
+      атлас из save_atlas может содержать до стольких кадров после
+      frame_idx — при возобновлении из чекпоинта они подаются повторно.
+    """
+
+    def __init__(
+        self,
+        settings_file: str,
+        min_init_frames: int = 20,
+        profiler: Optional[Any] = None,
+        frame_gate: Optional[Dict[str, Any]] = None,
+        feature_budget: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.min_init = min_init_frames
+        self.profiler = profiler
+        self.dt: float = 0.033
+        self.frame_idx: int = 0
+        self.skipped_frames: int = 0
+        self.orb_features: Optional[int] = None
+        self.map_id: Optional[int] = None
+        self.num_maps: Optional[int] = None
+        self._holding = False
+        self._conn_lock = threading.Lock()
+
+        # spawn: дочернему процессу не достаются потоки и состояние сервера
+        context = multiprocessing.get_context('spawn')
+        self._ring = SlamResultRing(SLAM_RESULT_SLOTS, SLAM_RESULT_MAX_POINTS,
+                                    SLAM_RESULT_MAX_KEYPOINTS, context=context)
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_slam_worker,
+            args=(str(settings_file),
+                  {'min_init_frames': min_init_frames, 'frame_gate': frame_gate, 'feature_budget': feature_budget},
+                  self._ring, child_conn),
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        try:
+            self._wait_reply(STARTUP_TIMEOUT)
+        except Exception:
+            self.terminate()
+            raise
+
+    def _stage(self, name: str):
+        return self.profiler.stage(name) if self.profiler else nullcontext()
+
+    def _check_alive(self) -> None:
+        if not self._process.is_alive():
+            raise RuntimeError(f"SLAM worker crashed with exit code {self._process.exitcode}")
+
+    def _wait_reply(self, timeout: Optional[float] = None) -> Any:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._conn.poll(LIVENESS_INTERVAL):
+            self._check_alive()
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("SLAM worker did not respond")
+        try:
+            status, result = self._conn.recv()
+        except EOFError:
+            self._process.join(LIVENESS_INTERVAL)
+            self._check_alive()
+            raise
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def _call(self, command: str, *args, timeout: Optional[float] = None) -> Any:
+        with self._conn_lock:
+            self._check_alive()
+            self._conn.send((command, args))
+            return self._wait_reply(timeout)
+
+    # ---------- public ----------
+    def open_video(self, video_source: str, start_frame: int = 0) -> None:
+        self.dt = self._call('open_video', str(video_source), start_frame)
+        self.frame_idx = start_frame
+
+    def set_localization_mode(self, enabled: bool) -> None:
+        self._call('set_localization_mode', enabled)
+
+    def save_atlas(self, path: str) -> bool:
+        return bool(self._call('save_atlas', str(path)))
+
+    def process_frame(self) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Следующий результат из кольца (ожидание — стадия 'result_wait').
+
+        Raises:
+            RuntimeError: Дочерний процесс упал
+        """
+        if self._holding:
+            self._ring.release()
+            self._holding = False
+
+        with self._stage("result_wait"):
+            result = self._ring.get(timeout=LIVENESS_INTERVAL)
+            while result is None:
+                self._check_alive()
+                result = self._ring.get(timeout=LIVENESS_INTERVAL)
+        self._holding = True
+
+        self.frame_idx = result['processed']
+        self.skipped_frames = result['skipped']
+        self.orb_features = result['features']
+        self.map_id = result['map_id']
+        self.num_maps = result['num_maps']
+        if result['points_dropped']:
+            logger.debug("Dropped %d tracked points over slot capacity", result['points_dropped'],
+                         extra={'frame': self.frame_idx - 1})
+        if result['end']:
+            return False, None
+        return True, result['info']
+
+    @property
+    def pid(self) -> Optional[int]:
+        """PID дочернего процесса SLAM (для замеров памяти)."""
+        return self._process.pid
+
+    def stop(self) -> None:
+        """Shutdown SLAM в дочернем процессе (атлас пишется здесь), затем освобождение кольца."""
+        try:
+            if self._process.is_alive():
+                self._call('stop', timeout=STOP_TIMEOUT)
+                self._process.join(STOP_TIMEOUT)
+        except Exception as e:
+            logger.warning("Error during SLAM worker shutdown: %s", e)
+        finally:
+            self.terminate()
+
+    def terminate(self) -> None:
+        """Убивает дочерний процесс без shutdown (после ошибки) и освобождает ресурсы."""
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(STOP_TIMEOUT)
+        if self._ring is not None:
+            self._holding = False
+            self._ring.dispose()
+            self._ring = None
+        self._conn.close()
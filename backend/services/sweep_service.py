@@ -0,0 +1,244 @@
+"""
+Перебор параметров ORB-SLAM3 на одном видео.
+
+Видео декодируется один раз: кадры в grayscale кладутся в общий кольцевой
+буфер (SharedFrameRing), из которого их читают несколько процессов — по
+одному OrbslamMonoRunner на набор переопределений config.yaml. По итогу
+строится таблица сравнения: время, точки трекинга, потери.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import re
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from store import get_store
+from services.frame_ring import SharedFrameRing
+from services.processing_service import _generate_temp_config
+from services.runtime_service import load_slam_stack_async
+from log import configure_logging, get_logger
+
+
+logger = get_logger(__name__)
+
+# Сколько наборов параметров можно гонять одновременно
+SWEEP_MAX_CONFIGS = int(os.environ.get("SWEEP_MAX_CONFIGS", "8"))
+# Слотов в кольцевом буфере: запас, чтобы быстрые конфиги не ждали медленный на каждом кадре
+SWEEP_RING_SLOTS = int(os.environ.get("SWEEP_RING_SLOTS", "64"))
+# Кадр с меньшим числом точек считается потерей трекинга (как в start_processing)
+MIN_TRACKED_POINTS = 15
+PROGRESS_INTERVAL = 0.5
+WORKER_TIMEOUT = 300.0
+
+# Перебирать можно только параметры экстрактора, камеры и вьювера: System.* задаёт
+# пути к атласу и словарю, их из запроса менять нельзя
+OVERRIDE_PREFIXES = ('ORBextractor.', 'Camera.', 'Viewer.')
+_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$')
+
+
+def validate_overrides(overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Проверяет переопределения параметров config.yaml: ключ из разрешённых
+    секций (OVERRIDE_PREFIXES), значение — число или однострочная строка без кавычек.
+
+    Raises:
+        ValueError: Недопустимый ключ или значение
+    """
+    for key, value in overrides.items():
+        if not key.startswith(OVERRIDE_PREFIXES) or not _KEY_PATTERN.fullmatch(key[key.index('.') + 1:]):
+            raise ValueError(f"Config key {key!r} is not allowed, expected one of "
+                             f"{', '.join(prefix + '*' for prefix in OVERRIDE_PREFIXES)}")
+        if not isinstance(value, (int, float, str)) or (isinstance(value, str) and any(c in value for c in '"\r\n')):
+            raise ValueError(f"Invalid value for {key}: {value!r}")
+    return overrides
+
+
+def _sweep_worker(index: int, config_path: str, ring: SharedFrameRing, fps: float,
+                  results: multiprocessing.Queue) -> None:
+    """Процесс одного набора параметров: трекинг всех кадров из общего буфера."""
+    configure_logging()
+    runner = None
+    try:
+        from services.runtime_service import load_slam_stack
+        runner = load_slam_stack().OrbslamMonoRunner(config_path)
+        runner.dt = 1.0 / fps if fps > 0 else 0.033
+
+        tracked_counts: List[int] = []
+        lost_frames = 0
+        first_tracked = None
+        map_ids = set()
+        track_seconds = 0.0
+        last_progress = time.monotonic()
+
+        while True:
+            frame = ring.get(index, timeout=WORKER_TIMEOUT)
+            if frame is None:
+                break
+            start = time.perf_counter()
+            info = runner.process_image(frame)
+            track_seconds += time.perf_counter() - start
+            ring.release(index)
+
+            tracked = len(info['points']) if info and info['points'] is not None else 0
+            if tracked >= MIN_TRACKED_POINTS:
+                tracked_counts.append(tracked)
+                if first_tracked is None:
+                    first_tracked = runner.frame_idx - 1
+                if info.get('map_id') is not None:
+                    map_ids.add(info['map_id'])
+            elif runner.frame_idx > runner.min_init:
+                lost_frames += 1
+
+            if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                results.put(('progress', index, runner.frame_idx))
+                last_progress = time.monotonic()
+
+        frames = runner.frame_idx
+        results.put(('result', index, {
+            'frames': frames,
+            'track_seconds': round(track_seconds, 3),
+            'fps': round(frames / track_seconds, 2) if track_seconds > 0 else None,
+            'tracked_frames': len(tracked_counts),
+            'lost_frames': lost_frames,
+            'first_tracked_frame': first_tracked,
+            'mean_tracked_points': round(statistics.fmean(tracked_counts), 1) if tracked_counts else 0,
+            'median_tracked_points': statistics.median(tracked_counts) if tracked_counts else 0,
+            'maps': len(map_ids) or None,
+        }))
+    except Exception as e:
+        ring.detach(index)
+        results.put(('error', index, str(e)))
+    finally:
+        if runner:
+            runner.stop()
+        ring.dispose()
+
+
+def _decode(cv2, video_path: str, ring: SharedFrameRing, max_frames: Optional[int],
+            processes: List[multiprocessing.Process]) -> int:
+    """Декодирует видео один раз и раздаёт кадры всем процессам перебора."""
+    cap = cv2.VideoCapture(video_path)
+    produced = 0
+    try:
+        while max_frames is None or produced < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            while not ring.put(gray, timeout=1.0):
+                # Упавший процесс не должен вечно держать слот
+                for consumer, process in enumerate(processes):
+                    if not process.is_alive():
+                        ring.detach(consumer)
+                if not any(process.is_alive() for process in processes):
+                    return produced
+            produced += 1
+    finally:
+        cap.release()
+        ring.close()
+    return produced
+
+
+async def run_sweep(sweep_id: str, video_path: str, configs: List[Dict[str, Any]],
+                    max_frames: Optional[int] = None) -> None:
+    """
+    Запускает перебор: configs — [{'name': ..., 'overrides': {...}}, ...].
+    Прогресс и таблица результатов пишутся в Processing.data записи sweep_id.
+    """
+    store = get_store()
+    config_paths: List[str] = []
+    ring = None
+    processes: List[multiprocessing.Process] = []
+
+    try:
+        slam_stack = await load_slam_stack_async()
+        cv2 = slam_stack.cv2
+
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise RuntimeError(f'Cannot open video: {video_path}')
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        for index, config in enumerate(configs):
+            path = _generate_temp_config(width, height, fps, f"{sweep_id}_{index}",
+                                         overrides=config.get('overrides'))
+            if not path:
+                raise RuntimeError(f"Failed to generate config for {config['name']}")
+            config_paths.append(path)
+
+        # spawn: дочерним процессам не достаются потоки и состояние сервера
+        context = multiprocessing.get_context('spawn')
+        ring = SharedFrameRing((height, width), SWEEP_RING_SLOTS, len(configs), context=context)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_sweep_worker, args=(index, path, ring, fps, results), daemon=True)
+            for index, path in enumerate(config_paths)
+        ]
+        for process in processes:
+            process.start()
+
+        store.update_data(sweep_id, {
+            'status': 'processing',
+            'width': width,
+            'height': height,
+            'fps': fps,
+            'total_frames': min(total_frames, max_frames) if max_frames else total_frames,
+        })
+        started = time.perf_counter()
+        decoder = asyncio.create_task(asyncio.to_thread(_decode, cv2, video_path, ring, max_frames, processes))
+
+        table = [{'name': config['name'], 'overrides': config.get('overrides') or {}, 'status': 'processing',
+                  'processed_frames': 0} for config in configs]
+        pending = len(configs)
+        while pending:
+            try:
+                kind, index, payload = await asyncio.to_thread(results.get, True, PROGRESS_INTERVAL)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+            if kind == 'progress':
+                table[index]['processed_frames'] = payload
+            else:
+                pending -= 1
+                if kind == 'result':
+                    table[index].update(payload, status='completed', processed_frames=payload['frames'])
+                else:
+                    table[index].update(status='failed', error=payload)
+                    logger.warning("Sweep config %s failed: %s", configs[index]['name'], payload,
+                                   extra={'processing_id': sweep_id})
+            store.update_data(sweep_id, {'results': [dict(row) for row in table]})
+
+        decoded = await decoder
+        for row in table:
+            if row['status'] == 'processing':
+                row.update(status='failed', error='Worker exited without a result')
+        store.update_data(sweep_id, {
+            'status': 'completed',
+            'decoded_frames': decoded,
+            'wall_seconds': round(time.perf_counter() - started, 3),
+            'results': table,
+        })
+    except Exception as e:
+        logger.exception("Sweep failed: %s", e, extra={'processing_id': sweep_id})
+        store.update_data(sweep_id, {'status': 'failed', 'error': str(e)})
+    finally:
+        for process in processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        if ring:
+            ring.dispose()
+        for path in config_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        store.set_active(sweep_id, False)
@@ -1,8 +1,18 @@
+import os
 from .processing import Processing, ProcessingType
+from .snapshot import FrozenListView, Snapshot, json_default
 from .store import ProcessingStore
+from .job_queue import JobQueue
 
 
+# local — обработка в процессе API; queue — через общую очередь и воркеры
+PROCESSING_MODE = os.environ.get("PROCESSING_MODE", "local")
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", os.path.join("data", "jobs.sqlite3"))
+# Сколько завершённых задач хранит очередь: более старые удаляются вместе с прогрессом
+JOB_QUEUE_KEPT = int(os.environ.get("JOB_QUEUE_KEPT", "200"))
+
 _store_instance = None
+_job_queue_instance = None
 
 
 def get_store() -> ProcessingStore:
@@ -16,10 +26,23 @@ def create_store() -> ProcessingStore:
     return ProcessingStore()
 
 
+def get_job_queue() -> JobQueue:
+    global _job_queue_instance
+    if _job_queue_instance is None:
+        _job_queue_instance = JobQueue(JOB_QUEUE_PATH, max_finished=JOB_QUEUE_KEPT)
+    return _job_queue_instance
+
+
 __all__ = [
     'Processing',
     'ProcessingType',
     'ProcessingStore',
+    'Snapshot',
+    'FrozenListView',
+    'json_default',
+    'JobQueue',
+    'PROCESSING_MODE',
+    'get_job_queue',
     'get_store',
     'create_store'
 ]
@@ -0,0 +1,328 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .snapshot import json_default
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    processing_id TEXT PRIMARY KEY,
+    processing_type TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    heartbeat_at REAL,
+    data TEXT NOT NULL,
+    updated_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_updated_seq ON jobs (updated_seq);
+CREATE TABLE IF NOT EXISTS job_fields (
+    processing_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_seq INTEGER NOT NULL,
+    PRIMARY KEY (processing_id, key)
+);
+CREATE INDEX IF NOT EXISTS job_fields_updated_seq ON job_fields (updated_seq);
+CREATE TABLE IF NOT EXISTS job_appends (
+    processing_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    items TEXT NOT NULL,
+    updated_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_appends_updated_seq ON job_appends (updated_seq);
+CREATE INDEX IF NOT EXISTS job_appends_job_key ON job_appends (processing_id, key);
+"""
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """
+    Очередь задач обработки в SQLite на общем томе.
+
+    API-узлы ставят задачи (enqueue) и забирают прогресс (changes_since),
+    воркеры атомарно захватывают задачи (claim) и публикуют прогресс
+    (publish). Каждая запись получает монотонный updated_seq, так что
+    читателю достаточно помнить последний увиденный номер.
+
+    Прогресс хранится дельтами, а не целым data: заменяемые ключи — по
+    строке на ключ (job_fields), растущие списки (траектория) — строками
+    только с дописанными элементами (job_appends). Публикация и чтение
+    стоят пропорционально изменениям, а не размеру data. Замена ключа
+    целиком удаляет его прежние дописывания.
+
+    Когда задача завершается (DONE/FAILED), её дописывания сворачиваются в
+    итоговые значения ключей, а завершённые задачи сверх max_finished
+    (самые давние) удаляются целиком: новый API-узел, читающий с seq = 0,
+    проходит только живые задачи и последние результаты.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, max_finished: int = 200):
+        self.path = path
+        self.max_attempts = max_attempts
+        # Не меньше одной: строка только что завершённой задачи несёт текущий seq
+        self.max_finished = max(1, max_finished)
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=30000")
+            self._local.connection = connection
+        return connection
+
+    def _write(self, fn):
+        """Выполняет fn(connection, seq) в транзакции BEGIN IMMEDIATE."""
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            seq = connection.execute("SELECT COALESCE(MAX(updated_seq), 0) + 1 FROM jobs").fetchone()[0]
+            result = fn(connection, seq)
+            connection.execute("COMMIT")
+            return result
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _set_fields(connection, processing_id: str, fields: Dict, seq: int) -> None:
+        for key, value in fields.items():
+            connection.execute(
+                "INSERT OR REPLACE INTO job_fields (processing_id, key, value, updated_seq) VALUES (?, ?, ?, ?)",
+                (processing_id, key, json.dumps(value, default=json_default), seq)
+            )
+            connection.execute("DELETE FROM job_appends WHERE processing_id = ? AND key = ?", (processing_id, key))
+
+    def _finish(self, connection, processing_id: str, seq: int) -> None:
+        """
+        Сворачивает дописывания завершённой задачи в значения ключей и
+        удаляет самые давние завершённые задачи сверх max_finished.
+        """
+        appended: Dict[str, List] = {}
+        for key, items in connection.execute(
+            "SELECT key, items FROM job_appends WHERE processing_id = ? ORDER BY updated_seq, rowid", (processing_id,)
+        ):
+            appended.setdefault(key, []).extend(json.loads(items))
+        if appended:
+            current = {key: json.loads(value) for key, value in connection.execute(
+                f"SELECT key, value FROM job_fields WHERE processing_id = ? AND key IN ({','.join('?' * len(appended))})",
+                (processing_id, *appended))}
+            # Читатель, не дочитавший дописывания, получит ключ целиком заменой
+            self._set_fields(connection, processing_id,
+                             {key: list(current.get(key) or []) + items for key, items in appended.items()}, seq)
+
+        expired = [row[0] for row in connection.execute(
+            "SELECT processing_id FROM jobs WHERE status IN (?, ?) "
+            "ORDER BY heartbeat_at DESC, updated_seq DESC LIMIT -1 OFFSET ?",
+            (DONE, FAILED, self.max_finished)
+        )]
+        for table in ('jobs', 'job_fields', 'job_appends'):
+            connection.executemany(f"DELETE FROM {table} WHERE processing_id = ?", [(pid,) for pid in expired])
+
+    def enqueue(self, processing_id: str, video_path: str, data: Dict,
+                processing_type: str = 'video_processing') -> None:
+        def insert(connection, seq):
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs (processing_id, processing_type, video_path, status, "
+                "created_at, data, updated_seq) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (processing_id, processing_type, video_path, QUEUED, time.time(), json.dumps(data), seq)
+            )
+            connection.execute("DELETE FROM job_fields WHERE processing_id = ?", (processing_id,))
+            connection.execute("DELETE FROM job_appends WHERE processing_id = ?", (processing_id,))
+            self._set_fields(connection, processing_id, data, seq)
+        self._write(insert)
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """
+        Захватывает самую старую задачу из очереди.
+
+        Returns:
+            {'processing_id', 'video_path', 'data', ...} или None, если очередь пуста
+        """
+        def take(connection, seq):
+            row = connection.execute(
+                "SELECT processing_id, processing_type, video_path, data, attempts FROM jobs "
+                "WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1, "
+                "claimed_at = ?, heartbeat_at = ?, updated_seq = ? WHERE processing_id = ?",
+                (RUNNING, worker_id, now, now, seq, row[0])
+            )
+            return {
+                'processing_id': row[0],
+                'processing_type': row[1],
+                'video_path': row[2],
+                'data': json.loads(row[3]),
+                'attempts': row[4] + 1,
+            }
+        return self._write(take)
+
+    def publish(self, processing_id: str, patch: Dict, worker_id: Optional[str] = None,
+                status: Optional[str] = None, append: Optional[Dict[str, Iterable]] = None) -> None:
+        """
+        Публикует изменения data задачи и обновляет heartbeat.
+
+        Args:
+            patch: Заменяемые ключи
+            append: {ключ: новые элементы} для списков, в которые только дописывают
+        """
+        def merge(connection, seq):
+            updated = connection.execute(
+                "UPDATE jobs SET heartbeat_at = ?, updated_seq = ?, status = COALESCE(?, status) "
+                "WHERE processing_id = ? AND (? IS NULL OR worker_id = ?)",
+                (time.time(), seq, status, processing_id, worker_id, worker_id)
+            ).rowcount
+            if not updated:
+                return
+            self._set_fields(connection, processing_id, patch, seq)
+            for key, items in (append or {}).items():
+                items = list(items)
+                if items:
+                    connection.execute(
+                        "INSERT INTO job_appends (processing_id, key, items, updated_seq) VALUES (?, ?, ?, ?)",
+                        (processing_id, key, json.dumps(items, default=json_default), seq)
+                    )
+            if status in (DONE, FAILED):
+                self._finish(connection, processing_id, seq)
+        self._write(merge)
+
+    def heartbeat(self, processing_id: str, worker_id: str) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE processing_id = ? AND worker_id = ?",
+            (time.time(), processing_id, worker_id)
+        )
+
+    def requeue_stale(self, timeout: float) -> int:
+        """
+        Возвращает в очередь задачи упавших воркеров (heartbeat старше timeout).
+        После max_attempts попыток задача помечается как проваленная.
+        """
+        def requeue(connection, seq):
+            deadline = time.time() - timeout
+            stale = connection.execute(
+                "SELECT processing_id, attempts FROM jobs WHERE status = ? AND heartbeat_at < ?",
+                (RUNNING, deadline)
+            ).fetchall()
+            for processing_id, attempts in stale:
+                if attempts >= self.max_attempts:
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, heartbeat_at = ?, updated_seq = ? WHERE processing_id = ?",
+                        (FAILED, time.time(), seq, processing_id)
+                    )
+                    self._set_fields(connection, processing_id,
+                                     {'status': 'failed', 'error': 'Worker lost too many times'}, seq)
+                    self._finish(connection, processing_id, seq)
+                else:
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, worker_id = NULL, updated_seq = ? WHERE processing_id = ?",
+                        (QUEUED, seq, processing_id)
+                    )
+            return len(stale)
+        return self._write(requeue)
+
+    def changes_since(self, seq: int, limit: int = 100) -> Tuple[int, List[Dict]]:
+        """
+        Изменения после seq, не больше limit записей (транзакций) за вызов.
+
+        Returns:
+            (новый seq, [{'processing_id', 'processing_type', 'status', 'data', 'append'}, ...]);
+            data — заменённые ключи, append — {ключ: дописанные элементы} по порядку.
+            Применять сначала data, потом append
+        """
+        connection = self._connect()
+        # Один снимок WAL на все запросы: замена ключа и удаление его дописываний видны вместе
+        connection.execute("BEGIN")
+        try:
+            row = connection.execute(
+                "SELECT updated_seq FROM (SELECT updated_seq FROM jobs WHERE updated_seq > ?1 "
+                "UNION SELECT updated_seq FROM job_fields WHERE updated_seq > ?1 "
+                "UNION SELECT updated_seq FROM job_appends WHERE updated_seq > ?1) "
+                "ORDER BY updated_seq LIMIT 1 OFFSET ?2",
+                (seq, limit - 1)
+            ).fetchone()
+            # Каждая запись обновляет и строку jobs, поэтому её максимум — последний seq
+            upper = row[0] if row else connection.execute(
+                "SELECT COALESCE(MAX(updated_seq), 0) FROM jobs").fetchone()[0]
+            if upper <= seq:
+                return seq, []
+
+            changes: Dict[str, Dict] = {}
+
+            def change(processing_id: str) -> Dict:
+                if processing_id not in changes:
+                    changes[processing_id] = {'processing_id': processing_id, 'data': {}, 'append': {}}
+                return changes[processing_id]
+
+            for processing_id, key, value in connection.execute(
+                "SELECT processing_id, key, value FROM job_fields WHERE updated_seq > ? AND updated_seq <= ?",
+                (seq, upper)
+            ):
+                change(processing_id)['data'][key] = json.loads(value)
+            for processing_id, key, items in connection.execute(
+                "SELECT processing_id, key, items FROM job_appends WHERE updated_seq > ? AND updated_seq <= ? "
+                "ORDER BY updated_seq, rowid",
+                (seq, upper)
+            ):
+                change(processing_id)['append'].setdefault(key, []).extend(json.loads(items))
+            for (processing_id,) in connection.execute(
+                "SELECT processing_id FROM jobs WHERE updated_seq > ? AND updated_seq <= ?", (seq, upper)
+            ):
+                change(processing_id)
+            for item in changes.values():
+                item['processing_type'], item['status'] = connection.execute(
+                    "SELECT processing_type, status FROM jobs WHERE processing_id = ?", (item['processing_id'],)
+                ).fetchone()
+        finally:
+            connection.execute("COMMIT")
+        return upper, list(changes.values())
+
+    def get(self, processing_id: str) -> Optional[Dict]:
+        """Задача с собранным data (ключи и все дописанные элементы)."""
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT processing_id, status, worker_id, attempts FROM jobs WHERE processing_id = ?",
+            (processing_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        data = {key: json.loads(value) for key, value in connection.execute(
+            "SELECT key, value FROM job_fields WHERE processing_id = ?", (processing_id,))}
+        for key, items in connection.execute(
+            "SELECT key, items FROM job_appends WHERE processing_id = ? ORDER BY updated_seq, rowid", (processing_id,)
+        ):
+            data[key] = list(data.get(key) or []) + json.loads(items)
+        return {
+            'processing_id': row[0],
+            'status': row[1],
+            'worker_id': row[2],
+            'attempts': row[3],
+            'data': data,
+        }
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
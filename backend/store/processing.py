@@ -2,9 +2,11 @@ import uuid
 from typing import Dict, Optional, Literal
 from dataclasses import dataclass, field
 from datetime import datetime
+from metrics import JobMemory, StageProfiler
+from .snapshot import Snapshot
 
 
-ProcessingType = Literal['stream', 'video_processing']
+ProcessingType = Literal['stream', 'video_processing', 'sweep']
 
 
 @dataclass
@@ -12,14 +14,42 @@ class Processing:
     type: ProcessingType
     isActive: bool
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
-    data: Optional[Dict] = None
+    # Неизменяемый снимок; новые версии публикует ProcessingStore
+    data: Snapshot = field(default_factory=lambda: Snapshot(0, {}))
     created_at: datetime = field(default_factory=datetime.now)
+    profile: Optional[StageProfiler] = None
+    memory: Optional[JobMemory] = None
     
     def to_dict(self) -> Dict:
         return {
             'type': self.type,
             'isActive': self.isActive,
             'id': self.id,
-            'data': self.data,
-            'created_at': self.created_at.isoformat()
+            'data': self.data.to_dict(),
+            'created_at': self.created_at.isoformat(),
+            'profile': self.profile.report() if self.profile else None,
+            'memory': self.memory.report() if self.memory else None
+        }
+    
+    def to_summary(self) -> Dict:
+        """Краткая проекция для листинга: без траектории, точек и прочих больших полей."""
+        data = self.data
+        processed = data.get('processed_frames', 0)
+        total = data.get('total_frames', 0)
+        return {
+            'id': self.id,
+            'type': self.type,
+            'isActive': self.isActive,
+            'created_at': self.created_at.isoformat(),
+            'status': data.get('status'),
+            'filename': data.get('original_filename') or data.get('filename'),
+            'mode': data.get('mode'),
+            'localization_map': data.get('localization_map'),
+            'processed_frames': processed,
+            'total_frames': total,
+            'progress': (processed / total) * 100 if total else 0,
+            'trajectory_length': len(data.get('trajectory') or []),
+            'map_points_total': data.get('map_points_total'),
+            'warning': data.get('warning'),
+            'error': data.get('error'),
         }
@@ -0,0 +1,101 @@
+from collections.abc import Mapping, Sequence
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List
+
+
+class FrozenListView(Sequence):
+    """
+    Неизменяемый префикс списка, в который только дописывают.
+
+    Снимок хранит общий с писателем список и свою длину: дописанные позже
+    элементы в снимок не попадают, а уже записанные никто не меняет,
+    поэтому для публикации нового снимка копировать список не нужно.
+    """
+
+    __slots__ = ('_items', '_length')
+
+    def __init__(self, items: List, length: int):
+        self._items = items
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._items[:self._length][index]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("FrozenListView index out of range")
+        return self._items[index]
+
+    def __iter__(self) -> Iterator:
+        return islice(self._items, self._length)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (FrozenListView, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"FrozenListView({self.to_list()!r})"
+
+    def to_list(self) -> List:
+        return self._items[:self._length]
+
+    def extend(self, items: Iterable) -> 'FrozenListView':
+        """
+        Новый вид с дописанными items. Если этот вид — не последний над
+        своим списком (дальше уже дописывали), список копируется.
+        """
+        if self._length == len(self._items):
+            self._items.extend(items)
+            return FrozenListView(self._items, len(self._items))
+        copied = self.to_list()
+        copied.extend(items)
+        return FrozenListView(copied, len(copied))
+
+
+class Snapshot(Mapping):
+    """
+    Неизменяемый снимок Processing.data с монотонно растущей версией.
+
+    Писатели не меняют снимок, а публикуют новый (копия словаря верхнего
+    уровня + изменённые ключи), поэтому читатель берёт согласованное
+    состояние одним чтением атрибута, без блокировок. Значения внутри
+    снимка тоже не меняются после публикации: списки, в которые дописывают
+    (траектория), хранятся как FrozenListView.
+    """
+
+    __slots__ = ('version', '_data')
+
+    def __init__(self, version: int, data: Dict[str, Any]):
+        self.version = version
+        self._data = data
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f"Snapshot(version={self.version}, keys={list(self._data)})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Обычный словарь (виды списков материализованы) — для JSON и pickle."""
+        return {key: value.to_list() if isinstance(value, FrozenListView) else value
+                for key, value in self._data.items()}
+
+
+def json_default(value: Any) -> Any:
+    """default= для json.dumps: сериализует снимки и виды списков."""
+    if isinstance(value, FrozenListView):
+        return value.to_list()
+    if isinstance(value, Snapshot):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -1,63 +1,306 @@
-from typing import Dict, List, Optional
+import base64
+import bisect
+import itertools
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from .processing import Processing, ProcessingType
+from .snapshot import FrozenListView, Snapshot
+
+
+# Порог, ниже которого отфильтрованные кандидаты сортируются напрямую,
+# а не выбираются проходом по общему упорядоченному индексу
+_DIRECT_SORT_RATIO = 0.25
+
+
+def encode_cursor(key: Tuple[float, str]) -> str:
+    return base64.urlsafe_b64encode(f"{key[0]!r}|{key[1]}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """
+    Raises:
+        ValueError: Курсор повреждён
+    """
+    try:
+        timestamp, processing_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return float(timestamp), processing_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
 
 
 class ProcessingStore:
+    """
+    Хранилище обработок в памяти с вторичными индексами по типу, статусу,
+    isActive и created_at. Индексы обновляются в add/update/update_data/delete,
+    поэтому выборки и листинг не сканируют все записи.
+
+    Processing.data — неизменяемый Snapshot. Писатели (под общей блокировкой)
+    публикуют новый снимок с большей версией; читатели из любых потоков берут
+    текущий через snapshot()/processing.data без блокировок.
+    """
+    
     def __init__(self):
         self._store: Dict[str, Processing] = {}
+        self._listeners: List[Callable[[str, Dict, Dict[str, List]], None]] = []
+        # dict вместо set — порядок добавления сохраняется, как и раньше
+        self._by_type: Dict[str, Dict[str, None]] = {}
+        self._by_status: Dict[str, Dict[str, None]] = {}
+        self._active: Dict[str, None] = {}
+        # Отсортированные ключи (created_at, id) для листинга с курсором
+        self._order: List[Tuple[float, str]] = []
+        # Писатели и индексы — под блокировкой; чтение снимков — без неё
+        self._lock = threading.RLock()
+        self._versions = itertools.count(1)
+    
+    @staticmethod
+    def _order_key(processing: Processing) -> Tuple[float, str]:
+        return processing.created_at.timestamp(), processing.id
+    
+    @staticmethod
+    def _status(processing: Processing) -> Optional[str]:
+        return (processing.data or {}).get('status')
+    
+    def _index(self, processing: Processing) -> None:
+        self._by_type.setdefault(processing.type, {})[processing.id] = None
+        status = self._status(processing)
+        if status is not None:
+            self._by_status.setdefault(status, {})[processing.id] = None
+        if processing.isActive:
+            self._active[processing.id] = None
+        bisect.insort(self._order, self._order_key(processing))
     
-    def add(self, processing_type: ProcessingType, data: Optional[Dict] = None) -> Processing:
+    def _unindex(self, processing: Processing) -> None:
+        self._by_type.get(processing.type, {}).pop(processing.id, None)
+        status = self._status(processing)
+        if status is not None:
+            self._by_status.get(status, {}).pop(processing.id, None)
+        self._active.pop(processing.id, None)
+        key = self._order_key(processing)
+        position = bisect.bisect_left(self._order, key)
+        if position < len(self._order) and self._order[position] == key:
+            del self._order[position]
+    
+    def _publish(self, processing: Processing, data: Dict) -> Snapshot:
+        snapshot = Snapshot(next(self._versions), data)
+        processing.data = snapshot
+        return snapshot
+
+    def add(self, processing_type: ProcessingType, data: Optional[Dict] = None,
+            processing_id: Optional[str] = None) -> Processing:
         processing = Processing(
             type=processing_type,
-            isActive=True,
-            data=data or {}
+            isActive=True
         )
-        self._store[processing.id] = processing
+        if processing_id:
+            processing.id = processing_id
+        with self._lock:
+            self._publish(processing, dict(data or {}))
+            previous = self._store.get(processing.id)
+            if previous is not None:
+                self._unindex(previous)
+            self._store[processing.id] = processing
+            self._index(processing)
         return processing
     
+    def subscribe(self, listener: Callable[[str, Dict, Dict[str, List]], None]) -> None:
+        """
+        Подписка на update_data: listener(processing_id, patch, appended) —
+        заменённые ключи и {ключ: только что дописанные элементы}.
+        """
+        self._listeners.append(listener)
+    
     def get(self, processing_id: str) -> Optional[Processing]:
         return self._store.get(processing_id)
     
+    def snapshot(self, processing_id: str) -> Optional[Snapshot]:
+        """Текущий снимок data: O(1), без блокировок, согласован целиком."""
+        processing = self._store.get(processing_id)
+        return processing.data if processing else None
+    
     def get_all(self) -> List[Processing]:
-        return list(self._store.values())
+        with self._lock:
+            return list(self._store.values())
     
     def get_active(self) -> List[Processing]:
-        return [p for p in self._store.values() if p.isActive]
+        with self._lock:
+            return [self._store[processing_id] for processing_id in self._active]
     
     def get_by_type(self, processing_type: ProcessingType) -> List[Processing]:
-        return [p for p in self._store.values() if p.type == processing_type]
+        with self._lock:
+            return [self._store[processing_id] for processing_id in self._by_type.get(processing_type, {})]
+    
+    def get_by_status(self, status: str) -> List[Processing]:
+        with self._lock:
+            return [self._store[processing_id] for processing_id in self._by_status.get(status, {})]
     
     def update(self, processing_id: str, **kwargs) -> Optional[Processing]:
-        processing = self._store.get(processing_id)
-        if processing:
-            for key, value in kwargs.items():
-                if hasattr(processing, key):
-                    setattr(processing, key, value)
-        return processing
+        with self._lock:
+            processing = self._store.get(processing_id)
+            if processing:
+                reindex = any(key in kwargs for key in ('type', 'isActive', 'data', 'created_at'))
+                if reindex:
+                    self._unindex(processing)
+                for key, value in kwargs.items():
+                    if key == 'data':
+                        self._publish(processing, dict(value or {}))
+                    elif hasattr(processing, key):
+                        setattr(processing, key, value)
+                if reindex:
+                    self._index(processing)
+            return processing
     
-    def update_data(self, processing_id: str, data: Dict) -> Optional[Processing]:
-        processing = self._store.get(processing_id)
-        if processing:
-            if processing.data is None:
-                processing.data = data
-            else:
-                processing.data.update(data)
-        return processing
+    def update_data(self, processing_id: str, data: Dict,
+                    append: Optional[Dict[str, Iterable]] = None) -> Optional[Processing]:
+        """
+        Публикует новый снимок data: старые ключи + data + дописанные списки.
+
+        Значения из data попадают в снимок как есть — после передачи их нельзя
+        менять. Списки, которые растут по кадрам, передаются через append:
+        элементы дописываются без копирования уже опубликованного.
+
+        Args:
+            processing_id: ID обработки
+            data: Заменяемые ключи
+            append: {ключ: новые элементы} для списков, в которые только дописывают
+        """
+        with self._lock:
+            processing = self._store.get(processing_id)
+            if processing:
+                current = processing.data
+                old_status = current.get('status')
+                merged = dict(current._data)
+                merged.update(data)
+                appended: Dict[str, List] = {}
+                for key, items in (append or {}).items():
+                    items = appended[key] = list(items)
+                    value = merged.get(key)
+                    if not isinstance(value, FrozenListView):
+                        value = FrozenListView(list(value or []), len(value or []))
+                    merged[key] = value.extend(items)
+                self._publish(processing, merged)
+                new_status = merged.get('status')
+                if new_status != old_status:
+                    if old_status is not None:
+                        self._by_status.get(old_status, {}).pop(processing_id, None)
+                    if new_status is not None:
+                        self._by_status.setdefault(new_status, {})[processing_id] = None
+                # Под блокировкой: подписчики видят изменения в порядке публикации
+                for listener in self._listeners:
+                    listener(processing_id, data, appended)
+            return processing
     
     def set_active(self, processing_id: str, is_active: bool) -> Optional[Processing]:
         return self.update(processing_id, isActive=is_active)
     
     def delete(self, processing_id: str) -> bool:
-        if processing_id in self._store:
-            del self._store[processing_id]
+        with self._lock:
+            processing = self._store.pop(processing_id, None)
+            if processing is None:
+                return False
+            self._unindex(processing)
             return True
-        return False
     
     def clear(self):
-        self._store.clear()
+        with self._lock:
+            self._store.clear()
+            self._by_type.clear()
+            self._by_status.clear()
+            self._active.clear()
+            self._order.clear()
     
     def count(self) -> int:
         return len(self._store)
     
     def count_active(self) -> int:
-        return len(self.get_active())
+        return len(self._active)
+    
+    def _candidates(self, processing_type: Optional[str], status: Optional[str],
+                    active: Optional[bool]) -> Optional[set]:
+        """Пересечение индексов по фильтрам; None — фильтров нет."""
+        sets: List[Iterable[str]] = []
+        if processing_type is not None:
+            sets.append(self._by_type.get(processing_type, {}).keys())
+        if status is not None:
+            sets.append(self._by_status.get(status, {}).keys())
+        if active is True:
+            sets.append(self._active.keys())
+        if not sets and active is not False:
+            return None
+        
+        if sets:
+            sets.sort(key=len)
+            candidates = set(sets[0])
+            for other in sets[1:]:
+                candidates.intersection_update(other)
+        else:
+            candidates = set(self._store)
+        if active is False:
+            candidates.difference_update(self._active)
+        return candidates
+    
+    def query(
+        self,
+        processing_type: Optional[str] = None,
+        status: Optional[str] = None,
+        active: Optional[bool] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        descending: bool = True,
+    ) -> Tuple[List[Processing], Optional[str], int]:
+        """
+        Страница обработок по фильтрам, упорядоченная по created_at.
+        
+        Args:
+            processing_type: Фильтр по типу
+            status: Фильтр по data['status']
+            active: Фильтр по isActive
+            limit: Размер страницы
+            cursor: Курсор из предыдущей страницы (next_cursor)
+            descending: Сначала новые
+        
+        Returns:
+            (обработки, курсор следующей страницы или None, всего подходящих)
+        
+        Raises:
+            ValueError: Повреждённый курсор
+        """
+        with self._lock:
+            return self._query(processing_type, status, active, limit, cursor, descending)
+    
+    def _query(self, processing_type: Optional[str], status: Optional[str], active: Optional[bool],
+               limit: int, cursor: Optional[str], descending: bool) -> Tuple[List[Processing], Optional[str], int]:
+        candidates = self._candidates(processing_type, status, active)
+        total = len(self._store) if candidates is None else len(candidates)
+        
+        if candidates is not None and len(candidates) <= len(self._order) * _DIRECT_SORT_RATIO:
+            keys = sorted(self._order_key(self._store[processing_id]) for processing_id in candidates)
+            candidates = None
+        else:
+            keys = self._order
+        
+        if cursor is not None:
+            after = decode_cursor(cursor)
+            if descending:
+                end = bisect.bisect_left(keys, after)
+                positions = range(end - 1, -1, -1)
+            else:
+                start = bisect.bisect_right(keys, after)
+                positions = range(start, len(keys))
+        else:
+            positions = range(len(keys) - 1, -1, -1) if descending else range(len(keys))
+        
+        page: List[Processing] = []
+        last_key = None
+        has_more = False
+        for position in positions:
+            key = keys[position]
+            if candidates is not None and key[1] not in candidates:
+                continue
+            if len(page) == limit:
+                has_more = True
+                break
+            page.append(self._store[key[1]])
+            last_key = key
+        
+        next_cursor = encode_cursor(last_key) if has_more and last_key is not None else None
+        return page, next_cursor, total
@@ -0,0 +1,139 @@
+"""
+Воркер обработки для многоузлового режима (PROCESSING_MODE=queue).
+
+Запуск из каталога backend (на любом узле с доступом к общему тому, где
+лежат uploads/ и очередь JOB_QUEUE_PATH):
+
+    python -m worker --processes 4
+
+Каждый процесс забирает задачи из SQLite-очереди, гоняет start_processing
+с OrbslamMonoRunner и публикует прогресс обратно в очередь; API-узлы
+читают его оттуда.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+from typing import Dict, List
+
+from log import configure_logging, get_logger
+from store import get_job_queue, get_store
+from store.job_queue import DONE, FAILED
+
+
+logger = get_logger("worker")
+
+POLL_INTERVAL = 1.0
+FLUSH_INTERVAL = 0.2
+# Задача считается брошенной, если воркер молчит дольше этого времени
+STALE_TIMEOUT = 60.0
+
+
+async def run_job(job: Dict, worker_id: str, pending: Dict[str, Dict[str, Dict]]) -> None:
+    from services.processing_service import start_processing
+
+    queue = get_job_queue()
+    store = get_store()
+    processing_id = job['processing_id']
+    store.add(processing_type=job['processing_type'], data=job['data'], processing_id=processing_id)
+
+    async def flush() -> None:
+        changes = pending.pop(processing_id, None)
+        if changes:
+            await asyncio.to_thread(queue.publish, processing_id, changes['data'], worker_id,
+                                    append=changes['append'])
+        else:
+            await asyncio.to_thread(queue.heartbeat, processing_id, worker_id)
+
+    async def flush_periodically() -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await flush()
+            except Exception as e:
+                logger.warning("Failed to publish progress for %s: %s", processing_id, e)
+
+    logger.info("Worker %s took processing %s (attempt %d)", worker_id, processing_id, job['attempts'])
+    flusher = asyncio.create_task(flush_periodically())
+    try:
+        await start_processing(processing_id, job['video_path'])
+    finally:
+        flusher.cancel()
+
+    await flush()
+    status = (store.get(processing_id).data or {}).get('status')
+    await asyncio.to_thread(queue.publish, processing_id, {}, worker_id, FAILED if status == 'failed' else DONE)
+    store.delete(processing_id)
+    logger.info("Worker %s finished processing %s with status %s", worker_id, processing_id, status)
+
+
+async def worker_loop(worker_id: str) -> None:
+    queue = get_job_queue()
+    pending: Dict[str, Dict[str, Dict]] = {}
+
+    def collect(processing_id: str, patch: Dict, appended: Dict[str, List]) -> None:
+        """Копит изменения до flush: дописанное к траектории уходит в очередь дельтой."""
+        changes = pending.setdefault(processing_id, {'data': {}, 'append': {}})
+        for key, value in patch.items():
+            changes['data'][key] = value
+            changes['append'].pop(key, None)
+        for key, items in appended.items():
+            if key in changes['data']:
+                # Ключ в этом окне уже заменён целиком — дописываем к новому значению
+                changes['data'][key] = list(changes['data'][key]) + items
+            else:
+                changes['append'].setdefault(key, []).extend(items)
+
+    get_store().subscribe(collect)
+    logger.info("Worker %s polling %s", worker_id, queue.path)
+
+    while True:
+        await asyncio.to_thread(queue.requeue_stale, STALE_TIMEOUT)
+        job = await asyncio.to_thread(queue.claim, worker_id)
+        if job is None:
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+        try:
+            await run_job(job, worker_id, pending)
+        except Exception as e:
+            logger.exception("Job %s crashed: %s", job['processing_id'], e)
+            await asyncio.to_thread(
+                queue.publish, job['processing_id'], {'status': 'failed', 'error': str(e)}, worker_id, FAILED
+            )
+
+
+def _run_process(index: int) -> None:
+    configure_logging()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    try:
+        asyncio.run(worker_loop(worker_id))
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ORB-SLAM3 processing worker")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes on this host")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _run_process(0)
+        return
+
+    processes = [multiprocessing.Process(target=_run_process, args=(i,), daemon=False) for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        while any(process.is_alive() for process in processes):
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
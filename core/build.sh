@@ -1,3 +1,5 @@
+CORE_DIR="$(cd "$(dirname "$0")" && pwd)"
+
 sudo apt-get update
 
 #Pangolin
@@ -26,6 +28,11 @@ sudo apt install libeigen3-dev
 
 #build
 
+# Публичные методы System, нужные обёртке (атлас, карты)
+python3 "$CORE_DIR/patches/system_api.py" "$CORE_DIR/third_party/ORB_SLAM3"
+
+cd "$CORE_DIR"
+
 mkdir build && cd build
 
 cmake .. -DBUILD_PYTHON=ON -DPYTHON_EXECUTABLE=$(which python3) -DOpenCV_DIR=$(python3 -c "import cv2, os; print(os.path.dirname(cv2.__file__))")
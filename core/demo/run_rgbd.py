@@ -50,14 +50,14 @@ while True:
 
         if frame_idx > 20:
             trajectory = slam.get_trajectory()
-            if trajectory:
+            if len(trajectory):
                 cam_pose = trajectory[-1]
                 print(f"Camera Pose:\n{cam_pose}")
 
         if frame_idx > 20:
             tracked_points = slam.get_tracked_map_points()
-            if tracked_points:
-                points_array = np.array(tracked_points)
+            if len(tracked_points):
+                points_array = tracked_points
                 print(f"  → {len(points_array)} tracked 3-D points")
                 np.savetxt(f"frame_{frame_idx:05d}_points.txt",
                            points_array, fmt="%.6f")
@@ -1,33 +1,83 @@
 #ifndef ORB_SLAM3_PYTHON_H
 #define ORB_SLAM3_PYTHON_H
 
+#include <map>
 #include <memory>
+#include <mutex>
 #include <System.h>
 #include <Tracking.h>
 
 #include <Map.h>
 #include <MapPoint.h>
 
+// Потокобезопасность.
+//
+// Биндинг отпускает GIL на время нативных вызовов (трекинг, чтение карты,
+// сохранение атласа, инициализация и завершение), поэтому несколько систем
+// в потоках одного процесса трекают параллельно, а event loop не стоит.
+//
+// Вызовы одного экземпляра сериализуются мьютексом mMutex: трекинг, геттеры,
+// reset/shutdown и переключение режима можно звать из разных потоков, но
+// выполняются они по очереди. Порядок блокировок — сначала GIL отпускается,
+// потом берётся mMutex, поэтому с PyEnsureGIL в NumpyAllocator дедлока нет.
+//
+// Разные экземпляры независимы, за исключением статического состояния
+// ORB-SLAM3 (счётчики id кадров/ключевых кадров/точек, границы изображения,
+// вычисляемые на первом кадре): параллельные системы в одном процессе должны
+// работать с одинаковым разрешением и калибровкой. Иначе — отдельные процессы.
+//
+// Изображения передаются без копирования: пока идёт process*, массив numpy
+// нельзя менять из Python.
 class ORBSLAM3Python
 {
 public:
+    // Формат кадра для processMono; в серый он переводится внутри обёртки
+    enum ColorFormat
+    {
+        COLOR_AUTO,  // по числу каналов: 1 — GRAY, 3 — BGR, 4 — BGRA
+        COLOR_GRAY,
+        COLOR_BGR,
+        COLOR_RGB,
+        COLOR_BGRA,
+        COLOR_I420,  // планарный YUV 4:2:0, (H*3/2)×W; серый — плоскость Y без конвертации
+        COLOR_NV12,
+        COLOR_NV21,
+        COLOR_YUYV   // упакованный YUV 4:2:2, H×W×2
+    };
+
     ORBSLAM3Python(std::string vocabFile, std::string settingsFile,
                    ORB_SLAM3::System::eSensor sensorMode = ORB_SLAM3::System::eSensor::RGBD);
     ~ORBSLAM3Python();
 
+    // Загрузка словаря и запуск потоков ORB-SLAM3; без GIL
     bool initialize();
-    bool processMono(cv::Mat image, double timestamp);
+    // Трекинг кадра; без GIL, сериализуется с остальными вызовами экземпляра
+    bool processMono(cv::Mat image, double timestamp, ColorFormat format = COLOR_AUTO);
     bool processStereo(cv::Mat leftImage, cv::Mat rightImage, double timestamp);
     bool processRGBD(cv::Mat image, cv::Mat depthImage, double timestamp);
+    // Reset применяется на следующем кадре; shutdown ждёт потоки ORB-SLAM3; без GIL
     void reset();
     void shutdown();
+    // Только флаги обёртки; GIL не отпускают
     bool isRunning();
     void setUseViewer(bool useViewer);
+    // Снимки состояния после последнего кадра; без GIL, сериализуются с трекингом
     std::vector<Eigen::Matrix4f> getTrajectory() const;
     std::vector<Eigen::Vector3f> getMapPoints() const;
     std::vector<Eigen::Vector3f> getTrackedMapPoints() const;
     std::vector<Eigen::Vector2f> getCurrentKeyPoints() const;
     int getNumMapPoints() const;
+    // Останавливает локальное картирование на время записи; без GIL
+    bool saveAtlas(std::string filename);
+    void activateLocalizationMode();
+    void deactivateLocalizationMode();
+    long getCurrentMapId() const;
+    int getNumMaps() const;
+    // Бюджет ORB-признаков и пороги FAST трекинга: новые значения действуют
+    // со следующего кадра, система не перезапускается; без GIL
+    void setOrbParameters(int nFeatures, int iniThFAST, int minThFAST);
+    // Текущие значения (после initialize — из ORBextractor.* файла настроек)
+    std::map<std::string, int> getOrbParameters() const;
 
 private:
     std::string vocabluaryFile;
@@ -36,6 +86,16 @@ private:
     std::shared_ptr<ORB_SLAM3::System> system;
     bool bUseViewer;
     bool bUseRGB;
+    // Сериализует вызовы одного экземпляра (см. комментарий к классу)
+    mutable std::mutex mMutex;
+    // Серый кадр processMono, переиспользуется между кадрами (защищён mMutex)
+    cv::Mat mGray;
+    // Текущие параметры ORB-экстрактора трекинга (защищены mMutex)
+    int mOrbFeatures;
+    int mOrbIniThFAST;
+    int mOrbMinThFAST;
+
+    cv::Mat toGray(const cv::Mat& image, ColorFormat format);
 };
 
 #endif
\ No newline at end of file
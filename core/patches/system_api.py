@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Добавляет в ORB_SLAM3 публичные методы, нужные обёртке:
+
+- SaveAtlasToFile() — в ORB-SLAM3 сохранение атласа (SaveAtlas) приватное
+  и вызывается только из Shutdown(), а для чекпоинтов его нужно делать на ходу;
+- GetCurrentMapId() и GetNumMaps() — атлас приватный, а обработке нужно
+  видеть, когда после потери трекинга начата новая карта и когда карты слились;
+- SetORBExtractorParameters() (и то же в Tracking и ORBextractor) — бюджет
+  ORB-признаков и пороги FAST задаются только в конструкторе экстрактора,
+  а адаптивному бюджету их нужно менять между кадрами без перезапуска.
+
+Скрипт идемпотентен: уже добавленные методы пропускаются.
+
+    python3 patches/system_api.py third_party/ORB_SLAM3
+"""
+import sys
+from pathlib import Path
+
+# (маркер, объявление в System.h, определение в System.cc)
+SYSTEM_PATCHES = [
+    (
+        "SaveAtlasToFile",
+        """
+    // Сохраняет атлас в ./<filename>.osa, не останавливая систему (чекпоинты)
+    bool SaveAtlasToFile(const std::string &filename);
+""",
+        """
+bool System::SaveAtlasToFile(const std::string &filename)
+{
+    // Останавливаем локальное картирование, чтобы атлас не менялся во время сериализации
+    mpLocalMapper->RequestStop();
+    while(!mpLocalMapper->isStopped() && !mpLocalMapper->isFinished())
+        usleep(1000);
+    while(mpLoopCloser->isRunningGBA())
+        usleep(1000);
+
+    const std::string previous = mStrSaveAtlasToFile;
+    mStrSaveAtlasToFile = filename;
+    SaveAtlas(FileType::BINARY_FILE);
+    mStrSaveAtlasToFile = previous;
+
+    mpLocalMapper->Release();
+    return true;
+}
+
+""",
+    ),
+    (
+        "GetCurrentMapId",
+        """
+    // Идентификатор активной карты атласа и число карт в нём
+    long unsigned int GetCurrentMapId();
+    int GetNumMaps();
+""",
+        """
+long unsigned int System::GetCurrentMapId()
+{
+    Map* pMap = mpAtlas->GetCurrentMap();
+    return pMap ? pMap->GetId() : 0;
+}
+
+int System::GetNumMaps()
+{
+    return static_cast<int>(mpAtlas->CountMaps());
+}
+
+""",
+    ),
+    (
+        "SetORBExtractorParameters",
+        """
+    // Бюджет ORB-признаков и пороги FAST экстракторов трекинга; со следующего кадра
+    void SetORBExtractorParameters(int nFeatures, int iniThFAST, int minThFAST);
+""",
+        """
+void System::SetORBExtractorParameters(int nFeatures, int iniThFAST, int minThFAST)
+{
+    // Трекинг идёт в потоке вызывающего TrackMonocular/TrackStereo: вызывать между кадрами
+    mpTracker->SetORBExtractorParameters(nFeatures, iniThFAST, minThFAST);
+}
+
+""",
+    ),
+]
+
+TRACKING_PATCHES = [
+    (
+        "SetORBExtractorParameters",
+        """
+    // Меняет экстракторы кадров на месте; mpIniORBextractor (инициализация mono) не трогается
+    void SetORBExtractorParameters(int nFeatures, int iniThFAST, int minThFAST);
+""",
+        """
+void Tracking::SetORBExtractorParameters(int nFeatures, int iniThFAST, int minThFAST)
+{
+    // Экстрактор меняется на месте, а не пересоздаётся: на него указывают уже созданные кадры
+    mpORBextractorLeft->SetParameters(nFeatures, iniThFAST, minThFAST);
+    if(mSensor==System::STEREO || mSensor==System::IMU_STEREO)
+        mpORBextractorRight->SetParameters(nFeatures, iniThFAST, minThFAST);
+}
+
+""",
+    ),
+]
+
+EXTRACTOR_PATCHES = [
+    (
+        "SetParameters(int _nfeatures",
+        """
+    // Новый бюджет признаков и пороги FAST; пирамида масштабов не меняется
+    void SetParameters(int _nfeatures, int _iniThFAST, int _minThFAST);
+""",
+        """
+void ORBextractor::SetParameters(int _nfeatures, int _iniThFAST, int _minThFAST)
+{
+    nfeatures = _nfeatures;
+    iniThFAST = _iniThFAST;
+    minThFAST = _minThFAST;
+
+    // Распределение признаков по уровням — как в конструкторе
+    float factor = 1.0f / scaleFactor;
+    float nDesiredFeaturesPerScale = nfeatures*(1 - factor)/(1 - (float)pow((double)factor, (double)nlevels));
+
+    int sumFeatures = 0;
+    for( int level = 0; level < nlevels-1; level++ )
+    {
+        mnFeaturesPerLevel[level] = cvRound(nDesiredFeaturesPerScale);
+        sumFeatures += mnFeaturesPerLevel[level];
+        nDesiredFeaturesPerScale *= factor;
+    }
+    mnFeaturesPerLevel[nlevels-1] = std::max(nfeatures - sumFeatures, 0);
+}
+
+""",
+    ),
+]
+
+# (класс: файлы include/<класс>.h и src/<класс>.cc, строка, после которой
+# вставляются объявления, патчи)
+TARGETS = [
+    ("System", "void Shutdown();", SYSTEM_PATCHES),
+    ("Tracking", "void InformOnlyTracking(const bool &flag);", TRACKING_PATCHES),
+    ("ORBextractor", "~ORBextractor(){}", EXTRACTOR_PATCHES),
+]
+
+
+def patch_header(path: Path, anchor: str, patches) -> None:
+    content = path.read_text()
+    missing = "".join(declaration for marker, declaration, _ in patches if marker not in content)
+    if not missing:
+        return
+    position = content.find(anchor)
+    if position < 0:
+        raise SystemExit(f"{path}: '{anchor}' not found")
+    position = content.index("\n", position) + 1
+    path.write_text(content[:position] + missing + content[position:])
+
+
+def patch_source(path: Path, patches) -> None:
+    content = path.read_text()
+    for marker, _, definition in patches:
+        if marker in content:
+            continue
+        # Вставляем перед закрывающей скобкой namespace ORB_SLAM3
+        position = content.rfind("} //namespace ORB_SLAM")
+        if position < 0:
+            position = content.rstrip().rfind("}")
+        if position < 0:
+            raise SystemExit(f"{path}: namespace end not found")
+        content = content[:position] + definition + content[position:]
+    path.write_text(content)
+
+
+def main() -> None:
+    root = Path(sys.argv[1] if len(sys.argv) > 1 else "third_party/ORB_SLAM3")
+    for name, anchor, patches in TARGETS:
+        patch_header(root / "include" / f"{name}.h", anchor, patches)
+        patch_source(root / "src" / f"{name}.cc", patches)
+    markers = [f"{name}::{marker.split('(')[0]}" for name, _, patches in TARGETS for marker, _, _ in patches]
+    print(f"[INFO] Patched {root}: {', '.join(markers)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@
 #include <opencv2/highgui/highgui.hpp>
 #include <opencv2/imgproc.hpp>
 
+#include <cstring>
+#include <stdexcept>
 #include <set>
 
 #include "ORBSLAM3Wrapper.h"
@@ -25,7 +27,10 @@ ORBSLAM3Python::ORBSLAM3Python(std::string vocabFile, std::string settingsFile,
       settingsFile(settingsFile),
       sensorMode(sensorMode),
       system(nullptr),
-      bUseViewer(false)
+      bUseViewer(false),
+      mOrbFeatures(0),
+      mOrbIniThFAST(0),
+      mOrbMinThFAST(0)
 {
 }
 
@@ -35,7 +40,17 @@ ORBSLAM3Python::~ORBSLAM3Python()
 
 bool ORBSLAM3Python::initialize()
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     system = std::make_shared<ORB_SLAM3::System>(vocabluaryFile, settingsFile, sensorMode, bUseViewer);
+
+    // Экстракторы ORB-SLAM3 созданы по этим же ключам; запоминаем их как текущие значения
+    cv::FileStorage settings(settingsFile, cv::FileStorage::READ);
+    if (settings.isOpened())
+    {
+        mOrbFeatures = static_cast<int>(settings["ORBextractor.nFeatures"]);
+        mOrbIniThFAST = static_cast<int>(settings["ORBextractor.iniThFAST"]);
+        mOrbMinThFAST = static_cast<int>(settings["ORBextractor.minThFAST"]);
+    }
     return true;
 }
 
@@ -46,21 +61,71 @@ bool ORBSLAM3Python::isRunning()
 
 void ORBSLAM3Python::reset()
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     if (system)
     {
         system->Reset();
     }
 }
 
-bool ORBSLAM3Python::processMono(cv::Mat image, double timestamp)
+cv::Mat ORBSLAM3Python::toGray(const cv::Mat& image, ColorFormat format)
+{
+    if (format == COLOR_AUTO)
+    {
+        const int channels = image.channels();
+        format = channels == 1 ? COLOR_GRAY : channels == 4 ? COLOR_BGRA : COLOR_BGR;
+    }
+
+    switch (format)
+    {
+    case COLOR_GRAY:
+        return image;
+    case COLOR_I420:
+    case COLOR_NV12:
+    case COLOR_NV21:
+        // Первые H строк 4:2:0 — плоскость Y, это и есть серый кадр: view без копирования
+        if (image.channels() != 1 || image.rows % 3 != 0)
+            throw std::invalid_argument("YUV 4:2:0 frame must be a single-channel (H*3/2)xW array");
+        return image.rowRange(0, image.rows * 2 / 3);
+    default:
+        break;
+    }
+
+    // Буфер ещё держит ORB-SLAM3 (например, как изображение кадра) — не перезаписываем его
+    if (mGray.u && mGray.u->refcount > 1)
+        mGray.release();
+
+    // cvtColor пишет в mGray без новой аллокации, пока размер кадра не меняется
+    switch (format)
+    {
+    case COLOR_BGR:
+        cv::cvtColor(image, mGray, cv::COLOR_BGR2GRAY);
+        break;
+    case COLOR_RGB:
+        cv::cvtColor(image, mGray, cv::COLOR_RGB2GRAY);
+        break;
+    case COLOR_BGRA:
+        cv::cvtColor(image, mGray, cv::COLOR_BGRA2GRAY);
+        break;
+    case COLOR_YUYV:
+        cv::cvtColor(image, mGray, cv::COLOR_YUV2GRAY_YUY2);
+        break;
+    default:
+        throw std::invalid_argument("Unsupported color format");
+    }
+    return mGray;
+}
+
+bool ORBSLAM3Python::processMono(cv::Mat image, double timestamp, ColorFormat format)
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     if (!system)
     {
         return false;
     }
     if (image.data)
     {
-        Sophus::SE3f pose = system->TrackMonocular(image, timestamp);
+        Sophus::SE3f pose = system->TrackMonocular(toGray(image, format), timestamp);
         return !system->isLost();
     }
     else
@@ -71,6 +136,7 @@ bool ORBSLAM3Python::processMono(cv::Mat image, double timestamp)
 
 bool ORBSLAM3Python::processStereo(cv::Mat leftImage, cv::Mat rightImage, double timestamp)
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     if (!system)
     {
         std::cout << "you must call initialize() first!" << std::endl;
@@ -89,6 +155,7 @@ bool ORBSLAM3Python::processStereo(cv::Mat leftImage, cv::Mat rightImage, double
 
 bool ORBSLAM3Python::processRGBD(cv::Mat image, cv::Mat depthImage, double timestamp)
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     if (!system)
     {
         std::cout << "you must call initialize() first!" << std::endl;
@@ -107,6 +174,7 @@ bool ORBSLAM3Python::processRGBD(cv::Mat image, cv::Mat depthImage, double times
 
 void ORBSLAM3Python::shutdown()
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     if (system)
     {
         system->Shutdown();
@@ -120,6 +188,7 @@ void ORBSLAM3Python::setUseViewer(bool useViewer)
 
 std::vector<Eigen::Matrix4f> ORBSLAM3Python::getTrajectory() const
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     std::vector<Eigen::Matrix4f> safe;
     if (!system) return safe;
 
@@ -135,6 +204,7 @@ std::vector<Eigen::Matrix4f> ORBSLAM3Python::getTrajectory() const
 
 std::vector<Eigen::Vector3f> ORBSLAM3Python::getMapPoints() const
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     std::vector<Eigen::Vector3f> mapPoints;
     if (!system) return mapPoints;
 
@@ -155,6 +225,7 @@ std::vector<Eigen::Vector3f> ORBSLAM3Python::getMapPoints() const
 
 std::vector<Eigen::Vector3f> ORBSLAM3Python::getTrackedMapPoints() const
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     std::vector<Eigen::Vector3f> trackedPoints;
     if (!system) return trackedPoints;
 
@@ -175,6 +246,7 @@ std::vector<Eigen::Vector3f> ORBSLAM3Python::getTrackedMapPoints() const
 
 std::vector<Eigen::Vector2f> ORBSLAM3Python::getCurrentKeyPoints() const
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     std::vector<Eigen::Vector2f> keyPoints;
     if (!system) return keyPoints;
 
@@ -185,19 +257,17 @@ std::vector<Eigen::Vector2f> ORBSLAM3Python::getCurrentKeyPoints() const
         // Получаем ключевые точки текущего кадра (undistorted)
         std::vector<cv::KeyPoint> trackedKeyPoints = system->GetTrackedKeyPointsUn();
         
-        keyPoints.reserve(std::min(trackedKeyPoints.size(), size_t(200)));
+        // Все точки кадра: бюджет для клиентов выбирается в Python (lod_service.spatial_subsample)
+        keyPoints.reserve(trackedKeyPoints.size());
         
-        for (size_t i = 0; i < trackedKeyPoints.size() && i < 200; ++i)
+        for (const cv::KeyPoint& kp : trackedKeyPoints)
         {
-            const cv::KeyPoint& kp = trackedKeyPoints[i];
             if (kp.pt.x >= 0 && kp.pt.y >= 0) // Проверяем валидность координат
             {
                 keyPoints.push_back(Eigen::Vector2f(kp.pt.x, kp.pt.y));
             }
         }
-        
-        std::cout << "[DEBUG] getCurrentKeyPoints: Found " << keyPoints.size() << " valid keypoints" << std::endl;
-        
+
     } catch (const std::exception& e) {
         std::cerr << "Error in getCurrentKeyPoints: " << e.what() << std::endl;
         keyPoints.clear();
@@ -210,6 +280,7 @@ std::vector<Eigen::Vector2f> ORBSLAM3Python::getCurrentKeyPoints() const
 
 int ORBSLAM3Python::getNumMapPoints() const
 {
+    std::lock_guard<std::mutex> lock(mMutex);
     if (!system) return 0;
 
     auto vpMapPoints = system->GetTrackedMapPoints();
@@ -223,9 +294,171 @@ int ORBSLAM3Python::getNumMapPoints() const
     return count;
 }
 
+bool ORBSLAM3Python::saveAtlas(std::string filename)
+{
+    std::lock_guard<std::mutex> lock(mMutex);
+    if (!system) return false;
+
+    try {
+        // Атлас пишется в ./<filename>.osa; загрузка — через System.LoadAtlasFromFile в конфиге
+        return system->SaveAtlasToFile(filename);
+    } catch (const std::exception& e) {
+        std::cerr << "Error in saveAtlas: " << e.what() << std::endl;
+        return false;
+    } catch (...) {
+        return false;
+    }
+}
+
+void ORBSLAM3Python::activateLocalizationMode()
+{
+    std::lock_guard<std::mutex> lock(mMutex);
+    if (system)
+    {
+        // Только трекинг по загруженному атласу: локальное картирование останавливается
+        system->ActivateLocalizationMode();
+    }
+}
+
+void ORBSLAM3Python::deactivateLocalizationMode()
+{
+    std::lock_guard<std::mutex> lock(mMutex);
+    if (system)
+    {
+        system->DeactivateLocalizationMode();
+    }
+}
+
+long ORBSLAM3Python::getCurrentMapId() const
+{
+    std::lock_guard<std::mutex> lock(mMutex);
+    if (!system) return -1;
+    return static_cast<long>(system->GetCurrentMapId());
+}
+
+int ORBSLAM3Python::getNumMaps() const
+{
+    std::lock_guard<std::mutex> lock(mMutex);
+    if (!system) return 0;
+    return system->GetNumMaps();
+}
+
+void ORBSLAM3Python::setOrbParameters(int nFeatures, int iniThFAST, int minThFAST)
+{
+    if (nFeatures <= 0 || minThFAST <= 0 || iniThFAST < minThFAST)
+        throw std::invalid_argument("Expected nFeatures > 0 and iniThFAST >= minThFAST > 0");
+
+    // mMutex: трекинг не идёт, пока экстрактор перестраивает распределение по уровням
+    std::lock_guard<std::mutex> lock(mMutex);
+    if (!system)
+        throw std::runtime_error("you must call initialize() first!");
+    system->SetORBExtractorParameters(nFeatures, iniThFAST, minThFAST);
+    mOrbFeatures = nFeatures;
+    mOrbIniThFAST = iniThFAST;
+    mOrbMinThFAST = minThFAST;
+}
+
+std::map<std::string, int> ORBSLAM3Python::getOrbParameters() const
+{
+    std::lock_guard<std::mutex> lock(mMutex);
+    return {
+        {"n_features", mOrbFeatures},
+        {"ini_th_fast", mOrbIniThFAST},
+        {"min_th_fast", mOrbMinThFAST},
+    };
+}
+
+namespace
+{
+
+// Строки float32 фиксированной ширины (Vector3f, Vector2f) лежат в std::vector подряд
+static_assert(sizeof(Eigen::Vector3f) == 3 * sizeof(float), "Eigen::Vector3f must be unpadded");
+static_assert(sizeof(Eigen::Vector2f) == 2 * sizeof(float), "Eigen::Vector2f must be unpadded");
+
+// Проверяет буфер out: float32, C-contiguous, форма (M, inner...)
+py::array_t<float> checkOut(py::object out, const std::vector<py::ssize_t>& inner)
+{
+    if (!py::isinstance<py::array_t<float>>(out))
+        throw py::type_error("out must be a float32 numpy array");
+    py::array_t<float> array = py::reinterpret_borrow<py::array_t<float>>(out);
+    if (!(array.flags() & py::array::c_style) || !array.writeable())
+        throw py::value_error("out must be C-contiguous and writeable");
+    if (array.ndim() != static_cast<py::ssize_t>(inner.size()) + 1)
+        throw py::value_error("out has wrong number of dimensions");
+    for (size_t i = 0; i < inner.size(); ++i)
+        if (array.shape(i + 1) != inner[i])
+            throw py::value_error("out has wrong row shape");
+    return array;
+}
+
+// Первые rows строк out как view (массив держит ссылку на out)
+py::array_t<float> outView(py::array_t<float>& out, py::ssize_t rows, const std::vector<py::ssize_t>& inner)
+{
+    std::vector<py::ssize_t> shape{rows};
+    shape.insert(shape.end(), inner.begin(), inner.end());
+    std::vector<py::ssize_t> strides(out.strides(), out.strides() + out.ndim());
+    return py::array_t<float>(shape, strides, out.mutable_data(), out);
+}
+
+// Вектор точек -> ndarray (N, Cols) без копирования: массив владеет буфером вектора.
+// Если передан out подходящей ёмкости — копия в него и view на первые N строк,
+// иначе (out мал) — новый массив, который вызывающий может взять буфером на следующий кадр.
+template <typename Row, py::ssize_t Cols>
+py::array_t<float> rowsToArray(std::vector<Row>&& rows, py::object out)
+{
+    const py::ssize_t count = static_cast<py::ssize_t>(rows.size());
+    if (!out.is_none())
+    {
+        py::array_t<float> buffer = checkOut(out, {Cols});
+        if (buffer.shape(0) >= count)
+        {
+            if (count)
+                std::memcpy(buffer.mutable_data(), rows.data(), count * Cols * sizeof(float));
+            return outView(buffer, count, {Cols});
+        }
+    }
+
+    auto* owned = new std::vector<Row>(std::move(rows));
+    py::capsule free_when_done(owned, [](void* p) { delete static_cast<std::vector<Row>*>(p); });
+    return py::array_t<float>(
+        {count, Cols},
+        {static_cast<py::ssize_t>(Cols * sizeof(float)), static_cast<py::ssize_t>(sizeof(float))},
+        reinterpret_cast<float*>(owned->data()),
+        free_when_done);
+}
+
+// Позы (Eigen хранит по столбцам) -> ndarray (N, 4, 4) по строкам
+py::array_t<float> posesToArray(const std::vector<Eigen::Matrix4f>& poses, py::object out)
+{
+    const py::ssize_t count = static_cast<py::ssize_t>(poses.size());
+    bool reuse = false;
+    py::array_t<float> buffer;
+    if (!out.is_none())
+    {
+        buffer = checkOut(out, {4, 4});
+        reuse = buffer.shape(0) >= count;
+    }
+    py::array_t<float> result = reuse
+        ? outView(buffer, count, {4, 4})
+        : py::array_t<float>({count, py::ssize_t(4), py::ssize_t(4)});
+
+    float* data = result.mutable_data();
+    for (py::ssize_t i = 0; i < count; ++i)
+        Eigen::Map<Eigen::Matrix<float, 4, 4, Eigen::RowMajor>>(data + i * 16) = poses[i];
+    return result;
+}
+
+}  // namespace
+
 PYBIND11_MODULE(orbslam3, m)
 {
     NDArrayConverter::init_numpy();
+    m.doc() = "ORB-SLAM3 bindings. Native calls release the GIL; calls on one system are serialized, "
+              "separate systems track in parallel (see ORBSLAM3Wrapper.h for details).";
+    // Аргументы (в т.ч. numpy -> cv::Mat) конвертируются и результат возвращается под GIL,
+    // отпускается он только на время самого нативного вызова
+    using release_gil = py::call_guard<py::gil_scoped_release>;
+
     py::enum_<ORB_SLAM3::Tracking::eTrackingState>(m, "TrackingState")
         .value("SYSTEM_NOT_READY", ORB_SLAM3::Tracking::eTrackingState::SYSTEM_NOT_READY)
         .value("NO_IMAGES_YET", ORB_SLAM3::Tracking::eTrackingState::NO_IMAGES_YET)
@@ -243,19 +476,72 @@ PYBIND11_MODULE(orbslam3, m)
         .value("IMU_STEREO", ORB_SLAM3::System::eSensor::IMU_STEREO)
         .value("IMU_RGBD", ORB_SLAM3::System::eSensor::IMU_RGBD);
 
+    py::enum_<ORBSLAM3Python::ColorFormat>(m, "ColorFormat")
+        .value("AUTO", ORBSLAM3Python::COLOR_AUTO)
+        .value("GRAY", ORBSLAM3Python::COLOR_GRAY)
+        .value("BGR", ORBSLAM3Python::COLOR_BGR)
+        .value("RGB", ORBSLAM3Python::COLOR_RGB)
+        .value("BGRA", ORBSLAM3Python::COLOR_BGRA)
+        .value("I420", ORBSLAM3Python::COLOR_I420)
+        .value("NV12", ORBSLAM3Python::COLOR_NV12)
+        .value("NV21", ORBSLAM3Python::COLOR_NV21)
+        .value("YUYV", ORBSLAM3Python::COLOR_YUYV);
+
     py::class_<ORBSLAM3Python>(m, "system")
         .def(py::init<std::string, std::string, ORB_SLAM3::System::eSensor>(), py::arg("vocab_file"), py::arg("settings_file"), py::arg("sensor_type"))
-        .def("initialize", &ORBSLAM3Python::initialize)
-        .def("process_image_mono", &ORBSLAM3Python::processMono, py::arg("image"), py::arg("time_stamp"))
-        .def("process_image_stereo", &ORBSLAM3Python::processStereo, py::arg("left_image"), py::arg("right_image"), py::arg("time_stamp"))
-        .def("process_image_rgbd", &ORBSLAM3Python::processRGBD, py::arg("image"), py::arg("depth"), py::arg("time_stamp"))
-        .def("shutdown", &ORBSLAM3Python::shutdown)
+        .def("initialize", &ORBSLAM3Python::initialize, release_gil())
+        // Кадр любого из ColorFormat; C-contiguous массив оборачивается в cv::Mat без копирования,
+        // перевод в серый — внутри, в переиспользуемый буфер
+        .def("process_image_mono", &ORBSLAM3Python::processMono, release_gil(), py::arg("image"), py::arg("time_stamp"),
+             py::arg("color") = ORBSLAM3Python::COLOR_AUTO)
+        .def("process_image_stereo", &ORBSLAM3Python::processStereo, release_gil(), py::arg("left_image"), py::arg("right_image"), py::arg("time_stamp"))
+        .def("process_image_rgbd", &ORBSLAM3Python::processRGBD, release_gil(), py::arg("image"), py::arg("depth"), py::arg("time_stamp"))
+        .def("shutdown", &ORBSLAM3Python::shutdown, release_gil())
         .def("is_running", &ORBSLAM3Python::isRunning)
-        .def("reset", &ORBSLAM3Python::reset)
+        .def("reset", &ORBSLAM3Python::reset, release_gil())
         .def("set_use_viewer", &ORBSLAM3Python::setUseViewer)
-        .def("get_trajectory", &ORBSLAM3Python::getTrajectory)
-        .def("get_map_points", &ORBSLAM3Python::getMapPoints, "Get all 3D map points from the current map")
-        .def("get_tracked_map_points", &ORBSLAM3Python::getTrackedMapPoints,"Get 3D map points tracked in the last frame")
-        .def("get_current_keypoints", &ORBSLAM3Python::getCurrentKeyPoints,"Get 2D pixel coordinates of current frame keypoints")
-        .def("get_num_map_points", &ORBSLAM3Python::getNumMapPoints,"Get the number of map points in the current map");
+        // Геттеры возвращают непрерывные float32 ndarray; out — необязательный буфер,
+        // переиспользуемый между кадрами (результат — view на его первые N строк)
+        .def("get_trajectory", [](const ORBSLAM3Python& self, py::object out) {
+                std::vector<Eigen::Matrix4f> poses;
+                {
+                    py::gil_scoped_release release;
+                    poses = self.getTrajectory();
+                }
+                return posesToArray(poses, out);
+            }, py::arg("out") = py::none(), "Get camera poses as an (N, 4, 4) float32 array")
+        .def("get_map_points", [](const ORBSLAM3Python& self, py::object out) {
+                std::vector<Eigen::Vector3f> points;
+                {
+                    py::gil_scoped_release release;
+                    points = self.getMapPoints();
+                }
+                return rowsToArray<Eigen::Vector3f, 3>(std::move(points), out);
+            }, py::arg("out") = py::none(), "Get all 3D map points from the current map as an (N, 3) float32 array")
+        .def("get_tracked_map_points", [](const ORBSLAM3Python& self, py::object out) {
+                std::vector<Eigen::Vector3f> points;
+                {
+                    py::gil_scoped_release release;
+                    points = self.getTrackedMapPoints();
+                }
+                return rowsToArray<Eigen::Vector3f, 3>(std::move(points), out);
+            }, py::arg("out") = py::none(), "Get 3D map points tracked in the last frame as an (N, 3) float32 array")
+        .def("get_current_keypoints", [](const ORBSLAM3Python& self, py::object out) {
+                std::vector<Eigen::Vector2f> keyPoints;
+                {
+                    py::gil_scoped_release release;
+                    keyPoints = self.getCurrentKeyPoints();
+                }
+                return rowsToArray<Eigen::Vector2f, 2>(std::move(keyPoints), out);
+            }, py::arg("out") = py::none(), "Get 2D pixel coordinates of current frame keypoints as an (N, 2) float32 array")
+        .def("get_num_map_points", &ORBSLAM3Python::getNumMapPoints, release_gil(),"Get the number of map points in the current map")
+        .def("save_atlas", &ORBSLAM3Python::saveAtlas, release_gil(), py::arg("filename"), "Save the atlas to <filename>.osa without stopping the system")
+        .def("activate_localization_mode", &ORBSLAM3Python::activateLocalizationMode, release_gil(), "Track against the loaded atlas without mapping")
+        .def("deactivate_localization_mode", &ORBSLAM3Python::deactivateLocalizationMode, release_gil(), "Resume local mapping")
+        .def("get_current_map_id", &ORBSLAM3Python::getCurrentMapId, release_gil(), "Get the id of the active map in the atlas")
+        .def("get_num_maps", &ORBSLAM3Python::getNumMaps, release_gil(), "Get the number of maps in the atlas")
+        .def("set_orb_parameters", &ORBSLAM3Python::setOrbParameters, release_gil(), py::arg("n_features"),
+             py::arg("ini_th_fast"), py::arg("min_th_fast"), "Change the tracking ORB feature budget and FAST thresholds from the next frame")
+        .def("get_orb_parameters", &ORBSLAM3Python::getOrbParameters, release_gil(),
+             "Get the current ORB extractor parameters as {'n_features', 'ini_th_fast', 'min_th_fast'}");
 }
\ No newline at end of file